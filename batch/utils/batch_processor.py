@@ -1,8 +1,10 @@
 import os
+import re
 import gc
 from batch.utils.settings_check import check_settings
 from batch.utils.video_processor import process_video
-from core.utils.config_utils import load_key, update_key
+from core.utils.config_utils import job_config
+from core.utils.gpt_cache import GPT_CACHE
 import pandas as pd
 from rich.console import Console
 from rich.panel import Panel
@@ -11,16 +13,24 @@ import shutil
 
 console = Console()
 
-def record_and_update_config(source_language, target_language):
-    original_source_lang = load_key('whisper.language')
-    original_target_lang = load_key('target_language')
-    
+def parse_target_languages(target_language):
+    """'German; 日本語' -> ['German', '日本語']; the first one is the main language (subtitled video, dubbing)
+
+    Only `;` and newlines separate languages: a natural-language description may itself contain commas.
+    """
+    if not target_language or pd.isna(target_language):
+        return []
+    languages = [lang.strip() for lang in re.split(r'[;；\n]', str(target_language))]
+    return list(dict.fromkeys(lang for lang in languages if lang))
+
+def build_job_overrides(source_language, target_language):
+    """Per-task config overrides, applied through job_config instead of rewriting config.yaml"""
+    overrides = {}
     if source_language and not pd.isna(source_language):
-        update_key('whisper.language', source_language)
+        overrides['whisper.language'] = source_language
     if target_language and not pd.isna(target_language):
-        update_key('target_language', target_language)
-    
-    return original_source_lang, original_target_lang
+        overrides['target_language'] = target_language
+    return overrides
 
 def process_batch():
     if not check_settings():
@@ -42,6 +52,7 @@ def process_batch():
                 if os.path.exists(error_folder):
                     # Ensure the output folder exists
                     os.makedirs('output', exist_ok=True)
+                    GPT_CACHE.close_all()
                     
                     # Copy all contents from ERROR folder for the specific video to output
                     for item in os.listdir(error_folder):
@@ -65,22 +76,22 @@ def process_batch():
                                  title="[bold blue]Current Task", expand=False))
             
             source_language = row['Source Language']
-            target_language = row['Target Language']
+            target_languages = parse_target_languages(row['Target Language'])
+            target_language = target_languages[0] if target_languages else None
             
-            original_source_lang, original_target_lang = record_and_update_config(source_language, target_language)
+            overrides = build_job_overrides(source_language, target_language)
             
             try:
                 dubbing = 0 if pd.isna(row['Dubbing']) else int(row['Dubbing'])
                 is_retry = not pd.isna(row['Status']) and 'Error' in str(row['Status'])
-                status, error_step, error_message = process_video(video_file, dubbing, is_retry)
+                # language switches and detected_language stay inside this job's overlay
+                with job_config(overrides):
+                    status, error_step, error_message = process_video(video_file, dubbing, is_retry, target_languages[1:])
                 status_msg = "Done" if status else f"Error: {error_step} - {error_message}"
             except Exception as e:
                 status_msg = f"Error: Unhandled exception - {str(e)}"
                 console.print(f"[bold red]Error processing {video_file}: {status_msg}")
             finally:
-                update_key('whisper.language', original_source_lang)
-                update_key('target_language', original_target_lang)
-                
                 df.at[index, 'Status'] = status_msg
                 df.to_excel('batch/tasks_setting.xlsx', index=False)
                 
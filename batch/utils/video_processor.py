@@ -1,7 +1,10 @@
 import os
+import re
 from core.st_utils.imports_and_utils import *
 from core.utils.onekeycleanup import cleanup
-from core.utils import load_key
+from core.utils import load_key, job_config, job_path, ContextThreadPoolExecutor
+from core.utils.gpt_cache import GPT_CACHE
+from core.utils.llm_stats import LLM_STATS
 import shutil
 from functools import partial
 from rich.panel import Panel
@@ -16,16 +19,26 @@ SAVE_DIR = 'batch/output'
 ERROR_OUTPUT_DIR = 'batch/output/ERROR'
 YTB_RESOLUTION_KEY = "ytb_resolution"
 
-def process_video(file, dubbing=False, is_retry=False):
+def process_video(file, dubbing=False, is_retry=False, extra_languages=()):
+    """`extra_languages`: more target languages translated from the same ASR/split output into `output/<language>/`"""
+    LLM_STATS.reset()
     if not is_retry:
         prepare_output_folder(OUTPUT_DIR)
     
+    if extra_languages:
+        translate_steps = [
+            (f"🌐 Translating into {len(extra_languages) + 1} languages", partial(fan_out_languages, extra_languages)),
+        ]
+    else:
+        translate_steps = [
+            ("📝 Summarizing and translating", summarize_and_translate),
+            ("⚡ Processing and aligning subtitles", process_and_align_subtitles),
+        ]
     text_steps = [
         ("🎥 Processing input file", partial(process_input_file, file)),
         ("🎙️ Transcribing with Whisper", partial(_2_asr.transcribe)),
         ("✂️ Splitting sentences", split_sentences),
-        ("📝 Summarizing and translating", summarize_and_translate),
-        ("⚡ Processing and aligning subtitles", process_and_align_subtitles),
+        *translate_steps,
         ("🎬 Merging subtitles to video", _7_sub_into_vid.merge_subtitles_to_video),
     ]
     
@@ -73,6 +86,7 @@ def process_video(file, dubbing=False, is_retry=False):
 
 def prepare_output_folder(output_folder):
     if os.path.exists(output_folder):
+        GPT_CACHE.close_all()
         shutil.rmtree(output_folder)
     os.makedirs(output_folder)
 
@@ -99,6 +113,42 @@ def process_and_align_subtitles():
     _5_split_sub.split_for_sub_main()
     _6_gen_sub.align_timestamp_main()
 
+def language_namespace(language):
+    """Folder name under `output/` for an extra target language"""
+    return re.sub(r'[\\/:*?"<>|\s]+', '_', str(language).strip()).strip('_.') or 'lang'
+
+def translate_language(namespace=''):
+    """Steps 4-6 for the current target language; extra languages write into `output/<namespace>/`"""
+    with job_config({'output_namespace': namespace} if namespace else None):
+        os.makedirs(job_path(os.path.join(OUTPUT_DIR, 'log')), exist_ok=True)
+        summarize_and_translate()
+        process_and_align_subtitles()
+
+def fan_out_languages(extra_languages):
+    """Run steps 4-6 for the main target language and every extra language concurrently.
+
+    ASR, NLP split and meaning split (steps 1-3) are shared. The main language keeps the
+    usual `output/` layout, so subtitle merging and dubbing work on it unchanged.
+    """
+    jobs = {'': None}
+    for language in extra_languages:
+        jobs[language_namespace(language)] = language
+    failed = []
+    with ContextThreadPoolExecutor(max_workers=len(jobs)) as executor:
+        futures = {}
+        for namespace, language in jobs.items():
+            overrides = {'target_language': language} if language else None
+            with job_config(overrides):
+                futures[namespace or load_key("target_language")] = executor.submit(translate_language, namespace)
+        for name, future in futures.items():
+            try:
+                future.result()
+            except Exception as e:
+                console.print(f"[bold red]❌ {name}: {e}[/bold red]")
+                failed.append(name)
+    if failed:
+        raise Exception(f"Translation failed for: {', '.join(failed)}")
+
 def gen_audio_tasks():
     _8_1_audio_task.gen_audio_task_main()
     _8_2_dub_chunks.gen_dub_chunks()
@@ -8,10 +8,11 @@ import pandas as pd
 from pydub import AudioSegment
 from rich.console import Console
 from rich.progress import Progress
-from concurrent.futures import ThreadPoolExecutor, as_completed
+from concurrent.futures import as_completed
 
 from core.utils import *
 from core.utils.models import *
+from core.utils.subtitle_timeline import parse_times
 from core.asr_backend.audio_preprocess import get_audio_duration
 from core.tts_backend.tts_main import tts_main
 
@@ -21,12 +22,6 @@ TEMP_FILE_TEMPLATE = f"{_AUDIO_TMP_DIR}/{{}}_temp.wav"
 OUTPUT_FILE_TEMPLATE = f"{_AUDIO_SEGS_DIR}/{{}}.wav"
 WARMUP_SIZE = 5
 
-def parse_df_srt_time(time_str: str) -> float:
-    """Convert SRT time format to seconds"""
-    hours, minutes, seconds = time_str.strip().split(':')
-    seconds, milliseconds = seconds.split('.')
-    return int(hours) * 3600 + int(minutes) * 60 + int(seconds) + int(milliseconds) / 1000
-
 def adjust_audio_speed(input_file: str, output_file: str, speed_factor: float) -> None:
     """Adjust audio speed and handle edge cases"""
     # If the speed factor is close to 1, directly copy the file
@@ -97,7 +92,7 @@ def generate_tts_audio(tasks_df: pd.DataFrame) -> pd.DataFrame:
         # parallel processing for remaining tasks
         if len(tasks_df) > warmup_size:
             remaining_tasks = tasks_df.iloc[warmup_size:].copy()
-            with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            with ContextThreadPoolExecutor(max_workers=max_workers) as executor:
                 futures = [
                     executor.submit(process_row, row, tasks_df.copy())
                     for _, row in remaining_tasks.iterrows()
@@ -146,6 +141,8 @@ def merge_chunks(tasks_df: pd.DataFrame) -> pd.DataFrame:
     chunk_start = 0
     
     tasks_df['new_sub_times'] = None
+    starts = parse_times(tasks_df['start_time'].astype(str).tolist())
+    ends = parse_times(tasks_df['end_time'].astype(str).tolist())
     
     for index, row in tasks_df.iterrows():
         if row['cut_off'] == 1:
@@ -153,8 +150,8 @@ def merge_chunks(tasks_df: pd.DataFrame) -> pd.DataFrame:
             speed_factor, keep_gaps = process_chunk(chunk_df, accept, min_speed)
             
             # 🎯 Step1: Start processing new timeline
-            chunk_start_time = parse_df_srt_time(chunk_df.iloc[0]['start_time'])
-            chunk_end_time = parse_df_srt_time(chunk_df.iloc[-1]['end_time']) + chunk_df.iloc[-1]['tolerance'] # 加上tolerance才是这一块的结束
+            chunk_start_time = float(starts[chunk_start])
+            chunk_end_time = float(ends[index]) + chunk_df.iloc[-1]['tolerance'] # 加上tolerance才是这一块的结束
             cur_time = chunk_start_time
             for i, row in chunk_df.iterrows():
                 # If i is not 0, which is not the first row of the chunk, cur_time needs to be added with the gap of the previous row, remember to divide by speed_factor
@@ -206,6 +203,7 @@ def merge_chunks(tasks_df: pd.DataFrame) -> pd.DataFrame:
     rprint("[bold green]✅ Audio chunks processing completed![/bold green]")
     return tasks_df
 
+@llm_stage("10_gen_audio")
 def gen_audio() -> None:
     """Main function: Generate audio and process timeline"""
     rprint("[bold magenta]🚀 Starting audio generation process...[/bold magenta]")
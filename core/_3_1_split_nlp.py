@@ -1,6 +1,7 @@
 from core.spacy_utils import *
-from core.utils.models import _3_1_SPLIT_BY_NLP
-from core.utils import check_file_exists
+from core.utils.models import _3_1_SPLIT_BY_NLP, _3_1_SPANS
+from core.utils import check_file_exists, rprint
+from core.utils.word_spans import load_word_index, track_spans, save_spans
 
 @check_file_exists(_3_1_SPLIT_BY_NLP)
 def split_by_spacy():
@@ -9,7 +10,17 @@ def split_by_spacy():
     split_by_comma_main(nlp)
     split_sentences_main(nlp)
     split_long_by_root_main(nlp)
+    save_nlp_spans()
     return
 
+def save_nlp_spans():
+    """Word span of every line: the spaCy splits only cut lines, never change the text,
+    so consuming the transcript in order gives each line exactly the words it came from"""
+    with open(_3_1_SPLIT_BY_NLP, 'r', encoding='utf-8') as f:
+        lines = [line.strip() for line in f.readlines()]
+    spans = track_spans(lines, load_word_index())
+    save_spans(_3_1_SPANS, lines, spans)
+    rprint(f"[green]🧷 Word spans found for {sum(s is not None for s in spans)}/{len(lines)} lines[/green]")
+
 if __name__ == '__main__':
     split_by_spacy()
\ No newline at end of file
@@ -1,12 +1,14 @@
-import concurrent.futures
 import math
 import json
+import asyncio
 from rich.console import Console
 from rich.table import Table
 from core.prompts import get_split_prompt
 from core.spacy_utils.load_nlp_model import init_nlp
 from core.utils import *
-from core.utils.models import _3_1_SPLIT_BY_NLP, _3_2_SPLIT_BY_MEANING
+from core.utils.models import _3_1_SPLIT_BY_NLP, _3_2_SPLIT_BY_MEANING, _3_1_SPANS, _3_2_SPANS
+from core.utils.scheduling import longest_first
+from core.utils.word_spans import load_word_index, load_spans, track_spans, regroup_spans, save_spans
 
 console = Console()
 
@@ -14,32 +16,19 @@ def tokenize_sentence(sentence, nlp):
     doc = nlp(sentence)
     return [token.text for token in doc]
 
-def split_sentence(sentence, num_parts, word_limit=20, index=-1, retry_attempt=0):
-    """
-    Split a long sentence using GPT and return the result as a string joined by newline.
-    Now optimized to expect a JSON list directly from LLM.
-    """
-    split_prompt = get_split_prompt(sentence, num_parts, word_limit)
-    
-    def valid_split(response_data):
-        if "split" not in response_data:
-            return {"status": "error", "message": "Missing required key: `split`"}
-        if not isinstance(response_data["split"], list):
-            return {"status": "error", "message": "Key `split` must be a list"}
-        if len(response_data["split"]) < 2:
-             # 如果模型认为不需要切分，返回列表长度为1，这其实不算错误，但我们需要确认行为
-             # 这里我们允许，后续逻辑会处理
-             return {"status": "success", "message": "Split list valid"}
-        return {"status": "success", "message": "Split completed"}
-    
-    # 调用 LLM
-    response_data = ask_gpt(
-        split_prompt + " " * retry_attempt, 
-        resp_type='json', 
-        valid_def=valid_split, 
-        log_title='split_by_meaning'
-    )
-    
+def valid_split(response_data):
+    if "split" not in response_data:
+        return {"status": "error", "message": "Missing required key: `split`"}
+    if not isinstance(response_data["split"], list):
+        return {"status": "error", "message": "Key `split` must be a list"}
+    if len(response_data["split"]) < 2:
+         # 如果模型认为不需要切分，返回列表长度为1，这其实不算错误，但我们需要确认行为
+         # 这里我们允许，后续逻辑会处理
+         return {"status": "success", "message": "Split list valid"}
+    return {"status": "success", "message": "Split completed"}
+
+def finish_split(sentence, response_data, index=-1):
+    """Join the LLM parts with newlines, warn on lost text and print the result"""
     # 直接获取分割好的列表
     split_parts = response_data["split"]
     
@@ -67,23 +56,55 @@ def split_sentence(sentence, num_parts, word_limit=20, index=-1, retry_attempt=0
     
     return best_split
 
+def split_sentence(sentence, num_parts, word_limit=20, index=-1, retry_attempt=0):
+    """
+    Split a long sentence using GPT and return the result as a string joined by newline.
+    Now optimized to expect a JSON list directly from LLM.
+    """
+    split_prompt = get_split_prompt(sentence, num_parts, word_limit)
+    
+    # 调用 LLM
+    response_data = ask_gpt(
+        split_prompt + " " * retry_attempt, 
+        resp_type='json', 
+        valid_def=valid_split, 
+        log_title='split_by_meaning'
+    )
+    return finish_split(sentence, response_data, index)
+
+async def split_sentence_async(sentence, num_parts, word_limit=20, index=-1, retry_attempt=0):
+    """split_sentence for the async engine"""
+    split_prompt = get_split_prompt(sentence, num_parts, word_limit)
+    response_data = await ask_gpt_async(
+        split_prompt + " " * retry_attempt,
+        resp_type='json',
+        valid_def=valid_split,
+        log_title='split_by_meaning'
+    )
+    return finish_split(sentence, response_data, index)
+
 def parallel_split_sentences(sentences, max_length, max_workers, nlp, retry_attempt=0):
-    """Split sentences in parallel using a thread pool."""
+    """Split sentences in parallel using a thread pool, returns the parts of each sentence"""
     new_sentences = [None] * len(sentences)
     futures = []
+    jobs = []
 
-    with concurrent.futures.ThreadPoolExecutor(max_workers=max_workers) as executor:
-        for index, sentence in enumerate(sentences):
-            # Use tokenizer to split the sentence
-            tokens = tokenize_sentence(sentence, nlp)
-            
-            # Decide if splitting is needed
-            if len(tokens) > max_length:
-                num_parts = math.ceil(len(tokens) / max_length)
-                future = executor.submit(split_sentence, sentence, num_parts, max_length, index=index, retry_attempt=retry_attempt)
-                futures.append((future, index, num_parts, sentence))
-            else:
-                new_sentences[index] = [sentence]
+    for index, sentence in enumerate(sentences):
+        # Use tokenizer to split the sentence
+        tokens = tokenize_sentence(sentence, nlp)
+        
+        # Decide if splitting is needed
+        if len(tokens) > max_length:
+            jobs.append((index, sentence, len(tokens)))
+        else:
+            new_sentences[index] = [sentence]
+
+    with ContextThreadPoolExecutor(max_workers=max_workers) as executor:
+        # longest sentences first, a long one submitted last would set the stage's makespan
+        for index, sentence, n_tokens in longest_first(jobs, cost=lambda job: job[2]):
+            num_parts = math.ceil(n_tokens / max_length)
+            future = executor.submit(split_sentence, sentence, num_parts, max_length, index=index, retry_attempt=retry_attempt)
+            futures.append((future, index, num_parts, sentence))
 
         for future, index, num_parts, sentence in futures:
             try:
@@ -97,30 +118,71 @@ def parallel_split_sentences(sentences, max_length, max_workers, nlp, retry_atte
                 console.print(f"[red]Error processing sentence {index}: {e}[/red]")
                 new_sentences[index] = [sentence]
 
-    # Flatten the list
-    return [sentence for sublist in new_sentences for sentence in sublist]
+    return new_sentences
+
+async def split_sentences_async(sentences, max_length, nlp, retry_attempt=0):
+    """parallel_split_sentences on the async engine: every long sentence is in flight at once"""
+    new_sentences = [[sentence] for sentence in sentences]
+    long_ones = []
+    for index, sentence in enumerate(sentences):
+        tokens = tokenize_sentence(sentence, nlp)
+        if len(tokens) > max_length:
+            long_ones.append((index, sentence, len(tokens)))
+    # coroutines reach the limiter in creation order, so create the longest first
+    jobs = []
+    for index, sentence, n_tokens in longest_first(long_ones, cost=lambda job: job[2]):
+        num_parts = math.ceil(n_tokens / max_length)
+        jobs.append((index, split_sentence_async(sentence, num_parts, max_length, index=index, retry_attempt=retry_attempt)))
+
+    results = await asyncio.gather(*[coro for _, coro in jobs], return_exceptions=True)
+    for (index, _), split_result in zip(jobs, results):
+        if isinstance(split_result, Exception):
+            console.print(f"[red]Error processing sentence {index}: {split_result}[/red]")
+        elif split_result:
+            new_sentences[index] = [line.strip() for line in split_result.strip().split('\n')]
+
+    return new_sentences
 
 @check_file_exists(_3_2_SPLIT_BY_MEANING)
+@llm_stage("3_2_split_meaning")
 def split_sentences_by_meaning():
     """The main function to split sentences by meaning."""
     # read input sentences
     with open(_3_1_SPLIT_BY_NLP, 'r', encoding='utf-8') as f:
         sentences = [line.strip() for line in f.readlines()]
 
+    # word spans from the spaCy stage (tracked here for outputs of older runs)
+    word_index = load_word_index()
+    spans = load_spans(_3_1_SPANS, sentences)
+    if all(span is None for span in spans):
+        spans = track_spans(sentences, word_index)
+
     nlp = init_nlp()
     # 🔄 process sentences multiple times to ensure all are split
     for retry_attempt in range(3):
-        sentences = parallel_split_sentences(
-            sentences, 
-            max_length=load_key("max_split_length"), 
-            max_workers=load_key("max_workers"), 
-            nlp=nlp, 
-            retry_attempt=retry_attempt
-        )
+        if use_async_engine():
+            groups = run_async(split_sentences_async(
+                sentences,
+                max_length=load_key("max_split_length"),
+                nlp=nlp,
+                retry_attempt=retry_attempt
+            ))
+        else:
+            groups = parallel_split_sentences(
+                sentences, 
+                max_length=load_key("max_split_length"), 
+                max_workers=load_key("max_workers"), 
+                nlp=nlp, 
+                retry_attempt=retry_attempt
+            )
+        # each part gets its share of the parent's words
+        spans = regroup_spans(word_index, groups, spans)
+        sentences = [sentence for group in groups for sentence in group]
 
     # 💾 save results
     with open(_3_2_SPLIT_BY_MEANING, 'w', encoding='utf-8') as f:
         f.write('\n'.join(sentences))
+    save_spans(_3_2_SPANS, sentences, spans)
     console.print('[green]✅ All sentences have been successfully split![/green]')
 
 if __name__ == '__main__':
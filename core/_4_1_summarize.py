@@ -1,5 +1,5 @@
 import json
-from core.prompts import get_summary_prompt
+from core.prompts import get_summary_prompt, get_terminology_matcher
 import pandas as pd
 from core.utils import *
 from core.utils.models import _3_2_SPLIT_BY_MEANING, _4_1_TERMINOLOGY
@@ -14,24 +14,79 @@ def combine_chunks():
     combined_text = ' '.join(cleaned_sentences)
     return combined_text[:load_key('summary_length')]  #! Return only the first x characters
 
+def shard_sentences(window_chars):
+    """Cut the whole split-by-meaning text into windows of about `window_chars` characters"""
+    with open(_3_2_SPLIT_BY_MEANING, 'r', encoding='utf-8') as file:
+        sentences = [line.strip() for line in file if line.strip()]
+    shards, current, size = [], [], 0
+    for sentence in sentences:
+        if current and size + len(sentence) + 1 > window_chars:
+            shards.append(' '.join(current))
+            current, size = [], 0
+        current.append(sentence)
+        size += len(sentence) + 1
+    if current:
+        shards.append(' '.join(current))
+    return shards
+
+def merge_summaries(summaries):
+    """Reduce step (no LLM): theme of the opening shard, terms deduplicated by source, majority translation wins"""
+    votes, order = {}, []
+    for summary in summaries:
+        for term in summary.get('terms', []):
+            key = str(term['src']).strip().casefold()
+            if key not in votes:
+                votes[key] = {}
+                order.append(key)
+            tgt = str(term['tgt']).strip()
+            entry = votes[key].setdefault(tgt, {"count": 0, "term": term})
+            entry["count"] += 1
+    terms = []
+    for key in order:
+        # ties keep the earliest translation (dicts preserve insertion order)
+        best = max(votes[key].values(), key=lambda e: e["count"])
+        terms.append(best["term"])
+    theme = next((s.get('theme') for s in summaries if s.get('theme')), '')
+    return {"theme": theme, "terms": terms}
+
+def map_reduce_summary(custom_terms_json, valid_summary):
+    """Summarize every window of the transcript concurrently, then merge.
+
+    Translation still waits for the full merge: a chunk translated against a partial term list
+    gets a different terms fingerprint in the journal and would be re-translated anyway.
+    """
+    shards = shard_sentences(load_key('summary_length'))
+    rprint(f"📝 Summarizing {len(shards)} shards in parallel ...")
+    with ContextThreadPoolExecutor(max_workers=load_key("max_workers")) as executor:
+        futures = [
+            executor.submit(ask_gpt, get_summary_prompt(shard, custom_terms_json), resp_type='json',
+                            valid_def=valid_summary, log_title=f'summary_{i}')
+            for i, shard in enumerate(shards)
+        ]
+        return merge_summaries([future.result() for future in futures])
+
+def save_terminology(summary, custom_terms_json):
+    summary = dict(summary, terms=list(summary['terms']) + custom_terms_json['terms'])
+    with open(job_path(_4_1_TERMINOLOGY), 'w', encoding='utf-8') as f:
+        json.dump(summary, f, ensure_ascii=False, indent=4)
+
 def search_things_to_note_in_prompt(sentence):
     """Search for terms to note in the given sentence"""
-    with open(_4_1_TERMINOLOGY, 'r', encoding='utf-8') as file:
-        things_to_note = json.load(file)
-    things_to_note_list = [term['src'] for term in things_to_note['terms'] if term['src'].lower() in sentence.lower()]
+    # compiled once per terminology.json version, one pass over the sentence
+    matcher = get_terminology_matcher()
+    things_to_note_list = matcher.find(sentence) if matcher else []
     if things_to_note_list:
         prompt = '\n'.join(
             f'{i+1}. "{term["src"]}": "{term["tgt"]}",'
             f' meaning: {term["note"]}'
-            for i, term in enumerate(things_to_note['terms'])
-            if term['src'] in things_to_note_list
+            for i, term in enumerate(things_to_note_list)
         )
         return prompt
     else:
         return None
 
+@llm_stage("4_1_summarize")
 def get_summary():
-    src_content = combine_chunks()
     custom_terms = pd.read_excel(CUSTOM_TERMS_PATH)
     custom_terms_json = {
         "terms": 
@@ -47,8 +102,6 @@ def get_summary():
     if len(custom_terms) > 0:
         rprint(f"📖 Custom Terms Loaded: {len(custom_terms)} terms")
         rprint("📝 Terms Content:", json.dumps(custom_terms_json, indent=2, ensure_ascii=False))
-    summary_prompt = get_summary_prompt(src_content, custom_terms_json)
-    rprint("📝 Summarizing and extracting terminology ...")
     
     def valid_summary(response_data):
         required_keys = {'src', 'tgt', 'note'}
@@ -59,13 +112,15 @@ def get_summary():
                 return {"status": "error", "message": "Invalid response format"}   
         return {"status": "success", "message": "Summary completed"}
 
-    summary = ask_gpt(summary_prompt, resp_type='json', valid_def=valid_summary, log_title='summary')
-    summary['terms'].extend(custom_terms_json['terms'])
-    
-    with open(_4_1_TERMINOLOGY, 'w', encoding='utf-8') as f:
-        json.dump(summary, f, ensure_ascii=False, indent=4)
+    if load_key("summary_map_reduce", default=False):
+        summary = map_reduce_summary(custom_terms_json, valid_summary)
+    else:
+        summary_prompt = get_summary_prompt(combine_chunks(), custom_terms_json)
+        rprint("📝 Summarizing and extracting terminology ...")
+        summary = ask_gpt(summary_prompt, resp_type='json', valid_def=valid_summary, log_title='summary')
+    save_terminology(summary, custom_terms_json)
 
-    rprint(f'💾 Summary log saved to → `{_4_1_TERMINOLOGY}`')
+    rprint(f'💾 Summary log saved to → `{job_path(_4_1_TERMINOLOGY)}`')
 
 if __name__ == '__main__':
     get_summary()
\ No newline at end of file
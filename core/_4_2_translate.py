@@ -1,14 +1,23 @@
+import math
 import pandas as pd
+import asyncio
 import concurrent.futures
 from rich.console import Console
 from rich.progress import Progress, SpinnerColumn, TextColumn
 
 # 1. 导入核心翻译引擎
-from core.translate_lines import translate_batch_lines
+from core.translate_lines import translate_batch_lines, translate_batch_lines_async
 # 2. 导入必要的常量
-from core.utils.models import _3_2_SPLIT_BY_MEANING, _4_2_TRANSLATION, _2_CLEANED_CHUNKS
+from core.utils.models import _3_2_SPLIT_BY_MEANING, _3_2_SPANS, _4_2_TRANSLATION, _4_2_JOURNAL, _2_CLEANED_CHUNKS
 # 3. 导入工具函数
-from core.utils import load_key, check_file_exists
+from core.utils import load_key, job_path, check_file_exists, ContextThreadPoolExecutor, run_async, use_async_engine, llm_stage
+from core.utils.chunk_planner import ChunkPlanner
+from core.utils.llm_stats import LLM_STATS
+from core.utils.translation_memory import get_translation_memory, normalize_line
+from core.utils.translation_journal import TranslationJournal, terms_fingerprint
+from core.utils.line_classifier import classify_line
+from core.utils.word_spans import load_spans
+from core.prompts import get_batch_translation_prompt, get_terminology_matcher
 from core._8_1_audio_task import check_len_then_trim
 from core._6_gen_sub import align_timestamp
 
@@ -23,87 +32,278 @@ except ImportError:
 console = Console()
 
 # ==============================================================================
-# 1. 切分逻辑
+# 1. 切分逻辑 (按 token 预算动态切分，见 ChunkPlanner)
 # ==============================================================================
-def split_chunks_by_chars(chunk_size, max_i): 
-    """根据字符数限制将文本切分为 chunks"""
+def load_sentences():
     with open(_3_2_SPLIT_BY_MEANING, "r", encoding="utf-8") as file:
-        sentences = file.read().strip().split('\n')
-
-    chunks = []
-    chunk = ''
-    sentence_count = 0
-    for sentence in sentences:
-        if len(chunk) + len(sentence + '\n') > chunk_size or sentence_count == max_i:
-            if chunk:
-                chunks.append(chunk.strip())
-            chunk = sentence + '\n'
-            sentence_count = 1
-        else:
-            chunk += sentence + '\n'
-            sentence_count += 1
-            
-    if chunk:
-        chunks.append(chunk.strip())
-    return chunks
+        return file.read().strip().split('\n')
 
 # ==============================================================================
 # 2. Context Helper (上下文获取)
 # ==============================================================================
-def get_context(chunks, index, offset, lines_count):
-    target_idx = index + offset
-    if 0 <= target_idx < len(chunks):
-        chunk_lines = chunks[target_idx].strip().split('\n')
-        if offset < 0: return chunk_lines[-lines_count:] # 上文
-        else: return chunk_lines[:lines_count]           # 下文
-    return []
+def get_context(sentences, first, last):
+    """上文：本块第一行之前 3 行，下文：本块最后一行之后 2 行 (按原文位置)"""
+    return sentences[max(0, first - 3):first], sentences[last + 1:last + 3]
+
+# ==============================================================================
+# 3. 免翻译行 (纯数字/标点、棋步记谱、网址、已是目标语言)
+# ==============================================================================
+def classify_skippable(sentences):
+    """返回 {位置: 直接使用的译文}；这些行不发给 LLM，但仍作为相邻行的上下文"""
+    if not load_key("translate_skip.enabled", default=True):
+        return {}, {}
+    src_lang, tgt_lang = load_key("whisper.detected_language"), load_key("target_language")
+    skipped, kinds = {}, {}
+    for p, line in enumerate(sentences):
+        result = classify_line(line, tgt_lang, src_lang)
+        if result:
+            kind, output = result
+            skipped[p] = output
+            kinds[kind] = kinds.get(kind, 0) + 1
+    return skipped, kinds
+
+def skip_report(sentences, skipped, kinds, planner):
+    """估算省下的调用数和 token 数 (按当前批大小和 completion_ratio 估算)"""
+    calls = math.ceil(len(skipped) / max(1, planner.cap))
+    tokens = sum(planner._line_cost(sentences[p]) for p in skipped) + calls * planner.overhead
+    stats = {"lines": len(skipped), "by_kind": kinds, "est_calls_saved": calls, "est_tokens_saved": int(tokens)}
+    LLM_STATS.set_section("skip_list", stats)
+    if skipped:
+        console.print(f"[cyan]⏭️ {len(skipped)} lines need no LLM ({', '.join(f'{k}: {v}' for k, v in kinds.items())}), "
+                      f"~{stats['est_tokens_saved']} tokens / {stats['est_calls_saved']} calls saved[/cyan]")
+    return stats
+
+# ==============================================================================
+# 4. 翻译记忆 (跨视频复用 + 视频内去重)
+# ==============================================================================
+def reuse_translations(sentences, skipped=None):
+    """返回 (已有译文 {位置: 译文}, 需要调用 LLM 的位置, 相似句提示 {位置: (原文, 译文)}, 重复行 {位置: 首次出现的位置})"""
+    memory = get_translation_memory()
+    src_lang, tgt_lang = load_key("whisper.detected_language"), load_key("target_language")
+    min_chars = memory.min_chars if memory else int(load_key("translation_memory.min_chars", default=10))
+    skipped = skipped or {}
+
+    known = memory.lookup(src_lang, tgt_lang, sentences) if memory else {}
+    known = {p: t for p, t in known.items() if p not in skipped}
+    first_seen, duplicates, positions = {}, {}, []
+    for p, line in enumerate(sentences):
+        if p in known or p in skipped:
+            continue
+        norm = normalize_line(line)
+        # 同一视频里重复的句子只翻一次 (太短的句子依赖上下文，不合并)
+        if len(norm) >= min_chars:
+            if norm in first_seen:
+                duplicates[p] = first_seen[norm]
+                continue
+            first_seen[norm] = p
+        positions.append(p)
+
+    hints = {}
+    if memory:
+        for p in positions:
+            similar = memory.similar(src_lang, tgt_lang, sentences[p])
+            if similar:
+                hints[p] = similar
+    return known, positions, hints, duplicates
+
+def chunk_terms_fingerprint(lines):
+    matcher = get_terminology_matcher()
+    return terms_fingerprint(matcher.find_many(lines) if matcher else [])
+
+def resume_from_journal(journal, sentences, positions):
+    """跳过上次已完成的 chunk；开启 retranslate_on_term_change 时，术语有变化的 chunk 重新翻译"""
+    check_terms = load_key("translate_journal.retranslate_on_term_change", default=True)
+    resumed, stats = journal.load(sentences, chunk_terms_fingerprint if check_terms else None)
+    wanted = set(positions)
+    resumed = {p: t for p, t in resumed.items() if p in wanted}
+    if resumed or stats['chunks_stale']:
+        console.print(f"[cyan]♻️ Resuming: {stats['chunks_reused']} finished chunks ({len(resumed)} lines) from the journal, "
+                      f"{stats['chunks_stale']} changed chunks will be re-translated[/cyan]")
+    return resumed, stats
+
+def check_terminology(src_lines, trans_lines):
+    """术语一致性检查：原文出现的术语，译文里是否用了约定的译法 (只报告，不重翻)"""
+    matcher = get_terminology_matcher()
+    if matcher is None:
+        return None
+    occurrences, misses = 0, []
+    for i, (src, trans) in enumerate(zip(src_lines, trans_lines)):
+        found = matcher.find(src)
+        if not found:
+            continue
+        occurrences += len(found)
+        misses.extend((i, t['src'], t['tgt']) for t in matcher.check_usage(src, trans))
+    stats = {"terms": len(matcher.terms), "occurrences": occurrences, "misses": len(misses),
+             "examples": [{"line": i, "src": s, "tgt": t} for i, s, t in misses[:20]]}
+    LLM_STATS.set_section("terminology", stats)
+    if misses:
+        console.print(f"[yellow]📖 {len(misses)}/{occurrences} term occurrences not translated as agreed, "
+                      f"e.g. {', '.join(f'{s} -> {t}' for _, s, t in misses[:5])}[/yellow]")
+    return stats
 
 # ==============================================================================
-# 3. 任务包装器
+# 5. 任务包装器
 # ==============================================================================
-def process_chunk(chunk, chunks, i):
-    lines = chunk.strip().split('\n')
-    # 获取上下文：前一块的最后3行，后一块的前2行
-    context_before = get_context(chunks, i, -1, 3)
-    context_after = get_context(chunks, i, 1, 2)
+class TranslationPlan:
+    """需要 LLM 翻译的行 (已剔除翻译记忆命中和重复行) 及其在原文中的位置
+
+    一个 chunk 只包含原文中连续的行：被跳过/已填好的行处在 chunk 边界上，作为上下文发给模型，
+    不会从 batch 中间消失，相隔的行也不会被当成相邻行
+    """
+    def __init__(self, sentences, positions, planner, hints=None, known=None):
+        self.sentences = sentences
+        self.positions = positions
+        self.lines = [sentences[p] for p in positions]
+        self.planner = planner
+        self.hints = hints or {}
+        # 翻译记忆已填好的行：作为上下文时连同译文一起给模型，保持措辞一致
+        self.known = known or {}
+        # run_ends[k]: 从 k 开始、原文位置连续的一段在 positions 中的结束下标
+        self.run_ends = [len(positions)] * len(positions)
+        for k in range(len(positions) - 2, -1, -1):
+            self.run_ends[k] = self.run_ends[k + 1] if positions[k + 1] == positions[k] + 1 else k + 1
+
+    def __len__(self):
+        return len(self.positions)
+
+    def next_end(self, start):
+        context_before, context_after = get_context(self.sentences, self.positions[start], self.positions[start])
+        return self.planner.next_end(self.lines, start, context_before, context_after, stop=self.run_ends[start])
+
+    def chunk(self, start, end):
+        positions = self.positions[start:end]
+        context_before, context_after = get_context(self.sentences, positions[0], positions[-1])
+        hints = [self.hints[p] for p in positions if p in self.hints]
+        first, last = positions[0], positions[-1]
+        hints += [(self.sentences[p], self.known[p])
+                  for p in (*range(max(0, first - len(context_before)), first), *range(last + 1, last + 1 + len(context_after)))
+                  if p in self.known]
+        return positions, self.lines[start:end], context_before, context_after, hints
+
+def process_chunk(plan, start, end, i):
+    positions, lines, context_before, context_after, hints = plan.chunk(start, end)
     
     # 调用核心引擎
-    trans_lines = translate_batch_lines(lines, context_before, context_after, chunk_index=i)
+    trans_lines = translate_batch_lines(lines, context_before, context_after, chunk_index=i,
+                                        on_batch_result=lambda ok: plan.planner.record(len(lines), ok),
+                                        hints=hints)
     
-    return i, lines, trans_lines
+    return i, positions, trans_lines
+
+async def process_chunk_async(plan, start, end, i):
+    positions, lines, context_before, context_after, hints = plan.chunk(start, end)
+    trans_lines = await translate_batch_lines_async(lines, context_before, context_after, chunk_index=i,
+                                                    on_batch_result=lambda ok: plan.planner.record(len(lines), ok),
+                                                    hints=hints)
+    return i, positions, trans_lines
+
+async def translate_chunks_async(plan, window, on_done):
+    """chunk 按需切分：最多 `window` 个在途，后面的 chunk 用已完成 chunk 的反馈来定大小"""
+    results, pending = [], set()
+    start = i = 0
+    while start < len(plan) or pending:
+        while start < len(plan) and len(pending) < window:
+            end = plan.next_end(start)
+            pending.add(asyncio.ensure_future(process_chunk_async(plan, start, end, i)))
+            start, i = end, i + 1
+        done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+        for task in done:
+            results.append(task.result())
+            # journal 的 fsync 和术语指纹会阻塞，放到线程里，不卡住其它在途请求
+            await asyncio.to_thread(on_done, results[-1])
+    return results
+
+def translate_chunks(plan, window, on_done):
+    results, pending = [], set()
+    start = i = 0
+    with ContextThreadPoolExecutor(max_workers=window) as executor:
+        while start < len(plan) or pending:
+            while start < len(plan) and len(pending) < window:
+                end = plan.next_end(start)
+                pending.add(executor.submit(process_chunk, plan, start, end, i))
+                start, i = end, i + 1
+            done, pending = concurrent.futures.wait(pending, return_when=concurrent.futures.FIRST_COMPLETED)
+            for future in done:
+                results.append(future.result())
+                on_done(results[-1])
+    return results
 
 # ==============================================================================
-# 4. 主流程
+# 6. 主流程
 # ==============================================================================
 @check_file_exists(_4_2_TRANSLATION)
+@llm_stage("4_2_translate")
 def translate_all():
     console.print("[bold green]🚀 Start Batch Translation (Version C Engine)...[/bold green]")
     
-    # 1. 切分任务
-    chunks = split_chunks_by_chars(chunk_size=600, max_i=10)
-    
-    # 2. 并发执行
-    results = []
+    # 1. 免翻译行直接填入；翻译记忆完全命中的直接填入，重复行只翻一次，相似句作为提示
+    sentences = load_sentences()
+    skipped, skip_kinds = classify_skippable(sentences)
+    known, positions, hints, duplicates = reuse_translations(sentences, skipped)
+    memory_stats = {
+        "lines": len(sentences), "from_memory": len(known), "duplicates": len(duplicates),
+        "fuzzy_hints": len(hints), "to_llm": len(positions),
+        "memory_rate": round(len(known) / len(sentences), 3) if sentences else 0.0,
+    }
+    LLM_STATS.set_section("translation_memory", memory_stats)
+    if known or duplicates:
+        console.print(f"[cyan]🧠 {len(known)} lines from translation memory, {len(duplicates)} duplicates reused, "
+                      f"{len(positions)}/{len(sentences)} lines left for the LLM[/cyan]")
+
+    # 2. 断点续翻：journal 里已完成、原文和术语都没变的 chunk 直接复用 (目标语言或模型变了则全部重翻)
+    journal = TranslationJournal(job_path(_4_2_JOURNAL),
+                                 setup={"target_language": load_key("target_language"), "model": load_key("api.model")})
+    resumed, journal_stats = resume_from_journal(journal, sentences, positions)
+    LLM_STATS.set_section("journal", dict(journal_stats, lines_resumed=len(resumed)))
+    llm_positions = [p for p in positions if p not in resumed]
+
+    # 3. 切分 + 并发执行 (边翻译边切分，批大小随校验失败率自适应)
+    plan = TranslationPlan(sentences, llm_positions, ChunkPlanner(get_batch_translation_prompt), hints, known)
+    skip_report(sentences, skipped, skip_kinds, plan.planner)
     with Progress(SpinnerColumn(), TextColumn("[progress.description]{task.description}"), transient=True) as progress:
-        task = progress.add_task("[cyan]Translating...", total=len(chunks))
+        task = progress.add_task("[cyan]Translating...", total=len(plan))
+
+        def on_done(result):
+            # 每个 chunk 完成就落盘，崩溃后只需重翻未完成的部分
+            _, chunk_positions, trans = result
+            # 降级为原文的行不记录，下次续翻时重试
+            kept = [(p, t) for p, t in zip(chunk_positions, trans) if t != sentences[p]]
+            if kept:
+                src = [sentences[p] for p, _ in kept]
+                journal.append([p for p, _ in kept], src, [t for _, t in kept], chunk_terms_fingerprint(src))
+            progress.update(task, advance=len(chunk_positions))
         
-        with concurrent.futures.ThreadPoolExecutor(max_workers=load_key("max_workers")) as executor:
-            futures = [executor.submit(process_chunk, chunk, chunks, i) for i, chunk in enumerate(chunks)]
-            
-            for future in concurrent.futures.as_completed(futures):
-                results.append(future.result())
-                progress.update(task, advance=1)
+        if use_async_engine():
+            window = load_key("llm_async.max_in_flight", default=100)
+            results = run_async(translate_chunks_async(plan, window, on_done))
+        else:
+            results = translate_chunks(plan, load_key("max_workers"), on_done)
 
-    # 3. 结果重组
-    results.sort(key=lambda x: x[0])
-    
-    all_src = []
-    all_trans = []
-    for _, src, trans in results:
-        all_src.extend(src)
-        all_trans.extend(trans)
+    plan_stats = plan.planner.stats()
+    LLM_STATS.set_section("chunking", plan_stats)
+    console.print(f"[cyan]📦 {plan_stats['batches']} batches, line cap {plan_stats['line_cap']}, "
+                  f"overhead/payload tokens = {plan_stats['overhead_ratio']}[/cyan]")
+
+    # 4. 结果重组
+    translations = dict(skipped)
+    translations.update(known)
+    translations.update(resumed)
+    for _, chunk_positions, trans in results:
+        translations.update(zip(chunk_positions, trans))
+    for p, first in duplicates.items():
+        translations[p] = translations[first]
+
+    # 校验通过的新译文写回翻译记忆 (降级为原文的行不会写入)
+    memory = get_translation_memory()
+    if memory:
+        memory.put_many(load_key("whisper.detected_language"), load_key("target_language"),
+                        [(sentences[p], translations[p]) for p in llm_positions])
+
+    all_src = sentences
+    all_trans = [translations.get(p, sentences[p]) for p in range(len(sentences))]
+    check_terminology(all_src, all_trans)
         
-    # 4. 数据保存 (Excel & SRT)
+    # 5. 数据保存 (Excel & SRT)
     # 读取原始 Whisper 切片用于时间轴对齐
     df_text = pd.read_excel(_2_CLEANED_CHUNKS)
     df_text['text'] = df_text['text'].str.strip('"').str.strip()
@@ -125,7 +325,9 @@ def translate_all():
     # 生成带时间轴的 Excel
     # align_timestamp 会通过文本模糊匹配，将 df_translate(无时间) 映射到 df_text(有时间) 上
     subtitle_configs = [('trans_subs_for_audio.srt', ['Translation'])]
-    df_time = align_timestamp(df_text, df_translate, subtitle_configs, output_dir=None, for_display=False)
+    # 切分阶段记录了每行的词区间，能直接查表的行不再做模糊匹配
+    spans = load_spans(_3_2_SPANS, all_src)
+    df_time = align_timestamp(df_text, df_translate, subtitle_configs, output_dir=None, for_display=False, spans=spans)
     
     # 长度修剪 (Trim)
     min_dur = load_key("min_trim_duration")
@@ -135,7 +337,7 @@ def translate_all():
     )
     
     console.print(df_time)
-    df_time.to_excel(_4_2_TRANSLATION, index=False)
+    df_time.to_excel(job_path(_4_2_TRANSLATION), index=False)
     console.print("[bold green]✅ Translation Pipeline Completed![/bold green]")
 
 if __name__ == '__main__':
@@ -1,15 +1,21 @@
 import pandas as pd
+import asyncio
 from typing import List, Tuple
-import concurrent.futures
 
-from core._3_2_split_meaning import split_sentence
+from core._3_2_split_meaning import split_sentence, split_sentence_async
 from core.prompts import get_align_prompt
+from core.spacy_utils.load_nlp_model import init_nlp
 from rich.panel import Panel
 from rich.console import Console
 from rich.table import Table
 from core.utils import *
 from core.utils.models import *
+from core.utils.scheduling import longest_first
+from core.utils.word_spans import load_word_index, load_spans, track_spans, regroup_spans, save_spans
+from core.utils.sub_splitter import split_locally
+from core.utils.llm_stats import LLM_STATS
 console = Console()
+NLP = None
 
 # ! You can modify your own weights here
 # Chinese and Japanese 2.5 characters, Korean 2 characters, Thai 1.5 characters, full-width symbols 2 characters, other English-based and half-width symbols 1 character
@@ -30,18 +36,15 @@ def calc_len(text: str) -> float:
 
     return sum(char_weight(char) for char in text)
 
-def align_subs(src_sub: str, tr_sub: str, src_part: str) -> Tuple[List[str], List[str], str]:
-    align_prompt = get_align_prompt(src_sub, tr_sub, src_part)
-    
-    def valid_align(response_data):
-        if 'align' not in response_data:
-            return {"status": "error", "message": "Missing required key: `align`"}
-        if len(response_data['align']) < 2:
-            return {"status": "success", "message": "Align completed (single part)"}
-        return {"status": "success", "message": "Align completed"}
-    
-    parsed = ask_gpt(align_prompt, resp_type='json', valid_def=valid_align, log_title='align_subs')
-    
+def valid_align(response_data):
+    if 'align' not in response_data:
+        return {"status": "error", "message": "Missing required key: `align`"}
+    if len(response_data['align']) < 2:
+        return {"status": "success", "message": "Align completed (single part)"}
+    return {"status": "success", "message": "Align completed"}
+
+def finish_align(parsed, src_part):
+    """Map the LLM alignment back onto the source split and re-merge the translation"""
     align_data = parsed['align']
     src_parts = src_part.split('\n')
     
@@ -72,7 +75,49 @@ def align_subs(src_sub: str, tr_sub: str, src_part: str) -> Tuple[List[str], Lis
     
     return src_parts, tr_parts, tr_remerged
 
-def split_align_subs(src_lines: List[str], tr_lines: List[str]):
+def align_subs(src_sub: str, tr_sub: str, src_part: str) -> Tuple[List[str], List[str], str]:
+    align_prompt = get_align_prompt(src_sub, tr_sub, src_part)
+    parsed = ask_gpt(align_prompt, resp_type='json', valid_def=valid_align, log_title='align_subs')
+    return finish_align(parsed, src_part)
+
+async def align_subs_async(src_sub: str, tr_sub: str, src_part: str) -> Tuple[List[str], List[str], str]:
+    align_prompt = get_align_prompt(src_sub, tr_sub, src_part)
+    parsed = await ask_gpt_async(align_prompt, resp_type='json', valid_def=valid_align, log_title='align_subs')
+    return finish_align(parsed, src_part)
+
+def parse_for_split(lines):
+    """spaCy docs of the lines, for clause boundaries; None for each line if the model can't be loaded"""
+    global NLP
+    if not lines or not load_key("subtitle.local_split_spacy", default=True):
+        return [None] * len(lines)
+    if NLP is None:
+        try:
+            NLP = init_nlp()
+        except Exception as e:
+            rprint(f"[yellow]⚠️ spaCy unavailable for local splitting, using punctuation only: {e}[/yellow]")
+            NLP = False
+    return list(NLP.pipe(lines)) if NLP else [None] * len(lines)
+
+def split_lines_locally(to_split, src_lines, tr_lines, max_length, target_multiplier):
+    """{line index: (src_parts, tr_parts)} for the lines split without the LLM"""
+    if not to_split or not load_key("subtitle.local_split", default=True):
+        return {}
+    cleaned = [str(src_lines[i]).replace('\n', ' ') for i in to_split]
+    docs = parse_for_split(cleaned)
+    local = {}
+    for i, src, doc in zip(to_split, cleaned, docs):
+        result = split_locally(src, tr_lines[i], max_length, target_multiplier, calc_len, doc)
+        if result is not None:
+            local[i] = result
+    return local
+
+def split_align_subs(src_lines: List[str], tr_lines: List[str], spans=None, word_index=None, counts=None):
+    """Split over-long lines in two and align their translation.
+
+    Lines with a clear cut in both languages are split locally, the others by the LLM (split + align);
+    `counts` ({'local': n, 'llm': n}) is updated with how many went each way.
+    With `spans` (word span per source line) and `word_index`, also returns the spans of the split lines.
+    """
     subtitle_set = load_key("subtitle")
     MAX_SUB_LENGTH = subtitle_set["max_length"]
     TARGET_SUB_MULTIPLIER = subtitle_set["target_multiplier"]
@@ -103,53 +148,102 @@ def split_align_subs(src_lines: List[str], tr_lines: List[str]):
         tr_lines[i] = tr_parts
         remerged_tr_lines[i] = tr_remerged
     
-    # === 关键修改：解除硬性限制，完全尊重 config.yaml 配置 ===
-    # 之前是: max_workers = min(load_key("max_workers"), 5)
-    # 现在改为:
-    max_workers = load_key("max_workers")
-    
-    with concurrent.futures.ThreadPoolExecutor(max_workers=max_workers) as executor:
-        executor.map(process, to_split)
+    async def process_async(i):
+        src_line_clean = src_lines[i].replace('\n', ' ')
+        split_src = (await split_sentence_async(src_line_clean, num_parts=2)).strip()
+        if split_src == src_line_clean:
+            return
+        src_parts, tr_parts, tr_remerged = await align_subs_async(src_lines[i], tr_lines[i], split_src)
+        src_lines[i] = src_parts
+        tr_lines[i] = tr_parts
+        remerged_tr_lines[i] = tr_remerged
+
+    async def process_all_async():
+        results = await asyncio.gather(*[process_async(i) for i in to_split], return_exceptions=True)
+        for i, result in zip(to_split, results):
+            if isinstance(result, Exception):
+                rprint(f"[red]Error in split_align_subs: {result}[/red]")
+
+    # 能在本地确定切分点的行不再调用 LLM
+    local = split_lines_locally(to_split, src_lines, tr_lines, MAX_SUB_LENGTH, TARGET_SUB_MULTIPLIER)
+    # 本地切分只切不改，remerged 保留原译文
+    for i, (src_parts, tr_parts) in local.items():
+        src_lines[i], tr_lines[i] = src_parts, tr_parts
+    to_split = [i for i in to_split if i not in local]
+    if local or to_split:
+        console.print(f"[cyan]✂️ {len(local)} lines split locally, {len(to_split)} sent to the LLM[/cyan]")
+    if counts is not None:
+        counts['local'] += len(local)
+        counts['llm'] += len(to_split)
+
+    # longest lines first (LPT), they take the longest split + align round trips
+    to_split = longest_first(to_split, cost=lambda i: len(str(src_lines[i])) + calc_len(str(tr_lines[i])))
+
+    if use_async_engine():
+        run_async(process_all_async())
+    else:
+        # === 关键修改：解除硬性限制，完全尊重 config.yaml 配置 ===
+        # 之前是: max_workers = min(load_key("max_workers"), 5)
+        # 现在改为:
+        max_workers = load_key("max_workers")
+        
+        with ContextThreadPoolExecutor(max_workers=max_workers) as executor:
+            executor.map(process, to_split)
     
-    src_lines = [item for sublist in src_lines for item in (sublist if isinstance(sublist, list) else [sublist])]
+    groups = [sublist if isinstance(sublist, list) else [sublist] for sublist in src_lines]
+    new_spans = regroup_spans(word_index, groups, spans) if spans is not None else None
+    src_lines = [item for sublist in groups for item in sublist]
     tr_lines = [item for sublist in tr_lines for item in (sublist if isinstance(sublist, list) else [sublist])]
     
-    return src_lines, tr_lines, remerged_tr_lines
+    return src_lines, tr_lines, remerged_tr_lines, new_spans
 
+@llm_stage("5_split_sub")
 def split_for_sub_main():
     console.print("[bold green]🚀 Start splitting subtitles...[/bold green]")
     
-    df = pd.read_excel(_4_2_TRANSLATION)
+    df = pd.read_excel(job_path(_4_2_TRANSLATION))
     src = df['Source'].tolist()
     trans = df['Translation'].tolist()
+    # 4_2 的行与 split_by_meaning 一一对应，词区间随每次切分更新
+    word_index = load_word_index()
+    spans = load_spans(_3_2_SPANS, src)
+    if all(span is None for span in spans):
+        spans = track_spans(src, word_index)
+    split_spans = spans
     
     subtitle_set = load_key("subtitle")
     MAX_SUB_LENGTH = subtitle_set["max_length"]
     TARGET_SUB_MULTIPLIER = subtitle_set["target_multiplier"]
+    counts = {'local': 0, 'llm': 0}
     
     for attempt in range(3):
         console.print(Panel(f"🔄 Split attempt {attempt + 1}", expand=False))
         len_before = len(src)
         
-        split_src, split_trans, remerged = split_align_subs(src.copy(), trans)
+        split_src, split_trans, remerged, split_spans = split_align_subs(src.copy(), trans, spans, word_index, counts)
         
         if len(split_src) == len_before:
              console.print("[yellow]⚠️ No more splits possible or needed.[/yellow]")
              break
 
-        src, trans = split_src, split_trans
+        src, trans, spans = split_src, split_trans, split_spans
         
         if all(len(str(s)) <= MAX_SUB_LENGTH for s in src) and \
            all(calc_len(str(t)) * TARGET_SUB_MULTIPLIER <= MAX_SUB_LENGTH for t in trans):
             break
 
+    LLM_STATS.set_section("local_split", counts)
+    console.print(f"[cyan]✂️ Subtitle splitting: {counts['local']} lines split locally, {counts['llm']} by the LLM[/cyan]")
+
     if len(src) > len(remerged):
         remerged += [None] * (len(src) - len(remerged))
     elif len(remerged) > len(src):
         src += [None] * (len(remerged) - len(src))
     
-    pd.DataFrame({'Source': split_src, 'Translation': split_trans}).to_excel(_5_SPLIT_SUB, index=False)
-    pd.DataFrame({'Source': src, 'Translation': remerged}).to_excel(_5_REMERGED, index=False)
+    pd.DataFrame({'Source': split_src, 'Translation': split_trans}).to_excel(job_path(_5_SPLIT_SUB), index=False)
+    pd.DataFrame({'Source': src, 'Translation': remerged}).to_excel(job_path(_5_REMERGED), index=False)
+    save_spans(job_path(_5_SPLIT_SUB_SPANS), split_src, split_spans)
+    save_spans(job_path(_5_REMERGED_SPANS), src, spans + [None] * (len(src) - len(spans)))
 
 if __name__ == '__main__':
     split_for_sub_main()
\ No newline at end of file
@@ -6,7 +6,9 @@ from rich.console import Console
 import autocorrect_py as autocorrect
 from core.utils import *
 from core.utils.models import *
-from difflib import SequenceMatcher
+from collections import Counter
+from core.utils.word_spans import WordIndex, remove_punctuation, load_spans
+from core.utils.subtitle_timeline import Timeline
 
 console = Console()
 
@@ -24,61 +26,72 @@ AUDIO_SUBTITLE_OUTPUT_CONFIGS = [
 
 def convert_to_srt_format(start_time, end_time):
     """Convert time (in seconds) to the format: hours:minutes:seconds,milliseconds"""
-    def seconds_to_hmsm(seconds):
-        hours = int(seconds // 3600)
-        minutes = int((seconds % 3600) // 60)
-        seconds = seconds % 60
-        milliseconds = int(seconds * 1000) % 1000
-        return f"{hours:02d}:{minutes:02d}:{int(seconds):02d},{milliseconds:03d}"
+    return Timeline([start_time], [end_time]).timestamps()[0]
 
-    start_srt = seconds_to_hmsm(start_time)
-    end_srt = seconds_to_hmsm(end_time)
-    return f"{start_srt} --> {end_srt}"
+def _seed_match(query, text, start, limit, threshold):
+    """Anchored k-gram seeding: each query k-gram found in text[start:limit] votes for a diagonal
+    (text offset - query offset); seeds near the best diagonal, in order, give the span"""
+    k = max(3, min(8, len(query) // 4))
+    if len(query) < k:
+        return None
+    seeds = []
+    for q in range(0, len(query) - k + 1, max(1, k // 2)):
+        gram = query[q:q + k]
+        t = text.find(gram, start, limit)
+        hits = 0
+        while t != -1 and hits < 8:
+            seeds.append((q, t))
+            t = text.find(gram, t + 1, limit)
+            hits += 1
+    if not seeds:
+        return None
 
-def remove_punctuation(text):
-    # 强化清洗逻辑，统一处理为字符串，移除标点
-    text = re.sub(r'\s+', ' ', str(text))
-    text = re.sub(r'[^\w\s]', '', text)
-    return text.strip()
+    # small insertions / deletions shift the diagonal a little
+    band = max(4, len(query) // 10)
+    votes = Counter(t - q for q, t in seeds)
+    diagonal = max(votes, key=lambda d: sum(votes.get(x, 0) for x in range(d - band, d + band + 1)))
+    chain, last_t = [], -1
+    for q, t in sorted(seeds):
+        if abs(t - q - diagonal) <= band and t > last_t:
+            chain.append((q, t))
+            last_t = t
+
+    covered, reach = 0, 0
+    for q, _ in chain:
+        covered += max(0, q + k - max(q, reach))
+        reach = max(reach, q + k)
+    if covered / len(query) <= threshold:
+        return None
+    # extend the first / last anchor to the sentence edges along the diagonal
+    (first_q, first_t), (last_q, last_t) = chain[0], chain[-1]
+    span_start = max(start, first_t - first_q)
+    span_end = min(len(text), last_t + len(query) - last_q)
+    return (span_start, max(span_end, span_start + 1))
 
 def find_best_match(query, text, start_pos, search_window=2500, threshold=0.6):
     """在指定窗口内寻找最佳模糊匹配"""
     search_limit = min(len(text), start_pos + search_window)
-    window_text = text[start_pos:search_limit]
     
-    if not query or not window_text:
+    if not query or start_pos >= search_limit:
         return None
 
-    # 1. 尝试直接匹配（最高效）
-    exact_idx = window_text.find(query)
+    # 1. 尝试直接匹配（最高效，不复制窗口）
+    exact_idx = text.find(query, start_pos, search_limit)
     if exact_idx != -1:
-        return (start_pos + exact_idx, start_pos + exact_idx + len(query))
+        return (exact_idx, exact_idx + len(query))
 
-    # 2. 模糊匹配
-    matcher = SequenceMatcher(None, query, window_text)
-    match = matcher.find_longest_match(0, len(query), 0, len(window_text))
-    
-    # 只有当匹配长度占原句一定比例时才认为有效
-    if match.size / len(query) > threshold:
-        abs_start = start_pos + match.b
-        abs_end = abs_start + match.size
-        return (abs_start, abs_end)
-    
-    return None
+    # 2. 模糊匹配：k-gram 锚点投票，只有锚点覆盖原句一定比例时才认为有效
+    return _seed_match(query, text, start_pos, search_limit, threshold)
 
-def get_sentence_timestamps(df_words, df_sentences):
+def get_sentence_timestamps(df_words, df_sentences, word_index=None, spans=None):
+    """`spans`: optional word span [first, last] per sentence (see core.utils.word_spans);
+    sentences with a span are timed by direct lookup, the others by text matching"""
     time_stamp_list = []
+    counts = {"direct": 0, "matched": 0, "lookahead": 0, "estimated": 0}
     
-    # 构建全文字符串和位置索引映射
-    full_words_str = ''
-    position_to_word_idx = {}
-    
-    for idx, word in enumerate(df_words['text']):
-        clean_word = remove_punctuation(word.lower())
-        start_pos = len(full_words_str)
-        full_words_str += clean_word
-        for pos in range(start_pos, len(full_words_str)):
-            position_to_word_idx[pos] = idx
+    # 全文字符串 + 前缀偏移数组 (字符位置 -> 词序号用 bisect 查找)
+    index = word_index if word_index is not None else WordIndex(df_words)
+    full_words_str = index.text
             
     current_pos = 0
     last_end_time = 0.0
@@ -86,6 +99,8 @@ def get_sentence_timestamps(df_words, df_sentences):
     sentences = df_sentences['Source'].tolist()
     total_sentences = len(sentences)
     i = 0
+    # 前瞻时找到的下一句匹配 (句子序号, span)，下一轮直接复用
+    lookahead = None
     
     while i < total_sentences:
         sentence = sentences[i]
@@ -98,21 +113,26 @@ def get_sentence_timestamps(df_words, df_sentences):
             i += 1
             continue
 
+        # === 策略0: 切分阶段带下来的词区间，直接查表 ===
         # === 策略1: 尝试当前句子的匹配 ===
-        match_span = find_best_match(clean_sentence, full_words_str, current_pos)
+        known = spans[i] if spans is not None else None
+        if known is not None:
+            match_span = (index.char_start(known[0]), index.ends[known[1]])
+        elif lookahead is not None and lookahead[0] == i:
+            match_span = lookahead[1]
+        else:
+            match_span = find_best_match(clean_sentence, full_words_str, current_pos)
+        lookahead = None
         
         if match_span:
             # 找到匹配，提取时间
-            start_idx = match_span[0]
-            end_idx = match_span[1] - 1 # inclusive
+            start_word_idx = index.word_at(match_span[0])
+            end_word_idx = index.word_at(match_span[1] - 1) # inclusive
             
             # 安全检查：防止索引越界
-            if start_idx in position_to_word_idx and end_idx in position_to_word_idx:
-                start_word_idx = position_to_word_idx[start_idx]
-                end_word_idx = position_to_word_idx[end_idx]
-                
-                start_t = float(df_words['start'][start_word_idx])
-                end_t = float(df_words['end'][end_word_idx])
+            if start_word_idx is not None and end_word_idx is not None:
+                start_t = index.starts[start_word_idx]
+                end_t = index.end_times[end_word_idx]
                 
                 # 修正：开始时间不能早于上一句结束时间
                 if start_t < last_end_time:
@@ -123,6 +143,7 @@ def get_sentence_timestamps(df_words, df_sentences):
                 time_stamp_list.append((start_t, end_t))
                 last_end_time = end_t
                 current_pos = match_span[1]
+                counts["direct" if known is not None else "matched"] += 1
                 i += 1
                 continue
 
@@ -137,16 +158,19 @@ def get_sentence_timestamps(df_words, df_sentences):
         if lookahead_idx < total_sentences:
             next_sent = sentences[lookahead_idx]
             clean_next = remove_punctuation(next_sent.lower()).replace(" ", "")
-            if clean_next:
+            next_known = spans[lookahead_idx] if spans is not None else None
+            if next_known is not None:
+                next_match_span = (index.char_start(next_known[0]), index.ends[next_known[1]])
+            elif clean_next:
                 # 在更远的窗口寻找下一句
                 next_match_span = find_best_match(clean_next, full_words_str, current_pos, search_window=3000)
         
         if next_match_span:
             # === 策略2.1: 下一句找到了 ===
             # 下一句的开始位置
-            next_start_idx = next_match_span[0]
-            if next_start_idx in position_to_word_idx:
-                next_start_t = float(df_words['start'][position_to_word_idx[next_start_idx]])
+            next_word_idx = index.word_at(next_match_span[0])
+            if next_word_idx is not None:
+                next_start_t = index.starts[next_word_idx]
             else:
                 next_start_t = last_end_time + 2.0
             
@@ -158,13 +182,11 @@ def get_sentence_timestamps(df_words, df_sentences):
             console.print(f"[green]✅ Recovered using lookahead. Assigning interval {last_end_time:.2f}-{next_start_t:.2f}[/green]")
             time_stamp_list.append((last_end_time, next_start_t))
             last_end_time = next_start_t
+            counts["lookahead"] += 1
             
-            # 注意：这里我们不移动 current_pos，也不增加 i
-            # 因为下一轮循环处理 i+1 时，会再次找到这个 next_match_span 并正常处理
-            # 这里的目的是给当前“丢失”的句子 i 分配时间
-            
-            # 修正：为了避免下一轮重复搜索带来的开销，其实可以直接在这里跳过吗？
-            # 不，保持 current_pos 不变，下一轮 i+1 自然会匹配到 next_match_span，逻辑更简单
+            # 注意：这里我们不移动 current_pos，只给当前“丢失”的句子 i 分配时间
+            # current_pos 不变，所以下一轮 i+1 的匹配结果就是 next_match_span，直接复用省去重复搜索
+            lookahead = (lookahead_idx, next_match_span)
             i += 1
             
         else:
@@ -179,23 +201,25 @@ def get_sentence_timestamps(df_words, df_sentences):
             end_t = last_end_time + estimated_duration
             time_stamp_list.append((start_t, end_t))
             last_end_time = end_t
+            counts["estimated"] += 1
             # 这种情况下不移动 current_pos，希望后面能重新对齐
             i += 1
 
+    console.print(f"[cyan]⏱️ Timestamps: {counts['direct']} from word spans, {counts['matched']} by text matching, "
+                  f"{counts['lookahead']} by lookahead, {counts['estimated']} estimated[/cyan]")
     return time_stamp_list
 
-def align_timestamp(df_text, df_translate, subtitle_output_configs: list, output_dir: str, for_display: bool = True):
-    """Align timestamps and add a new timestamp column to df_translate"""
-    df_trans_time = df_translate.copy()
+def align_timestamp(df_text, df_translate, subtitle_output_configs: list, output_dir: str, for_display: bool = True, word_index=None, spans=None):
+    """Align timestamps and add a new timestamp column to df_translate
 
-    # Assign an ID to each word in df_text['text'] and create a new DataFrame
-    words = df_text['text'].str.split(expand=True).stack().reset_index(level=1, drop=True).reset_index()
-    words.columns = ['id', 'word']
-    words['id'] = words['id'].astype(int)
+    Pass the same `word_index` (WordIndex(df_text)) when aligning several tables against one transcript,
+    and `spans` (one word span or None per row of df_translate) when the rows' provenance is known.
+    """
+    df_trans_time = df_translate.copy()
 
     # Process timestamps ⏰
     try:
-        time_stamp_list = get_sentence_timestamps(df_text, df_translate)
+        time_stamp_list = get_sentence_timestamps(df_text, df_translate, word_index, spans)
     except Exception as e:
         console.print(f"[bold red]Critical Error in timestamp alignment: {str(e)}[/bold red]")
         # Fallback: Generate linear timestamps to prevent crash
@@ -205,35 +229,25 @@ def align_timestamp(df_text, df_translate, subtitle_output_configs: list, output
             time_stamp_list.append((curr, curr+2.0))
             curr += 2.0
             
-    df_trans_time['timestamp'] = time_stamp_list
-    df_trans_time['duration'] = df_trans_time['timestamp'].apply(lambda x: x[1] - x[0])
+    timeline = Timeline.from_pairs(time_stamp_list)
+    df_trans_time['duration'] = timeline.duration
 
     # Remove gaps 🕳️
-    for i in range(len(df_trans_time)-1):
-        if i+1 < len(df_trans_time):
-            current_end = df_trans_time.loc[i, 'timestamp'][1]
-            next_start = df_trans_time.loc[i+1, 'timestamp'][0]
-            delta_time = next_start - current_end
-            if 0 < delta_time < 1:
-                df_trans_time.at[i, 'timestamp'] = (df_trans_time.loc[i, 'timestamp'][0], next_start)
+    timeline = timeline.close_gaps(1)
 
     # Convert start and end timestamps to SRT format
-    df_trans_time['timestamp'] = df_trans_time['timestamp'].apply(lambda x: convert_to_srt_format(x[0], x[1]))
+    df_trans_time['timestamp'] = timeline.timestamps()
 
     # Polish subtitles: replace punctuation in Translation if for_display
     if for_display:
         df_trans_time['Translation'] = df_trans_time['Translation'].apply(lambda x: re.sub(r'[，。]', ' ', str(x)).strip())
 
     # Output subtitles 📜
-    def generate_subtitle_string(df, columns):
-        return ''.join([f"{i+1}\n{row['timestamp']}\n{str(row[columns[0]]).strip()}\n{str(row[columns[1]]).strip() if len(columns) > 1 else ''}\n\n" for i, row in df.iterrows()]).strip()
-
     if output_dir:
         os.makedirs(output_dir, exist_ok=True)
         for filename, columns in subtitle_output_configs:
-            subtitle_str = generate_subtitle_string(df_trans_time, columns)
-            with open(os.path.join(output_dir, filename), 'w', encoding='utf-8') as f:
-                f.write(subtitle_str)
+            cues = Timeline(timeline.start, timeline.end, **{c: df_trans_time[c].tolist() for c in columns})
+            cues.write(os.path.join(output_dir, filename), *columns)
     
     return df_trans_time
 
@@ -247,18 +261,23 @@ def clean_translation(x):
 def align_timestamp_main():
     df_text = pd.read_excel(_2_CLEANED_CHUNKS)
     df_text['text'] = df_text['text'].str.strip('"').str.strip()
-    df_translate = pd.read_excel(_5_SPLIT_SUB)
+    df_translate = pd.read_excel(job_path(_5_SPLIT_SUB))
     df_translate['Translation'] = df_translate['Translation'].apply(clean_translation)
     
-    align_timestamp(df_text, df_translate, SUBTITLE_OUTPUT_CONFIGS, _OUTPUT_DIR)
-    console.print(Panel("[bold green]🎉📝 Subtitles generation completed! Please check in the `output` folder 👀[/bold green]"))
+    output_dir, audio_dir = job_path(_OUTPUT_DIR), job_path(_AUDIO_DIR)
+    # 两次对齐共用同一份词索引
+    word_index = WordIndex(df_text)
+    spans = load_spans(job_path(_5_SPLIT_SUB_SPANS), df_translate['Source'].tolist())
+    align_timestamp(df_text, df_translate, SUBTITLE_OUTPUT_CONFIGS, output_dir, word_index=word_index, spans=spans)
+    console.print(Panel(f"[bold green]🎉📝 Subtitles generation completed! Please check in the `{output_dir}` folder 👀[/bold green]"))
 
     # for audio
-    df_translate_for_audio = pd.read_excel(_5_REMERGED) # use remerged file to avoid unmatched lines when dubbing
+    df_translate_for_audio = pd.read_excel(job_path(_5_REMERGED)) # use remerged file to avoid unmatched lines when dubbing
     df_translate_for_audio['Translation'] = df_translate_for_audio['Translation'].apply(clean_translation)
     
-    align_timestamp(df_text, df_translate_for_audio, AUDIO_SUBTITLE_OUTPUT_CONFIGS, _AUDIO_DIR)
-    console.print(Panel(f"[bold green]🎉📝 Audio subtitles generation completed! Please check in the `{_AUDIO_DIR}` folder 👀[/bold green]"))
+    spans = load_spans(job_path(_5_REMERGED_SPANS), df_translate_for_audio['Source'].tolist())
+    align_timestamp(df_text, df_translate_for_audio, AUDIO_SUBTITLE_OUTPUT_CONFIGS, audio_dir, word_index=word_index, spans=spans)
+    console.print(Panel(f"[bold green]🎉📝 Audio subtitles generation completed! Please check in the `{audio_dir}` folder 👀[/bold green]"))
     
 
 if __name__ == '__main__':
@@ -1,4 +1,3 @@
-import datetime
 import re
 import pandas as pd
 from rich.console import Console
@@ -7,6 +6,7 @@ from core.prompts import get_subtitle_trim_prompt
 from core.tts_backend.estimate_duration import init_estimator, estimate_duration
 from core.utils import *
 from core.utils.models import *
+from core.utils.subtitle_timeline import Timeline, format_times
 
 console = Console()
 speed_factor = load_key("speed_factor")
@@ -43,88 +43,44 @@ def check_len_then_trim(text, duration):
     else:
         return text
 
-def time_diff_seconds(t1, t2, base_date):
-    """Calculate the difference in seconds between two time objects"""
-    dt1 = datetime.datetime.combine(base_date, t1)
-    dt2 = datetime.datetime.combine(base_date, t2)
-    return (dt2 - dt1).total_seconds()
+def clean_dub_text(text):
+    # Remove content within parentheses (including English and Chinese parentheses)
+    text = re.sub(r'\([^)]*\)', '', text).strip()
+    text = re.sub(r'（[^）]*）', '', text).strip()
+    # Remove '-' character, can continue to add illegal characters that cause errors
+    return text.replace('-', '')
 
 def process_srt():
     """Process srt file, generate audio tasks"""
-    
-    with open(TRANS_SUBS_FOR_AUDIO_FILE, 'r', encoding='utf-8') as file:
-        content = file.read()
-    
-    with open(SRC_SUBS_FOR_AUDIO_FILE, 'r', encoding='utf-8') as src_file:
-        src_content = src_file.read()
-    
-    subtitles = []
-    src_subtitles = {}
-    
-    for block in src_content.strip().split('\n\n'):
-        lines = [line.strip() for line in block.split('\n') if line.strip()]
-        if len(lines) < 3:
-            continue
-        
-        number = int(lines[0])
-        src_text = ' '.join(lines[2:])
-        src_subtitles[number] = src_text
-    
-    for block in content.strip().split('\n\n'):
-        lines = [line.strip() for line in block.split('\n') if line.strip()]
-        if len(lines) < 3:
-            continue
-        
-        try:
-            number = int(lines[0])
-            start_time, end_time = lines[1].split(' --> ')
-            start_time = datetime.datetime.strptime(start_time, '%H:%M:%S,%f').time()
-            end_time = datetime.datetime.strptime(end_time, '%H:%M:%S,%f').time()
-            duration = time_diff_seconds(start_time, end_time, datetime.date.today())
-            text = ' '.join(lines[2:])
-            # Remove content within parentheses (including English and Chinese parentheses)
-            text = re.sub(r'\([^)]*\)', '', text).strip()
-            text = re.sub(r'（[^）]*）', '', text).strip()
-            # Remove '-' character, can continue to add illegal characters that cause errors
-            text = text.replace('-', '')
+    def report_invalid(block):
+        rprint(Panel(f"Unable to parse subtitle block '{block}', skipping this subtitle block.", title="Error", border_style="red"))
 
-            # Add the original text from src_subs_for_audio.srt
-            origin = src_subtitles.get(number, '')
+    trans = Timeline.read(TRANS_SUBS_FOR_AUDIO_FILE, on_invalid=report_invalid)
+    src = Timeline.read(SRC_SUBS_FOR_AUDIO_FILE)
+    # Add the original text from src_subs_for_audio.srt
+    src_subtitles = dict(zip(src.numbers.tolist(), src.text()))
+
+    texts = [clean_dub_text(t) for t in trans.text()]
+    origins = [src_subtitles.get(n, '') for n in trans.numbers.tolist()]
 
-        except ValueError as e:
-            rprint(Panel(f"Unable to parse subtitle block '{block}', error: {str(e)}, skipping this subtitle block.", title="Error", border_style="red"))
-            continue
-        
-        subtitles.append({'number': number, 'start_time': start_time, 'end_time': end_time, 'duration': duration, 'text': text, 'origin': origin})
-    
-    df = pd.DataFrame(subtitles)
-    
-    i = 0
     MIN_SUB_DUR = load_key("min_subtitle_duration")
-    while i < len(df):
-        today = datetime.date.today()
-        if df.loc[i, 'duration'] < MIN_SUB_DUR:
-            if i < len(df) - 1 and time_diff_seconds(df.loc[i, 'start_time'],df.loc[i+1, 'start_time'],today) < MIN_SUB_DUR:
-                rprint(f"[bold yellow]Merging subtitles {i+1} and {i+2}[/bold yellow]")
-                df.loc[i, 'text'] += ' ' + df.loc[i+1, 'text']
-                df.loc[i, 'origin'] += ' ' + df.loc[i+1, 'origin']
-                df.loc[i, 'end_time'] = df.loc[i+1, 'end_time']
-                df.loc[i, 'duration'] = time_diff_seconds(df.loc[i, 'start_time'],df.loc[i, 'end_time'],today)
-                df = df.drop(i+1).reset_index(drop=True)
-            else:
-                if i < len(df) - 1:  # Not the last audio
-                    rprint(f"[bold blue]Extending subtitle {i+1} duration to {MIN_SUB_DUR} seconds[/bold blue]")
-                    df.loc[i, 'end_time'] = (datetime.datetime.combine(today, df.loc[i, 'start_time']) + 
-                                            datetime.timedelta(seconds=MIN_SUB_DUR)).time()
-                    df.loc[i, 'duration'] = MIN_SUB_DUR
-                else:
-                    rprint(f"[bold red]The last subtitle {i+1} duration is less than {MIN_SUB_DUR} seconds, but not extending[/bold red]")
-                i += 1
-        else:
-            i += 1
-    
-    df['start_time'] = df['start_time'].apply(lambda x: x.strftime('%H:%M:%S.%f')[:-3])
-    df['end_time'] = df['end_time'].apply(lambda x: x.strftime('%H:%M:%S.%f')[:-3])
+    cues = Timeline(trans.start, trans.end, trans.numbers, text=texts, origin=origins)
+    timeline, groups, extended = cues.merge_short(MIN_SUB_DUR)
+    for first, last in groups:
+        rprint(f"[bold yellow]Merging subtitles {cues.numbers[first]} to {cues.numbers[last]}[/bold yellow]")
+    if extended.any():
+        rprint(f"[bold blue]Extending {int(extended.sum())} subtitles to {MIN_SUB_DUR} seconds: {timeline.numbers[extended].tolist()}[/bold blue]")
+    if len(timeline) and round(timeline.duration[-1], 3) < MIN_SUB_DUR:
+        rprint(f"[bold red]The last subtitle {timeline.numbers[-1]} duration is less than {MIN_SUB_DUR} seconds, but not extending[/bold red]")
+
+    df = pd.DataFrame({
+        'number': timeline.numbers,
+        'start_time': format_times(timeline.start, sep='.'),
+        'end_time': format_times(timeline.end, sep='.'),
+        'duration': timeline.duration.round(3),
+        'text': timeline.columns['text'],
+        'origin': timeline.columns['origin'],
+    })
 
     ##! No longer perform secondary trim
     # check and trim subtitle length, for twice to ensure the subtitle length is within the limit, 允许tolerance
@@ -133,6 +89,7 @@ def process_srt():
     return df
 
 @check_file_exists(_8_1_AUDIO_TASK)
+@llm_stage("8_1_audio_task")
 def gen_audio_task_main():
     df = process_srt()
     console.print(df)
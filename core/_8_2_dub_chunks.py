@@ -1,11 +1,11 @@
-import datetime
 import re
+import numpy as np
 import pandas as pd
-from core._8_1_audio_task import time_diff_seconds
 from core.asr_backend.audio_preprocess import get_audio_duration
 from core.tts_backend.estimate_duration import init_estimator, estimate_duration
 from core.utils import *
 from core.utils.models import *
+from core.utils.subtitle_timeline import Timeline, parse_times
 
 SRC_SRT = "output/src.srt"
 TRANS_SRT = "output/trans.srt"
@@ -62,17 +62,10 @@ def analyze_subtitle_timing_and_speed(df):
         ESTIMATOR = init_estimator()
     TOLERANCE = load_key("tolerance")
     whole_dur = get_audio_duration(_RAW_AUDIO_FILE)
-    df['gap'] = 0.0  # Initialize gap column
-    for i in range(len(df) - 1):
-        current_end = datetime.datetime.strptime(df.loc[i, 'end_time'], '%H:%M:%S.%f').time()
-        next_start = datetime.datetime.strptime(df.loc[i + 1, 'start_time'], '%H:%M:%S.%f').time()
-        df.loc[i, 'gap'] = time_diff_seconds(current_end, next_start, datetime.date.today())
-    
-    # Set the gap for the last line
-    last_end = datetime.datetime.strptime(df.iloc[-1]['end_time'], '%H:%M:%S.%f').time()
-    last_end_seconds = (last_end.hour * 3600 + last_end.minute * 60 + 
-                       last_end.second + last_end.microsecond / 1000000)
-    df.iloc[-1, df.columns.get_loc('gap')] = whole_dur - last_end_seconds
+    starts = parse_times(df['start_time'].astype(str).tolist())
+    ends = parse_times(df['end_time'].astype(str).tolist())
+    # gap to the next line; the last line's gap runs to the end of the audio
+    df['gap'] = np.append((starts[1:] - ends[:-1]).round(3), whole_dur - ends[-1])
     
     df['tolerance'] = df['gap'].apply(lambda x: TOLERANCE if x > TOLERANCE else x)
     df['tol_dur'] = df['duration'] + df['tolerance']
@@ -140,28 +133,12 @@ def gen_dub_chunks():
     df = process_cutoffs(df)
 
     rprint("[📝 Reading] Loading transcript files...")
-    content = open(TRANS_SRT, "r", encoding="utf-8").read()
-    ori_content = open(SRC_SRT, "r", encoding="utf-8").read()
-    
-    # Process subtitle content
-    content_lines = []
-    ori_content_lines = []
-    
-    # Process translated subtitles
-    for block in content.strip().split('\n\n'):
-        lines = [line.strip() for line in block.split('\n') if line.strip()]
-        if len(lines) >= 3:
-            text = ' '.join(lines[2:])
-            text = re.sub(r'\([^)]*\)|（[^）]*）', '', text).strip().replace('-', '')
-            content_lines.append(text)
-            
-    # Process source subtitles (same structure)
-    for block in ori_content.strip().split('\n\n'):
-        lines = [line.strip() for line in block.split('\n') if line.strip()]
-        if len(lines) >= 3:
-            text = ' '.join(lines[2:])
-            text = re.sub(r'\([^)]*\)|（[^）]*）', '', text).strip().replace('-', '')
-            ori_content_lines.append(text)
+    def clean_line(text):
+        return re.sub(r'\([^)]*\)|（[^）]*）', '', text).strip().replace('-', '')
+
+    # Process translated and source subtitles (same structure)
+    content_lines = [clean_line(t) for t in Timeline.read(TRANS_SRT).text()]
+    ori_content_lines = [clean_line(t) for t in Timeline.read(SRC_SRT).text()]
 
     # Match processing
     df['lines'] = None
@@ -1,9 +1,15 @@
+import os
 import json
 from core.utils import *
+from core.utils.models import _4_1_TERMINOLOGY
+from core.utils.prompt_builder import build_prompt
+from core.utils.term_matcher import get_term_matcher
 
 # ==============================================================================
 # [Version C++ Dynamic] Domain Knowledge Base (Intelligent Logic Edition)
 # ==============================================================================
+# 每个 Prompt 按 静态系统前缀 -> 视频级前缀 -> 单次调用数据 排列 (见 build_prompt)，
+# 静态部分作为 system 消息发送，方便服务端前缀缓存命中。
 
 # 防止网页渲染截断
 J_START = "```json"
@@ -115,32 +121,58 @@ SUBTITLE_CONSTRAINTS = """
 </Subtitle Style Guidelines>
 """
 
+## ================================================================
+# Per-video prefix (summary), shared by every call of a video; one entry per target language namespace
+_VIDEO_PREFIX = {}
+
+def get_video_prefix():
+    """Theme from step 4.1, placed before the per-call payload so it stays cacheable"""
+    path = job_path(_4_1_TERMINOLOGY)
+    if not os.path.exists(path):
+        return None
+    st = os.stat(path)
+    signature = (st.st_mtime_ns, st.st_size)
+    cached = _VIDEO_PREFIX.get(path)
+    if cached is None or cached[0] != signature:
+        with open(path, 'r', encoding='utf-8') as f:
+            terminology = json.load(f)
+        cached = _VIDEO_PREFIX[path] = (signature, f"## Video Theme\n{terminology.get('theme', '')}")
+    return cached[1]
+
+def get_terminology_matcher():
+    """Compiled matcher over terminology.json (None before step 4.1)"""
+    return get_term_matcher(job_path(_4_1_TERMINOLOGY),
+                            word_boundary=load_key("terminology.word_boundary", default=True),
+                            case_fold=load_key("terminology.case_fold", default=True))
+
 ## ================================================================
 # @ step4_splitbymeaning.py
 def get_split_prompt(sentence, num_parts=2, word_limit=20):
     language = load_key("whisper.detected_language")
     json_example = '{\n    "split": [\n        "Part 1 string...",\n        "Part 2 string..."\n    ]\n}'
     
-    return f"""
+    system = f"""
 ## Role
 You are a Netflix subtitle splitter for Chess content in **{language}**.
 
-## Task
-Split the text into a **list of {num_parts} parts**.
-
 ## Critical Rules
 1. **Protect Notation**: NEVER split algebraic notations (e.g., "1. e4", "Nf3").
 2. **Format**: Return a direct JSON List of Strings.
 
-## Input
-"{sentence}"
-
 ## Output Format
 Return ONLY JSON.
 {J_START}
 {json_example}
 {J_END}
-""".strip()
+"""
+    payload = f"""
+## Task
+Split the text into a **list of {num_parts} parts**.
+
+## Input
+"{sentence}"
+"""
+    return build_prompt(system, payload)
 
 ## ================================================================
 # @ step4_1_summarize.py
@@ -148,11 +180,11 @@ def get_summary_prompt(source_content, custom_terms_json=None):
     terms_note = ""
     if custom_terms_json:
         terms_str = "\n".join([f"- {t['src']}: {t['tgt']}" for t in custom_terms_json['terms']])
-        terms_note = f"\n### Forbidden Terms (Already Known)\n{terms_str}"
+        terms_note = f"### Forbidden Terms (Already Known)\n{terms_str}\n\n"
 
     json_example = '{\n  "theme": "Summary here...",\n  "terms": [\n    { "src": "Term", "tgt": "Translation", "note": "Note" }\n  ]\n}'
 
-    return f"""
+    system = f"""
 ## Role
 You are a Chess Content Analyst.
 
@@ -162,20 +194,21 @@ You are a Chess Content Analyst.
 3. **Ignore** common moves (e.g., "e4") or generic terms.
 
 {STATIC_CHESS_RULES}
-{terms_note}
-
-## Input
-{source_content}
 
 ## Output Format
 {J_START}
 {json_example}
 {J_END}
-""".strip()
+"""
+    payload = f"""
+{terms_note}## Input
+{source_content}
+"""
+    return build_prompt(system, payload)
 
 ## ================================================================
 # @ step5_translate.py (BATCH VERSION - CORE)
-def get_batch_translation_prompt(target_lines, context_before, context_after):
+def get_batch_translation_prompt(target_lines, context_before, context_after, hints=None):
     tgt_lang = load_key("target_language")
     
     input_data = {
@@ -186,7 +219,7 @@ def get_batch_translation_prompt(target_lines, context_before, context_after):
     input_json = json.dumps(input_data, indent=2, ensure_ascii=False)
     json_example = '{\n    "translation": [\n        "Translation of line 1",\n        "Translation of line 2"\n    ]\n}'
 
-    return f"""
+    system = f"""
 ## Role
 You are a **Professional Chess Commentator** translating for **{tgt_lang}** audience.
 
@@ -218,11 +251,6 @@ Use `context_previous` and `context_next` to understand the board situation, **c
 {STATIC_CHESS_RULES}
 {SUBTITLE_CONSTRAINTS}
 
-## Input Data (JSON)
-{J_START}
-{input_json}
-{J_END}
-
 ## Output Format
 Return a JSON object containing ONLY the translated list.
 
@@ -230,7 +258,29 @@ Return a JSON object containing ONLY the translated list.
 {json_example}
 {J_END}
 Note: Start with {J_START} and end with {J_END}.
-""".strip()
+"""
+    payload = f"""
+## Input Data (JSON)
+{J_START}
+{input_json}
+{J_END}
+"""
+    # only the glossary terms that occur in this batch, the full list can run into thousands
+    matcher = get_terminology_matcher()
+    terms = matcher.find_many(target_lines) if matcher else []
+    if terms:
+        terms_str = "\n".join(f'- {t["src"]}: {t["tgt"]}' for t in terms)
+        payload += f"""
+## Terminology (use these translations)
+{terms_str}
+"""
+    if hints:
+        hints_str = "\n".join(f'- "{src}" -> "{tgt}"' for src, tgt in hints)
+        payload += f"""
+## Translation Memory (similar or neighbouring lines translated before, reuse the wording where it fits)
+{hints_str}
+"""
+    return build_prompt(system, payload, video_prefix=get_video_prefix())
 
 ## ================================================================
 # @ step6_splitforsub.py
@@ -240,7 +290,7 @@ def get_align_prompt(src_sub, tr_sub, src_part):
     src_part_display = src_part.replace('\n', ' | ')
     json_example = '{\n    "align": [\n        { "src_part": "Source 1", "target_part": "Target 1" },\n        { "src_part": "Source 2", "target_part": "Target 2" }\n    ]\n}'
 
-    return f"""
+    system = f"""
 ## Role
 Subtitle Alignment Expert.
 
@@ -252,46 +302,53 @@ Align the {targ_lang} translation to match the structure of the {src_lang} split
 2. **Timing**: Meaning must match.
 3. **No Trailing Periods**.
 
-## Input Data
-Source Full: "{src_sub}"
-Translation Full: "{tr_sub}"
-Split Structure: "{src_part_display}"
-
 ## Output Format
 {J_START}
 {json_example}
 {J_END}
-""".strip()
+"""
+    payload = f"""
+## Input Data
+Source Full: "{src_sub}"
+Translation Full: "{tr_sub}"
+Split Structure: "{src_part_display}"
+"""
+    return build_prompt(system, payload)
 
 ## ================================================================
 # @ step8 & step10 (Audio Generation)
 def get_subtitle_trim_prompt(text, duration):
     json_example = '{\n    "result": "Optimized text"\n}'
     
-    return f"""
+    system = f"""
 ## Role
 Subtitle Editor.
 
 ## Task
-Shorten the subtitle to fit {duration} seconds.
+Shorten the subtitle to fit the given duration.
 1. Remove filler words.
 2. **Keep Chess Moves (e.g. "e4") UNTOUCHED.**
 
-## Input
-"{text}"
-
 ## Output Format
 {J_START}
 {json_example}
 {J_END}
-""".strip()
+"""
+    payload = f"""
+## Duration
+{duration} seconds
+
+## Input
+"{text}"
+"""
+    return build_prompt(system, payload)
 
 ## ================================================================
 # @ tts_main
 def get_correct_text_prompt(text):
     json_example = '{\n    "text": "Cleaned text"\n}'
     
-    return f"""
+    system = f"""
 ## Role
 Text Cleaner for TTS.
 
@@ -300,11 +357,13 @@ Text Cleaner for TTS.
 2. **Keep Chess Moves (e.g., "Nf3") EXACTLY AS IS.**
 3. Pronunciation: Convert "1." to "one dot" ONLY if it helps pronunciation.
 
-## Input
-"{text}"
-
 ## Output Format
 {J_START}
 {json_example}
 {J_END}
-""".strip()
\ No newline at end of file
+"""
+    payload = f"""
+## Input
+"{text}"
+"""
+    return build_prompt(system, payload)
@@ -7,6 +7,7 @@ from time import sleep
 import streamlit as st
 from core._1_ytdlp import download_video_ytdlp, find_video_files
 from core.utils import *
+from core.utils.gpt_cache import GPT_CACHE
 from translations.translations import translate as t
 
 OUTPUT_DIR = "output"
@@ -20,6 +21,7 @@ def download_video_section():
             if st.button(t("Delete and Reselect"), key="delete_video_button"):
                 os.remove(video_file)
                 if os.path.exists(OUTPUT_DIR):
+                    GPT_CACHE.close_all()
                     shutil.rmtree(OUTPUT_DIR)
                 sleep(1)
                 st.rerun()
@@ -48,6 +50,7 @@ def download_video_section():
             uploaded_file = st.file_uploader(t("Or upload video"), type=load_key("allowed_video_formats") + load_key("allowed_audio_formats"))
             if uploaded_file:
                 if os.path.exists(OUTPUT_DIR):
+                    GPT_CACHE.close_all()
                     shutil.rmtree(OUTPUT_DIR)
                 os.makedirs(OUTPUT_DIR, exist_ok=True)
                 
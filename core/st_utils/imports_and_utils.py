@@ -45,6 +45,8 @@ print("🔥 全局兼容性补丁已应用 (VideoLingo 50Fix)")
 import os
 import streamlit as st
 import io, zipfile
+import pandas as pd
+from core.utils.llm_stats import load_run_summary
 from core.st_utils.download_video_section import download_video_section
 from core.st_utils.sidebar_setting import page_setting
 from translations.translations import translate as t
@@ -69,6 +71,16 @@ def download_subtitle_zip_button(text: str):
         mime="application/zip"
     )
 
+def llm_usage_expander(text: str):
+    """Per-stage tokens / latency / cost from output/log/llm_run_summary.json"""
+    summary = load_run_summary()
+    if not summary:
+        return
+    with st.expander(text):
+        st.json(summary["totals"])
+        st.dataframe(pd.DataFrame(summary["by_stage"]).T)
+        st.dataframe(pd.DataFrame(summary["by_log_title"]).T)
+
 # st.markdown
 give_star_button = """
 <style>
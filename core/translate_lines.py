@@ -1,26 +1,26 @@
 import json
 import time
+import asyncio
 from rich.console import Console
 # 1. 正确导入 Prompt 接口
 from core.prompts import get_batch_translation_prompt
 # 2. 动态导入 LLM 调用函数
 try:
-    from core.ask_gpt import ask_gpt
+    from core.ask_gpt import ask_gpt, ask_gpt_async, ask_gpt_once, ask_gpt_async_once
 except ImportError:
-    from core.utils.ask_gpt import ask_gpt
+    from core.utils.ask_gpt import ask_gpt, ask_gpt_async, ask_gpt_once, ask_gpt_async_once
+from core.utils.decorator import except_handler, async_except_handler
+from core.utils.json_stream import array_length_guard
+from core.utils.config_utils import ContextThreadPoolExecutor
 
 console = Console()
 
-def translate_batch_lines(lines, context_before, context_after, chunk_index=0):
-    """
-    对一组字幕行进行 Batch 翻译 (Version C + 自动降级)
-    """
-    # ==========================
-    # 策略 1: 尝试批量翻译 (Batch Mode)
-    # ==========================
-    prompt = get_batch_translation_prompt(lines, context_before, context_after)
-    
-    # 定义验证函数：检查行数是否一致
+# 二分的每一段只请求一次，失败就继续拆分，不走 ask_gpt 的 5 次重试；拆到单行时再多给一次机会
+_ask_line = except_handler("GPT request failed", retry=1, jitter=True)(ask_gpt_once)
+_ask_line_async = async_except_handler("GPT request failed", retry=1, jitter=True)(ask_gpt_async_once)
+
+def make_length_validator(lines):
+    """验证函数：检查行数是否一致"""
     def valid_length(response_data):
         if 'translation' not in response_data:
             return {"status": "error", "message": "Missing 'translation' key"}
@@ -32,52 +32,161 @@ def translate_batch_lines(lines, context_before, context_after, chunk_index=0):
                 "message": f"Length mismatch: Input {len(lines)} vs Output {len(response_data['translation'])}"
             }
         return {"status": "success", "message": "Valid"}
+    return valid_length
+
+def valid_single_line(r):
+    if len(r.get('translation', [])) == 1:
+        return {"status": "success", "message": ""}
+    return {"status": "error", "message": "1:1 check failed"}
+
+def span_prompt(lines, lo, hi, context_before, context_after, hints=None):
+    """构造 lines[lo:hi] 的 Batch Prompt，本 Batch 里前后的行并入上下文"""
+    # 上文 = 原始上文 + 本 Batch 中已经在这一段之前的行
+    current_context_before = context_before + lines[:lo]
+    # 下文 = 本 Batch 中这一段之后的行 + 原始下文
+    current_context_after = lines[hi:] + context_after
+    return get_batch_translation_prompt(lines[lo:hi], current_context_before, current_context_after, hints)
+
+def _span_call(lines, lo, hi, context_before, context_after, chunk_index, hints=None):
+    """lines[lo:hi] 的 ask_gpt 参数；单行沿用 serial_ 日志名"""
+    if hi - lo == 1:
+        valid_def, log_title = valid_single_line, f'serial_{chunk_index}_{lo}'
+    else:
+        valid_def, log_title = make_length_validator(lines[lo:hi]), f'bisect_{chunk_index}_{lo}_{hi}'
+    return dict(
+        prompt=span_prompt(lines, lo, hi, context_before, context_after, hints),
+        resp_type='json',
+        valid_def=valid_def,
+        log_title=log_title,
+        stream_guard=array_length_guard('translation', hi - lo)
+    )
+
+def translate_batch_lines(lines, context_before, context_after, chunk_index=0, on_batch_result=None, hints=None):
+    """
+    对一组字幕行进行 Batch 翻译 (Version C + 二分降级)
+    on_batch_result(ok): 可选回调，告知整批是否一次通过 (供 ChunkPlanner 调整批大小)
+    hints: 可选 [(原文, 译文)]，翻译记忆中的相似句，作为参考写进 Prompt
+    """
+    # 单行 (或空) 的 Batch 没什么可拆的，直接走单行请求
+    if len(lines) <= 1:
+        return _bisect(lines, 0, len(lines), context_before, context_after, chunk_index, hints)
+
+    # ==========================
+    # 策略 1: 尝试批量翻译 (Batch Mode)
+    # ==========================
+    prompt = get_batch_translation_prompt(lines, context_before, context_after, hints)
+    valid_length = make_length_validator(lines)
 
     try:
-        # 调用 LLM，尝试 2 次 (减少重试次数，避免触发 Rate Limit)
-        # 如果 Batch 失败，尽快降级到串行，不要死磕
         response = ask_gpt(
             prompt, 
             resp_type='json', 
             valid_def=valid_length, 
-            log_title=f'batch_trans_{chunk_index}'
+            log_title=f'batch_trans_{chunk_index}',
+            stream_guard=array_length_guard('translation', len(lines))
         )
+        if on_batch_result:
+            on_batch_result(True)
         return response['translation']
 
     except Exception as e:
         # 如果 Batch 模式彻底失败（通常是因为模型非要合并行），进入降级模式
+        if on_batch_result:
+            on_batch_result(False)
         console.print(f"[bold red]❌ Chunk {chunk_index} Batch failed: {e}[/bold red]")
-        console.print(f"[yellow]🔄 Falling back to Serial Translation (Line-by-Line) for Chunk {chunk_index}...[/yellow]")
+        console.print(f"[yellow]🔄 Falling back to Bisection for Chunk {chunk_index}...[/yellow]")
 
     # ==========================
-    # 策略 2: 降级为逐行翻译 (Serial Fallback)
+    # 策略 2: 二分降级 (Bisection Fallback)
     # ==========================
-    # 既然批量对齐失败，我们就一行一行翻，虽然慢，但绝对稳。
-    
-    fallback_result = []
-    
-    for i, line in enumerate(lines):
-        # 构造这一行的专属上下文
-        # 上文 = 原始上文 + 本 Batch 中已经在这一行之前的行
-        current_context_before = context_before + lines[:i]
-        # 下文 = 本 Batch 中这一行之后的行 + 原始下文
-        current_context_after = lines[i+1:] + context_after
-        
-        # 构造一个只有 1 行的 Batch Prompt (这就变成了单行翻译)
-        single_prompt = get_batch_translation_prompt([line], current_context_before, current_context_after)
-        
-        try:
-            # 这里的 valid_def 依然检查长度（必须是1）
-            single_resp = ask_gpt(
-                single_prompt,
-                resp_type='json',
-                valid_def=lambda r: {"status": "success", "message": ""} if len(r.get('translation', [])) == 1 else {"status": "error", "message": "1:1 check failed"},
-                log_title=f'serial_{chunk_index}_{i}'
-            )
-            fallback_result.extend(single_resp['translation'])
-        except Exception as e_single:
-            console.print(f"[red]❌ Line {i} failed in serial mode: {e_single}. Using source text.[/red]")
+    # 通常只有一两行被模型合并，把失败的一段对半拆开、两半并发重试，
+    # 只有拆到单行还失败时才用原文兜底。10 行的 Chunk 一般 3~4 次调用就能完成。
+    return _bisect_halves(lines, 0, len(lines), context_before, context_after, chunk_index, hints)
+
+def _bisect(lines, lo, hi, context_before, context_after, chunk_index, hints=None):
+    if hi <= lo:
+        return []
+    try:
+        ask = _ask_line if hi - lo == 1 else ask_gpt_once
+        return ask(**_span_call(lines, lo, hi, context_before, context_after, chunk_index, hints))['translation']
+    except Exception as e:
+        if hi - lo == 1:
+            console.print(f"[red]❌ Line {lo} failed in serial mode: {e}. Using source text.[/red]")
             # 最后的最后，如果单行也翻不出来（极罕见），才用原文兜底
-            fallback_result.append(line)
-            
-    return fallback_result
\ No newline at end of file
+            return [lines[lo]]
+        console.print(f"[yellow]✂️ Chunk {chunk_index} lines {lo}-{hi - 1} failed, splitting in half[/yellow]")
+    return _bisect_halves(lines, lo, hi, context_before, context_after, chunk_index, hints)
+
+def _bisect_halves(lines, lo, hi, context_before, context_after, chunk_index, hints=None):
+    mid = (lo + hi) // 2
+    with ContextThreadPoolExecutor(max_workers=2) as executor:
+        left = executor.submit(_bisect, lines, lo, mid, context_before, context_after, chunk_index, hints)
+        right = executor.submit(_bisect, lines, mid, hi, context_before, context_after, chunk_index, hints)
+        return left.result() + right.result()
+
+async def translate_batch_lines_async(lines, context_before, context_after, chunk_index=0, on_batch_result=None, hints=None):
+    """translate_batch_lines 的异步版本，二分降级的两半并发翻译"""
+    if len(lines) <= 1:
+        return await _bisect_async(lines, 0, len(lines), context_before, context_after, chunk_index, hints)
+    prompt = get_batch_translation_prompt(lines, context_before, context_after, hints)
+    try:
+        response = await ask_gpt_async(
+            prompt,
+            resp_type='json',
+            valid_def=make_length_validator(lines),
+            log_title=f'batch_trans_{chunk_index}',
+            stream_guard=array_length_guard('translation', len(lines))
+        )
+        if on_batch_result:
+            on_batch_result(True)
+        return response['translation']
+    except Exception as e:
+        if on_batch_result:
+            on_batch_result(False)
+        console.print(f"[bold red]❌ Chunk {chunk_index} Batch failed: {e}[/bold red]")
+        console.print(f"[yellow]🔄 Falling back to Bisection for Chunk {chunk_index}...[/yellow]")
+
+    return await _bisect_halves_async(lines, 0, len(lines), context_before, context_after, chunk_index, hints)
+
+async def _bisect_async(lines, lo, hi, context_before, context_after, chunk_index, hints=None):
+    if hi <= lo:
+        return []
+    try:
+        ask = _ask_line_async if hi - lo == 1 else ask_gpt_async_once
+        return (await ask(**_span_call(lines, lo, hi, context_before, context_after, chunk_index, hints)))['translation']
+    except Exception as e:
+        if hi - lo == 1:
+            console.print(f"[red]❌ Line {lo} failed in serial mode: {e}. Using source text.[/red]")
+            return [lines[lo]]
+        console.print(f"[yellow]✂️ Chunk {chunk_index} lines {lo}-{hi - 1} failed, splitting in half[/yellow]")
+    return await _bisect_halves_async(lines, lo, hi, context_before, context_after, chunk_index, hints)
+
+async def _bisect_halves_async(lines, lo, hi, context_before, context_after, chunk_index, hints=None):
+    mid = (lo + hi) // 2
+    left, right = await asyncio.gather(
+        _bisect_async(lines, lo, mid, context_before, context_after, chunk_index, hints),
+        _bisect_async(lines, mid, hi, context_before, context_after, chunk_index, hints),
+    )
+    return left + right
+
+if __name__ == "__main__":
+    # 回归检查：一直失败的单行 Chunk 只请求有限次，最后用原文兜底 (不会无限二分出空段)
+    calls = []
+    def _always_fail(*args, **kwargs):
+        calls.append(kwargs.get('log_title'))
+        if len(calls) > 20:
+            raise SystemExit(f"runaway bisection: {calls}")
+        raise ValueError("always fails")
+    async def _always_fail_async(*args, **kwargs):
+        return _always_fail(*args, **kwargs)
+    ask_gpt, ask_gpt_once, _ask_line = _always_fail, _always_fail, _always_fail
+    ask_gpt_async, ask_gpt_async_once, _ask_line_async = _always_fail_async, _always_fail_async, _always_fail_async
+    assert translate_batch_lines(["only line"], [], [], chunk_index=7) == ["only line"], calls
+    assert calls == ['serial_7_0'], calls
+    calls.clear()
+    assert asyncio.run(translate_batch_lines_async(["only line"], [], [], chunk_index=7)) == ["only line"], calls
+    assert calls == ['serial_7_0'], calls
+    calls.clear()
+    assert translate_batch_lines(["a", "b", "c"], [], [], chunk_index=8) == ["a", "b", "c"], calls
+    assert all(not t.endswith(('_0_0', '_1_1', '_2_2', '_3_3')) for t in calls), calls
+    print("ok")
@@ -1,124 +1,100 @@
-import os
-import json
-import shutil
-import tempfile
-from threading import Lock
+import time
+import asyncio
+import sqlite3
+import threading
+import contextvars
+import concurrent.futures
 import json_repair
-from openai import OpenAI
 from core.utils.config_utils import load_key
+from core.utils.gpt_cache import GPT_CACHE, get_global_cache, cache_key
 from rich import print as rprint
-from core.utils.decorator import except_handler
+from core.utils.decorator import except_handler, async_except_handler
+from core.utils.rate_limiter import LLM_LIMITER
+from core.utils.llm_stats import LLM_STATS, log_title_family
+from core.utils.scheduling import HEDGER, call_hedged, call_hedged_async
+from core.utils.prompt_builder import prompt_messages
+from core.utils.llm_router import LLM_ROUTER
 
 # ==============================================================================
 # Global Configuration & Singletons
 # ==============================================================================
 
-LOCK = Lock()
-GPT_LOG_FOLDER = 'output/gpt_log'
-_GLOBAL_CLIENT = None  # Lazy load client
-
 def get_client():
-    """单例模式获取 OpenAI Client"""
-    global _GLOBAL_CLIENT
-    if _GLOBAL_CLIENT is None:
-        base_url = load_key("api.base_url")
-        # 智能处理 Base URL
-        if 'ark.cn-beijing.volces.com' in base_url:
-            pass 
-        elif 'v1' not in base_url and 'volces' not in base_url:
-            base_url = base_url.strip('/') + '/v1'
-            
-        _GLOBAL_CLIENT = OpenAI(
-            api_key=load_key("api.key"), 
-            base_url=base_url,
-            timeout=300
-        )
-    return _GLOBAL_CLIENT
+    """OpenAI client of the main endpoint (`api.*`); ask_gpt picks its endpoint through LLM_ROUTER"""
+    return LLM_ROUTER.routes()[0].client()
 
-# ==============================================================================
-# Cache System (Atomic Writes)
-# ==============================================================================
+def _check_api_key(routes):
+    if not any(route.key for route in routes):
+        raise ValueError("API key is not set")
 
-def _load_cache(prompt, resp_type, log_title):
-    file = os.path.join(GPT_LOG_FOLDER, f"{log_title}.json")
-    if not os.path.exists(file):
-        return False
-    try:
-        with LOCK:
-            with open(file, 'r', encoding='utf-8') as f:
-                data = json.load(f)
-            # 倒序查找最新结果
-            for item in reversed(data):
-                if item["prompt"] == prompt and item["resp_type"] == resp_type:
-                    return item["resp"]
-    except (json.JSONDecodeError, OSError):
-        rprint(f"[yellow]⚠️ Cache file {file} is corrupted, ignoring cache.[/yellow]")
-        return False
-    return False
-
-def _save_cache(model, prompt, resp_content, resp_type, resp, message=None, log_title="default"):
-    with LOCK:
-        file = os.path.join(GPT_LOG_FOLDER, f"{log_title}.json")
-        os.makedirs(os.path.dirname(file), exist_ok=True)
-        logs = []
-        if os.path.exists(file):
-            try:
-                with open(file, 'r', encoding='utf-8') as f:
-                    logs = json.load(f)
-            except json.JSONDecodeError:
-                logs = []
-        logs.append({
-            "model": model, "prompt": prompt, "resp_content": resp_content, 
-            "resp_type": resp_type, "resp": resp, "message": message
-        })
-        # 原子写入防止损坏
-        temp_path = None
-        try:
-            fd, temp_path = tempfile.mkstemp(dir=os.path.dirname(file), text=True)
-            with os.fdopen(fd, 'w', encoding='utf-8') as f:
-                json.dump(logs, f, ensure_ascii=False, indent=4)
-            shutil.move(temp_path, file)
-        except Exception as e:
-            if temp_path and os.path.exists(temp_path):
-                os.remove(temp_path)
+def _cache_routes(candidates):
+    """Routes whose cached answers may serve a call: only the route it goes to first, so a failover
+    model's answer is not reused once the main route is back; every route with `llm_router.share_cache`"""
+    if load_key("llm_router.share_cache", default=False):
+        return LLM_ROUTER.routes()
+    return candidates[:1]
+
+def _load_routed_cache(routes, prompt, resp_type, log_title):
+    """Cache entries are keyed per route (see Route.cache_model); the first hit among `routes` wins"""
+    for route in routes:
+        cached = _load_cache(route.cache_model, prompt, resp_type, log_title)
+        if cached:
+            return cached
+    return None
 
 # ==============================================================================
-# Main GPT Function
+# Cache System (indexed, append-only)
 # ==============================================================================
 
-@except_handler("GPT request failed", retry=5)
-def ask_gpt(prompt, resp_type=None, valid_def=None, log_title="default"):
-    if not load_key("api.key"):
-        raise ValueError("API key is not set")
-
-    # 1. Check Cache
-    cached = _load_cache(prompt, resp_type, log_title)
+def _load_cache(model, prompt, resp_type, log_title="default"):
+    try:
+        cached = GPT_CACHE.get(model, prompt, resp_type)
+    except sqlite3.Error as e:
+        rprint(f"[yellow]⚠️ Cache db {GPT_CACHE.db_path} unreadable ({e}), ignoring cache.[/yellow]")
+        cached = None
     if cached:
-        rprint("[dim]Use cache response[/dim]")
         return cached
 
-    client = get_client()
-    model = load_key("api.model")
-    use_json_mode = (resp_type == "json") and load_key("api.llm_support_json")
-    response_format = {"type": "json_object"} if use_json_mode else None
-    
-    # 2. API Call
+    # fall back to the cross-run cache, and keep this run's gpt_log complete
+    global_cache = get_global_cache()
+    if global_cache is None:
+        return None
     try:
-        resp_raw = client.chat.completions.create(
-            model=model, messages=[{"role": "user", "content": prompt}],
-            response_format=response_format,
-            temperature=0.3
-        )
-    except Exception as e:
-        raise e # Network error -> Retry
+        cached = global_cache.get(model, prompt, resp_type)
+    except sqlite3.Error as e:
+        rprint(f"[yellow]⚠️ Global cache {global_cache.db_path} unreadable ({e}), ignoring it.[/yellow]")
+        return None
+    if cached:
+        _save_cache(model, prompt, None, resp_type, cached, log_title=log_title, to_global=False)
+    return cached
 
-    resp_content = resp_raw.choices[0].message.content
+def _save_cache(model, prompt, resp_content, resp_type, resp, message=None, log_title="default", to_global=True):
+    try:
+        if log_title == "error":
+            GPT_CACHE.log_error(model, prompt, resp_content, resp_type, resp, message)
+        else:
+            GPT_CACHE.put(model, prompt, resp_content, resp_type, resp, log_title=log_title)
+    except sqlite3.Error as e:
+        rprint(f"[yellow]⚠️ Failed to write cache db {GPT_CACHE.db_path}: {e}[/yellow]")
 
+    global_cache = get_global_cache() if to_global and log_title != "error" else None
+    if global_cache is not None:
+        try:
+            global_cache.put(model, prompt, resp_type, resp, log_title=log_title)
+        except sqlite3.Error as e:
+            rprint(f"[yellow]⚠️ Failed to write global cache {global_cache.db_path}: {e}[/yellow]")
+
+# ==============================================================================
+# Main GPT Function
+# ==============================================================================
+
+def _parse_and_validate(model, prompt, resp_content, resp_type, valid_def, log_title):
     # 3. Parse
     if resp_type == "json":
         try:
             resp = json_repair.loads(resp_content)
         except Exception:
+            LLM_STATS.record_validation_failure(log_title)
             _save_cache(model, prompt, resp_content, resp_type, None, message="JSON Parse Error", log_title="error")
             raise ValueError(f"❎ JSON Parse Error: {resp_content[:50]}...")
     else:
@@ -129,14 +105,337 @@ def ask_gpt(prompt, resp_type=None, valid_def=None, log_title="default"):
         try:
             valid_resp = valid_def(resp)
             if valid_resp['status'] != 'success':
+                LLM_STATS.record_validation_failure(log_title)
                 _save_cache(model, prompt, resp_content, resp_type, resp, message=valid_resp['message'], log_title="error")
                 raise ValueError(f"❎ Validation Error: {valid_resp['message']}")
         except ValueError as ve:
             raise ve
         except Exception as e:
+            LLM_STATS.record_validation_failure(log_title)
             _save_cache(model, prompt, resp_content, resp_type, resp, message=str(e), log_title="error")
             raise ValueError(f"Validation Crash: {str(e)}")
 
     # 5. Success
     _save_cache(model, prompt, resp_content, resp_type, resp, log_title=log_title)
-    return resp
\ No newline at end of file
+    return resp
+
+# ==============================================================================
+# In-flight Coalescing (identical prompts share one request)
+# ==============================================================================
+
+_INFLIGHT = {}
+_INFLIGHT_LOCK = threading.Lock()
+COALESCE_STATS = {"coalesced": 0}
+
+def _join_inflight(key):
+    """Return (is_leader, future). Followers wait on the leader's future instead of calling the API"""
+    with _INFLIGHT_LOCK:
+        shared = _INFLIGHT.get(key)
+        if shared is not None:
+            COALESCE_STATS["coalesced"] += 1
+            return False, shared
+        shared = _INFLIGHT[key] = concurrent.futures.Future()
+        return True, shared
+
+def _finish_inflight(key, shared, resp=None, error=None):
+    with _INFLIGHT_LOCK:
+        _INFLIGHT.pop(key, None)
+    if error is not None:
+        shared.set_exception(error)
+    else:
+        shared.set_result(resp)
+
+def _check_shared(resp, valid_def):
+    """The leader validated with its own valid_def; re-check with the follower's"""
+    if valid_def:
+        valid_resp = valid_def(resp)
+        if valid_resp['status'] != 'success':
+            raise ValueError(f"❎ Validation Error: {valid_resp['message']}")
+    rprint("[dim]Use coalesced response[/dim]")
+    return resp
+
+def get_coalesce_stats():
+    with _INFLIGHT_LOCK:
+        return dict(COALESCE_STATS, in_flight=len(_INFLIGHT))
+
+# ==============================================================================
+# Streaming (early abort on a violated contract)
+# ==============================================================================
+
+def _use_stream(stream_guard):
+    return stream_guard is not None and bool(load_key("api.stream", default=False))
+
+def _completion_kwargs(model, prompt, resp_type, stream=False, json_mode=True):
+    use_json_mode = (resp_type == "json") and json_mode
+    kwargs = dict(model=model, messages=prompt_messages(prompt),
+                  response_format={"type": "json_object"} if use_json_mode else None,
+                  temperature=0.3)
+    if stream:
+        kwargs.update(stream=True, stream_options={"include_usage": True})
+    return kwargs
+
+class _StreamState:
+    """Accumulates streamed deltas, feeding each one to the guard's checker"""
+    def __init__(self, stream_guard, start):
+        self.check = stream_guard()
+        self.start = start
+        self.parts = []
+        self.usage = None
+        self.ttft = None
+        self.violation = None
+
+    def on_chunk(self, chunk):
+        """Return False once the guard rejects the output, the caller then stops reading"""
+        if getattr(chunk, 'usage', None) is not None:
+            self.usage = chunk.usage
+        if not chunk.choices:
+            return True
+        delta = chunk.choices[0].delta.content
+        if not delta:
+            return True
+        if self.ttft is None:
+            self.ttft = time.monotonic() - self.start
+        self.parts.append(delta)
+        self.violation = self.check(delta)
+        return self.violation is None
+
+    @property
+    def content(self):
+        return ''.join(self.parts)
+
+def _stream_aborted(model, prompt, resp_type, log_title, state, latency, queue_wait):
+    LLM_STATS.record_request(log_title, state.usage, latency, queue_wait, ttft=state.ttft, aborted=True)
+    LLM_STATS.record_validation_failure(log_title)
+    _save_cache(model, prompt, state.content, resp_type, None, message=f"Stream aborted: {state.violation}", log_title="error")
+    rprint(f"[yellow]✂️ Stream aborted after {len(state.content)} chars: {state.violation}[/yellow]")
+    return ValueError(f"❎ Validation Error: {state.violation}")
+
+def _failover(route, candidates, error):
+    """True if another route is left to try after `route` failed with `error`"""
+    opened = LLM_ROUTER.report_failure(route)
+    if opened:
+        rprint(f"[yellow]⛔ Route '{route.name}' keeps failing, skipping it for a while[/yellow]")
+    if route is candidates[-1]:
+        return False
+    rprint(f"[yellow]🔀 Route '{route.name}' failed ({type(error).__name__}), failing over ...[/yellow]")
+    return True
+
+def _request(prompt, resp_type, valid_def, log_title, stream_guard=None, candidates=None):
+    # API errors fail over to the next healthy route at once, instead of waiting in the retry back-off
+    candidates = candidates or LLM_ROUTER.candidates()
+    for route in candidates:
+        try:
+            resp_content, aborted, latency, queue_wait = _call_route(route, prompt, resp_type, log_title, stream_guard)
+            break
+        except Exception as e:
+            if not _failover(route, candidates, e):
+                raise
+    LLM_ROUTER.report_success(route, latency)
+    if aborted is not None:
+        raise _stream_aborted(route.cache_model, prompt, resp_type, log_title, aborted, latency, queue_wait)
+    return _parse_and_validate(route.cache_model, prompt, resp_content, resp_type, valid_def, log_title)
+
+def _call_route(route, prompt, resp_type, log_title, stream_guard):
+    """One API call to `route`: (content, aborted stream state or None, latency, queue wait)"""
+    client = route.client()
+    stream = _use_stream(stream_guard)
+    
+    # 2. API Call (through the process-wide rate limiter)
+    try:
+        with LLM_LIMITER.slot(prompt) as slot:
+            start = time.monotonic()
+            aborted = None
+            if stream:
+                state = _StreamState(stream_guard, start)
+                resp_stream = client.chat.completions.create(**_completion_kwargs(route.model, prompt, resp_type, stream=True, json_mode=route.json_mode))
+                try:
+                    for chunk in resp_stream:
+                        if not state.on_chunk(chunk):
+                            break
+                finally:
+                    # closing the response stops generation (and billing) on the server side
+                    resp_stream.close()
+                usage, resp_content, ttft = state.usage, state.content, state.ttft
+                # the request itself went fine, only the output is unusable: no limiter back-off
+                if state.violation:
+                    aborted = state
+            else:
+                kwargs = _completion_kwargs(route.model, prompt, resp_type, json_mode=route.json_mode)
+                resp_raw = call_hedged(lambda: client.chat.completions.create(**kwargs),
+                                       log_title_family(log_title), slot.est_tokens)
+                usage, resp_content, ttft = resp_raw.usage, resp_raw.choices[0].message.content, None
+            slot.record_usage(usage)
+    except Exception:
+        LLM_STATS.record_error(log_title)
+        raise
+    latency = time.monotonic() - start
+    if aborted is None:
+        HEDGER.observe(log_title_family(log_title), latency)
+        LLM_STATS.record_request(log_title, usage, latency, slot.queue_wait, ttft=ttft)
+    return resp_content, aborted, latency, slot.queue_wait
+
+@except_handler("GPT request failed", retry=5, jitter=True)
+def ask_gpt(prompt, resp_type=None, valid_def=None, log_title="default", stream_guard=None):
+    """`stream_guard`: optional factory (see core.utils.json_stream) returning a checker that is fed
+    each streamed delta and returns an error message once the output can no longer pass `valid_def`.
+    Only used when `api.stream` is enabled."""
+    routes = LLM_ROUTER.routes()
+    _check_api_key(routes)
+    # the route order is drawn up front, so the cache lookup matches the route that will answer
+    candidates = LLM_ROUTER.candidates()
+    cache_routes = _cache_routes(candidates)
+
+    # 1. Check Cache
+    cached = _load_routed_cache(cache_routes, prompt, resp_type, log_title)
+    if cached:
+        LLM_STATS.record_cache_hit(log_title)
+        rprint("[dim]Use cache response[/dim]")
+        return cached
+
+    # one in-flight request per prompt, whichever route answers it
+    key = cache_key(candidates[0].cache_model, prompt, resp_type)
+    is_leader, shared = _join_inflight(key)
+    if not is_leader:
+        LLM_STATS.record_coalesced(log_title)
+        return _check_shared(shared.result(), valid_def)
+    try:
+        # a leader that just finished may have filled the cache between our miss and our join
+        resp = (_load_routed_cache(cache_routes, prompt, resp_type, log_title)
+                or _request(prompt, resp_type, valid_def, log_title, stream_guard, candidates))
+    except Exception as e:
+        _finish_inflight(key, shared, error=e)
+        raise
+    _finish_inflight(key, shared, resp)
+    return resp
+
+# a single attempt without the retry back-off, for callers that recover on their own (batch bisection)
+ask_gpt_once = ask_gpt.__wrapped__
+
+# ==============================================================================
+# Async Engine (one event loop, one pooled AsyncOpenAI client)
+# ==============================================================================
+
+_LOOP = None
+_LOOP_LOCK = threading.Lock()
+
+def get_async_client():
+    """AsyncOpenAI client of the main endpoint; each route's client lives on the engine loop and its
+    connection pool is shared by all stages"""
+    return LLM_ROUTER.routes()[0].async_client()
+
+def _get_loop():
+    global _LOOP
+    with _LOOP_LOCK:
+        if _LOOP is None:
+            _LOOP = asyncio.new_event_loop()
+            threading.Thread(target=_LOOP.run_forever, name="llm-event-loop", daemon=True).start()
+        return _LOOP
+
+def run_async(coro):
+    """Run `coro` on the shared engine loop and block until it finishes.
+
+    The caller's contextvars (e.g. the job config overlay) are carried into the task.
+    """
+    loop = _get_loop()
+    ctx = contextvars.copy_context()
+    result = concurrent.futures.Future()
+
+    def _on_done(task):
+        if task.cancelled():
+            result.cancel()
+        elif task.exception() is not None:
+            result.set_exception(task.exception())
+        else:
+            result.set_result(task.result())
+
+    def _start():
+        task = ctx.run(loop.create_task, coro)
+        task.add_done_callback(_on_done)
+
+    loop.call_soon_threadsafe(_start)
+    return result.result()
+
+def use_async_engine():
+    return bool(load_key("llm_async.enabled", default=False))
+
+async def _request_async(prompt, resp_type, valid_def, log_title, stream_guard=None, candidates=None):
+    candidates = candidates or LLM_ROUTER.candidates()
+    for route in candidates:
+        try:
+            resp_content, aborted, latency, queue_wait = await _call_route_async(route, prompt, resp_type, log_title, stream_guard)
+            break
+        except Exception as e:
+            if not _failover(route, candidates, e):
+                raise
+    LLM_ROUTER.report_success(route, latency)
+    # cache and error-log writes are SQLite commits, keep them off the event loop
+    if aborted is not None:
+        raise await asyncio.to_thread(_stream_aborted, route.cache_model, prompt, resp_type, log_title, aborted, latency, queue_wait)
+    return await asyncio.to_thread(_parse_and_validate, route.cache_model, prompt, resp_content, resp_type, valid_def, log_title)
+
+async def _call_route_async(route, prompt, resp_type, log_title, stream_guard):
+    client = route.async_client()
+    stream = _use_stream(stream_guard)
+
+    try:
+        async with LLM_LIMITER.slot_async(prompt) as slot:
+            start = time.monotonic()
+            aborted = None
+            if stream:
+                state = _StreamState(stream_guard, start)
+                resp_stream = await client.chat.completions.create(**_completion_kwargs(route.model, prompt, resp_type, stream=True, json_mode=route.json_mode))
+                try:
+                    async for chunk in resp_stream:
+                        if not state.on_chunk(chunk):
+                            break
+                finally:
+                    await resp_stream.close()
+                usage, resp_content, ttft = state.usage, state.content, state.ttft
+                # the request itself went fine, only the output is unusable: no limiter back-off
+                if state.violation:
+                    aborted = state
+            else:
+                kwargs = _completion_kwargs(route.model, prompt, resp_type, json_mode=route.json_mode)
+                resp_raw = await call_hedged_async(lambda: client.chat.completions.create(**kwargs),
+                                                   log_title_family(log_title), slot.est_tokens)
+                usage, resp_content, ttft = resp_raw.usage, resp_raw.choices[0].message.content, None
+            slot.record_usage(usage)
+    except Exception:
+        LLM_STATS.record_error(log_title)
+        raise
+    latency = time.monotonic() - start
+    if aborted is None:
+        HEDGER.observe(log_title_family(log_title), latency)
+        LLM_STATS.record_request(log_title, usage, latency, slot.queue_wait, ttft=ttft)
+    return resp_content, aborted, latency, slot.queue_wait
+
+@async_except_handler("GPT request failed", retry=5, jitter=True)
+async def ask_gpt_async(prompt, resp_type=None, valid_def=None, log_title="default", stream_guard=None):
+    """ask_gpt for coroutines running on the engine loop (see run_async)"""
+    routes = LLM_ROUTER.routes()
+    _check_api_key(routes)
+    candidates = LLM_ROUTER.candidates()
+    cache_routes = _cache_routes(candidates)
+
+    # SQLite lookups (run cache, then global cache) block, run them in a worker thread
+    cached = await asyncio.to_thread(_load_routed_cache, cache_routes, prompt, resp_type, log_title)
+    if cached:
+        LLM_STATS.record_cache_hit(log_title)
+        rprint("[dim]Use cache response[/dim]")
+        return cached
+
+    key = cache_key(candidates[0].cache_model, prompt, resp_type)
+    is_leader, shared = _join_inflight(key)
+    if not is_leader:
+        LLM_STATS.record_coalesced(log_title)
+        return _check_shared(await asyncio.wrap_future(shared), valid_def)
+    try:
+        resp = (await asyncio.to_thread(_load_routed_cache, cache_routes, prompt, resp_type, log_title)
+                or await _request_async(prompt, resp_type, valid_def, log_title, stream_guard, candidates))
+    except Exception as e:
+        _finish_inflight(key, shared, error=e)
+        raise
+    _finish_inflight(key, shared, resp)
+    return resp
+
+ask_gpt_async_once = ask_gpt_async.__wrapped__
@@ -0,0 +1,85 @@
+import threading
+from core.utils.config_utils import load_key
+from core.utils.rate_limiter import estimate_tokens
+
+# ==============================================================================
+# Token-budget chunk planner with runtime batch-size adaptation
+# ==============================================================================
+
+class ChunkPlanner:
+    """Cuts a list of lines into batches sized by estimated prompt + completion tokens.
+
+    `prompt_fn(lines, context_before, context_after)` builds the real prompt; the planner
+    uses it to measure the fixed overhead (rules, constraints, JSON scaffolding) once.
+    The line cap shrinks when batches of the current size fail validation and grows back
+    while they succeed, never into a size whose observed failure rate exceeds the target.
+    """
+    def __init__(self, prompt_fn, max_tokens=None, max_lines=None, min_lines=None,
+                 completion_ratio=None, target_failure_rate=None):
+        conf = load_key("translate_chunk", default={}) or {}
+        self.max_tokens = int(max_tokens or conf.get('max_tokens', 4000))
+        self.max_lines = int(max_lines or conf.get('max_lines', 20))
+        self.min_lines = int(min_lines or conf.get('min_lines', 3))
+        # expected completion tokens per payload token (JSON quoting + target language expansion)
+        self.completion_ratio = float(completion_ratio or conf.get('completion_ratio', 1.5))
+        self.target_failure_rate = float(target_failure_rate or conf.get('target_failure_rate', 0.2))
+        self.overhead = estimate_tokens(prompt_fn([], [], []))
+        self.cap = min(self.max_lines, max(self.min_lines, int(conf.get('start_lines', 10))))
+        self._lock = threading.Lock()
+        self.by_size = {}  # {n_lines: [batches, failures]}
+        self.payload_tokens = 0
+        self.overhead_tokens = 0
+        self.batches = 0
+
+    def _line_cost(self, line):
+        return estimate_tokens(line) * (1 + self.completion_ratio)
+
+    def next_end(self, lines, start, context_before=(), context_after=(), stop=None):
+        """Return `end` so that lines[start:end] fits the token budget and the current line cap (and end <= `stop`)"""
+        with self._lock:
+            cap = self.cap
+        budget = self.max_tokens - self.overhead - sum(estimate_tokens(l) for l in (*context_before, *context_after))
+        end, used = start, 0.0
+        stop = len(lines) if stop is None else min(stop, len(lines))
+        while end < stop and end - start < cap:
+            cost = self._line_cost(lines[end])
+            # always take at least one line, even if it alone is over budget
+            if end > start and used + cost > budget:
+                break
+            used += cost
+            end += 1
+        with self._lock:
+            self.batches += 1
+            self.overhead_tokens += self.overhead
+            self.payload_tokens += sum(estimate_tokens(l) for l in lines[start:end])
+        return end
+
+    def _failure_rate(self, n):
+        batches, failures = self.by_size.get(n, (0, 0))
+        return failures / batches if batches >= 2 else 0.0
+
+    def record(self, n_lines, ok):
+        """Feed back whether a batch of `n_lines` passed validation in batch mode"""
+        with self._lock:
+            stat = self.by_size.setdefault(n_lines, [0, 0])
+            stat[0] += 1
+            if not ok:
+                stat[1] += 1
+                # multiplicative decrease below the size that just failed
+                self.cap = max(self.min_lines, min(self.cap, int(n_lines * 0.75)))
+            elif n_lines >= self.cap and self.cap < self.max_lines:
+                if self._failure_rate(self.cap + 1) <= self.target_failure_rate:
+                    self.cap += 1
+
+    def stats(self):
+        with self._lock:
+            by_size = {n: {"batches": b, "failures": f, "failure_rate": round(f / b, 3)}
+                       for n, (b, f) in sorted(self.by_size.items())}
+            return {
+                "batches": self.batches,
+                "line_cap": self.cap,
+                "overhead_tokens": self.overhead_tokens,
+                "payload_tokens": self.payload_tokens,
+                "overhead_ratio": round(self.overhead_tokens / self.payload_tokens, 3) if self.payload_tokens else None,
+                "by_size": by_size,
+            }
@@ -1,5 +1,12 @@
 from ruamel.yaml import YAML
+import contextlib
+import contextvars
+import copy
+import os
 import threading
+from collections.abc import Mapping
+from concurrent.futures import ThreadPoolExecutor
+from types import MappingProxyType
 
 CONFIG_PATH = 'config.yaml'
 lock = threading.Lock()
@@ -8,24 +15,185 @@ yaml = YAML()
 yaml.preserve_quotes = True
 
 # -----------------------
-# load & update config
+# in-memory config snapshot
 # -----------------------
+# (stat_signature, parsed data, {dotted.key: frozen value}) - swapped atomically, read without the lock
+_SNAPSHOT = None
+CONFIG_STATS = {"disk_parses": 0, "parses_avoided": 0}
+
+def _stat_signature(path):
+    st = os.stat(path)
+    return (st.st_mtime_ns, st.st_size)
+
+def _freeze(value):
+    """Read-only plain copy: mappings become MappingProxyType, lists become tuples"""
+    if isinstance(value, Mapping):
+        return MappingProxyType({k: _freeze(v) for k, v in value.items()})
+    if isinstance(value, (list, tuple)):
+        return tuple(_freeze(v) for v in value)
+    return value
+
+def _flatten(data, prefix='', table=None):
+    """Build a {dotted.key: value} lookup table for every nested mapping key"""
+    if table is None:
+        table = {}
+    for k, v in data.items():
+        dotted = f"{prefix}{k}"
+        table[dotted] = v
+        if isinstance(v, Mapping):
+            _flatten(v, dotted + '.', table)
+    return table
 
-def load_key(key):
+def _set_snapshot(signature, data):
+    global _SNAPSHOT
+    # frozen once per parse, so load_key can hand out shared values without copying
+    _SNAPSHOT = (signature, data, _flatten(_freeze(data)))
+
+def _get_snapshot():
+    """Return the current snapshot, re-parsing config.yaml only when its mtime/size changed"""
+    signature = _stat_signature(CONFIG_PATH)
+    snapshot = _SNAPSHOT
+    if snapshot is not None and snapshot[0] == signature:
+        CONFIG_STATS["parses_avoided"] += 1
+        return snapshot
     with lock:
+        # another thread may have refreshed it while we waited
+        snapshot = _SNAPSHOT
+        signature = _stat_signature(CONFIG_PATH)
+        if snapshot is not None and snapshot[0] == signature:
+            CONFIG_STATS["parses_avoided"] += 1
+            return snapshot
         with open(CONFIG_PATH, 'r', encoding='utf-8') as file:
             data = yaml.load(file)
+        CONFIG_STATS["disk_parses"] += 1
+        _set_snapshot(signature, data)
+        return _SNAPSHOT
+
+def get_config_stats():
+    return dict(CONFIG_STATS)
+
+# -----------------------
+# job-scoped config overlay
+# -----------------------
+
+class ConfigOverlay:
+    """In-memory {dotted.key: value} layer over config.yaml for a single job"""
+    def __init__(self, overrides=None, parent=None):
+        self.parent = parent
+        self._values = dict(overrides or {})
+        self._lock = threading.Lock()
+
+    def set(self, key, value):
+        with self._lock:
+            self._values[key] = value
+
+    def items(self):
+        """All overrides visible to this layer, inner layers win"""
+        merged = dict(self.parent.items()) if self.parent else {}
+        with self._lock:
+            merged.update(self._values)
+        return merged
+
+_CURRENT_OVERLAY = contextvars.ContextVar("config_overlay", default=None)
+
+def current_overlay():
+    return _CURRENT_OVERLAY.get()
+
+@contextlib.contextmanager
+def job_config(overrides=None):
+    """Resolve load_key/update_key through a job overlay instead of the shared config.yaml
+
+    with job_config({'whisper.language': 'en', 'target_language': '日本語'}):
+        process_video(...)
+    """
+    overlay = ConfigOverlay(overrides, parent=_CURRENT_OVERLAY.get())
+    token = _CURRENT_OVERLAY.set(overlay)
+    try:
+        yield overlay
+    finally:
+        _CURRENT_OVERLAY.reset(token)
+
+class ContextThreadPoolExecutor(ThreadPoolExecutor):
+    """ThreadPoolExecutor whose workers see the submitting thread's job overlay"""
+    def submit(self, fn, /, *args, **kwargs):
+        ctx = contextvars.copy_context()
+        return super().submit(ctx.run, fn, *args, **kwargs)
 
-    keys = key.split('.')
+def _resolve_overlay(key, overrides, data):
+    """Return (True, value) if any override covers `key`, else (False, None)"""
+    if key in overrides:
+        return True, overrides[key]
+    # an override on a parent mapping, e.g. 'subtitle' for 'subtitle.max_length'
+    parts = key.split('.')
+    for i in range(len(parts) - 1, 0, -1):
+        parent = '.'.join(parts[:i])
+        if parent in overrides:
+            value = overrides[parent]
+            for k in parts[i:]:
+                if isinstance(value, dict) and k in value:
+                    value = value[k]
+                else:
+                    raise KeyError(f"Key '{k}' not found in configuration")
+            return True, value
+    # overrides below the requested mapping, e.g. 'whisper.language' for 'whisper'
+    prefix = key + '.'
+    nested = {k[len(prefix):]: v for k, v in overrides.items() if k.startswith(prefix)}
+    if nested:
+        value = copy.deepcopy(_lookup(key, data))
+        for sub_key, sub_value in nested.items():
+            current = value
+            *path, last = sub_key.split('.')
+            for k in path:
+                current = current[k]
+            current[last] = sub_value
+        return True, value
+    return False, None
+
+# -----------------------
+# load & update config
+# -----------------------
+
+def _lookup(key, data, table=None):
+    if table is not None and key in table:
+        return table[key]
+    # report the first missing segment, same as walking the tree
     value = data
-    for k in keys:
+    for k in key.split('.'):
         if isinstance(value, dict) and k in value:
             value = value[k]
         else:
             raise KeyError(f"Key '{k}' not found in configuration")
     return value
 
+_MISSING = object()
+
+def load_key(key, default=_MISSING):
+    """Return the value at dotted `key`; `default` (if given) is returned for keys missing from older config files.
+
+    Mappings and lists come back read-only (MappingProxyType / tuple); copy them before changing them.
+    """
+    _, data, table = _get_snapshot()
+    overlay = _CURRENT_OVERLAY.get()
+    if overlay is not None:
+        found, value = _resolve_overlay(key, overlay.items(), data)
+        if found:
+            return _freeze(value)
+    try:
+        return _lookup(key, data, table)
+    except KeyError:
+        if default is _MISSING:
+            raise
+        return default
+
 def update_key(key, new_value):
+    overlay = _CURRENT_OVERLAY.get()
+    if overlay is not None:
+        # inside a job: keep the write in memory, config.yaml stays untouched
+        _, data, table = _get_snapshot()
+        _lookup(key, data, table)
+        overlay.set(key, new_value)
+        return True
+
     with lock:
         with open(CONFIG_PATH, 'r', encoding='utf-8') as file:
             data = yaml.load(file)
@@ -42,10 +210,32 @@ def update_key(key, new_value):
             current[keys[-1]] = new_value
             with open(CONFIG_PATH, 'w', encoding='utf-8') as file:
                 yaml.dump(data, file)
+            # mtime resolution can be coarse, refresh explicitly instead of relying on stat
+            _set_snapshot(_stat_signature(CONFIG_PATH), data)
             return True
         else:
             raise KeyError(f"Key '{keys[-1]}' not found in configuration")
-        
+
+# -----------------------
+# per-job output namespace
+# -----------------------
+
+OUTPUT_ROOT = 'output'
+
+def job_path(path):
+    """Map an `output/...` path into the job's output namespace, if any
+
+    with job_config({'target_language': '日本語', 'output_namespace': '日本語'}):
+        job_path('output/log/terminology.json')  # -> 'output/日本語/log/terminology.json'
+    """
+    namespace = load_key("output_namespace", default='')
+    if not namespace:
+        return path
+    rel = os.path.relpath(path, OUTPUT_ROOT)
+    if rel.startswith('..'):
+        return path
+    return os.path.normpath(os.path.join(OUTPUT_ROOT, namespace, rel))
+
 # basic utils
 def get_joiner(language):
     if language in load_key('language_split_with_space'):
@@ -57,3 +247,4 @@ def get_joiner(language):
 
 if __name__ == "__main__":
     print(load_key('language_split_with_space'))
+    print(get_config_stats())
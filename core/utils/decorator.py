@@ -1,13 +1,16 @@
+import asyncio
 import functools
+import random
 import time
 import os
 from rich import print as rprint
+from core.utils.config_utils import job_path
 
 # ------------------------------
 # retry decorator
 # ------------------------------
 
-def except_handler(error_msg, retry=0, delay=1, default_return=None):
+def except_handler(error_msg, retry=0, delay=1, default_return=None, jitter=False):
     def decorator(func):
         @functools.wraps(func)
         def wrapper(*args, **kwargs):
@@ -22,7 +25,31 @@ def except_handler(error_msg, retry=0, delay=1, default_return=None):
                         if default_return is not None:
                             return default_return
                         raise last_exception
-                    time.sleep(delay * (2**i))
+                    backoff = delay * (2**i)
+                    # full jitter: concurrent callers failing together don't retry together
+                    time.sleep(random.uniform(0, backoff) if jitter else backoff)
+        return wrapper
+    return decorator
+
+
+def async_except_handler(error_msg, retry=0, delay=1, default_return=None, jitter=False):
+    """except_handler for coroutines, sleeps with asyncio instead of blocking the loop"""
+    def decorator(func):
+        @functools.wraps(func)
+        async def wrapper(*args, **kwargs):
+            last_exception = None
+            for i in range(retry + 1):
+                try:
+                    return await func(*args, **kwargs)
+                except Exception as e:
+                    last_exception = e
+                    rprint(f"[red]{error_msg}: {e}, retry: {i+1}/{retry}[/red]")
+                    if i == retry:
+                        if default_return is not None:
+                            return default_return
+                        raise last_exception
+                    backoff = delay * (2**i)
+                    await asyncio.sleep(random.uniform(0, backoff) if jitter else backoff)
         return wrapper
     return decorator
 
@@ -35,8 +62,10 @@ def check_file_exists(file_path):
     def decorator(func):
         @functools.wraps(func)
         def wrapper(*args, **kwargs):
-            if os.path.exists(file_path):
-                rprint(f"[yellow]⚠️ File <{file_path}> already exists, skip <{func.__name__}> step.[/yellow]")
+            # resolved per call: per-language outputs live under the job's output namespace
+            path = job_path(file_path)
+            if os.path.exists(path):
+                rprint(f"[yellow]⚠️ File <{path}> already exists, skip <{func.__name__}> step.[/yellow]")
                 return
             return func(*args, **kwargs)
         return wrapper
@@ -0,0 +1,336 @@
+import os
+import json
+import glob
+import time
+import sqlite3
+import hashlib
+import threading
+
+# ==============================================================================
+# Indexed LLM response caches (SQLite WAL, one connection per thread)
+# ==============================================================================
+
+GPT_LOG_FOLDER = 'output/gpt_log'
+CACHE_DB_NAME = 'cache.db'
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS responses (
+    key TEXT PRIMARY KEY,
+    log_title TEXT,
+    model TEXT,
+    prompt TEXT,
+    resp_type TEXT,
+    resp_content TEXT,
+    resp TEXT,
+    created REAL
+);
+CREATE TABLE IF NOT EXISTS errors (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    model TEXT,
+    prompt TEXT,
+    resp_type TEXT,
+    resp_content TEXT,
+    resp TEXT,
+    message TEXT,
+    created REAL
+);
+"""
+
+def cache_key(model, prompt, resp_type):
+    """sha256 over (model, prompt, resp_type)"""
+    h = hashlib.sha256()
+    for part in (model, prompt, resp_type):
+        h.update(str(part).encode('utf-8'))
+        h.update(b'\0')
+    return h.hexdigest()
+
+class _SQLiteStore:
+    """Thread-local SQLite (WAL) connections; readers never block each other, writers share one lock.
+
+    The db is reopened when the file disappears, e.g. after `cleanup` moved `output/gpt_log` to history.
+    """
+    schema = ""
+
+    def __init__(self, db_path):
+        self.db_path = db_path
+        self.folder = os.path.dirname(db_path)
+        self._local = threading.local()
+        self._write_lock = threading.Lock()
+        self._conns_lock = threading.Lock()
+        self._conns = []
+        self._generation = 0
+
+    def _on_create(self, conn):
+        """Hook for a db file that did not exist before"""
+
+    def _connect(self):
+        os.makedirs(self.folder, exist_ok=True)
+        is_new = not os.path.exists(self.db_path)
+        conn = sqlite3.connect(self.db_path, timeout=30, check_same_thread=False, isolation_level=None)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.executescript(self.schema)
+        with self._conns_lock:
+            self._conns.append(conn)
+        if is_new:
+            self._on_create(conn)
+        return conn
+
+    def _conn(self):
+        local = self._local
+        conn = getattr(local, 'conn', None)
+        if conn is None or local.generation != self._generation or not os.path.exists(self.db_path):
+            if conn is not None:
+                self._close(conn)
+            local.conn = self._connect()
+            local.generation = self._generation
+        return local.conn
+
+    def _close(self, conn):
+        with self._conns_lock:
+            if conn in self._conns:
+                self._conns.remove(conn)
+        try:
+            conn.close()
+        except sqlite3.Error:
+            pass
+
+    def close_all(self):
+        """Close every connection (checkpoints the WAL) so the db file can be moved"""
+        with self._conns_lock:
+            conns, self._conns = self._conns, []
+            self._generation += 1
+        for conn in conns:
+            try:
+                conn.close()
+            except sqlite3.Error:
+                pass
+
+class GPTCache(_SQLiteStore):
+    """Per-run, append-only response store with O(1) lookup by cache key"""
+    schema = _SCHEMA
+
+    def __init__(self, folder=GPT_LOG_FOLDER):
+        super().__init__(os.path.join(folder, CACHE_DB_NAME))
+
+    def _on_create(self, conn):
+        self._import_json_logs(conn)
+
+    # ------------
+    # read & write
+    # ------------
+
+    def get(self, model, prompt, resp_type):
+        row = self._conn().execute(
+            "SELECT resp FROM responses WHERE key = ?", (cache_key(model, prompt, resp_type),)
+        ).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def put(self, model, prompt, resp_content, resp_type, resp, log_title="default"):
+        conn = self._conn()
+        with self._write_lock:
+            conn.execute(
+                "INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (cache_key(model, prompt, resp_type), log_title, model, prompt, resp_type,
+                 resp_content, json.dumps(resp, ensure_ascii=False), time.time())
+            )
+
+    def log_error(self, model, prompt, resp_content, resp_type, resp, message):
+        conn = self._conn()
+        with self._write_lock:
+            conn.execute(
+                "INSERT INTO errors (model, prompt, resp_type, resp_content, resp, message, created) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (model, prompt, resp_type, resp_content, json.dumps(resp, ensure_ascii=False), message, time.time())
+            )
+
+    # ------------
+    # legacy JSON layout
+    # ------------
+
+    def _import_json_logs(self, conn):
+        """Seed a fresh db from `<log_title>.json` files, e.g. restored from batch/output/ERROR"""
+        for file in glob.glob(os.path.join(self.folder, '*.json')):
+            log_title = os.path.splitext(os.path.basename(file))[0]
+            if log_title == 'error':
+                continue
+            try:
+                with open(file, 'r', encoding='utf-8') as f:
+                    items = json.load(f)
+            except (json.JSONDecodeError, OSError):
+                continue
+            rows = [
+                (cache_key(item.get("model"), item["prompt"], item["resp_type"]), log_title, item.get("model"),
+                 item["prompt"], item["resp_type"], item.get("resp_content"),
+                 json.dumps(item["resp"], ensure_ascii=False), time.time())
+                for item in items if item.get("message") is None and "prompt" in item
+            ]
+            with self._write_lock:
+                conn.executemany("INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?, ?, ?, ?)", rows)
+
+    def export_json_logs(self, folder=None):
+        """Write the old `<log_title>.json` arrays (indent=4) for debugging"""
+        folder = folder or self.folder
+        os.makedirs(folder, exist_ok=True)
+        conn = self._conn()
+        logs = {}
+        for log_title, model, prompt, resp_type, resp_content, resp in conn.execute(
+            "SELECT log_title, model, prompt, resp_type, resp_content, resp FROM responses ORDER BY created"
+        ):
+            logs.setdefault(log_title, []).append({
+                "model": model, "prompt": prompt, "resp_content": resp_content,
+                "resp_type": resp_type, "resp": json.loads(resp), "message": None
+            })
+        for model, prompt, resp_type, resp_content, resp, message in conn.execute(
+            "SELECT model, prompt, resp_type, resp_content, resp, message FROM errors ORDER BY id"
+        ):
+            logs.setdefault("error", []).append({
+                "model": model, "prompt": prompt, "resp_content": resp_content,
+                "resp_type": resp_type, "resp": json.loads(resp), "message": message
+            })
+        for log_title, items in logs.items():
+            with open(os.path.join(folder, f"{log_title}.json"), 'w', encoding='utf-8') as f:
+                json.dump(items, f, ensure_ascii=False, indent=4)
+        return list(logs)
+
+GPT_CACHE = GPTCache()
+
+# ==============================================================================
+# Cross-run cache shared by all jobs (size-capped, LRU)
+# ==============================================================================
+
+GLOBAL_CACHE_DB_NAME = 'llm_cache.db'
+
+_GLOBAL_SCHEMA = """
+CREATE TABLE IF NOT EXISTS entries (
+    key TEXT PRIMARY KEY,
+    log_title TEXT,
+    model TEXT,
+    resp_type TEXT,
+    resp TEXT,
+    size INTEGER,
+    pinned INTEGER DEFAULT 0,
+    hits INTEGER DEFAULT 0,
+    created REAL,
+    last_access REAL
+);
+CREATE INDEX IF NOT EXISTS entries_lru ON entries (pinned, last_access);
+"""
+
+class GlobalGPTCache(_SQLiteStore):
+    """Content-addressed cache under `llm_cache.global_dir`, survives `cleanup` and batch retries.
+
+    Entries are evicted least-recently-used first once the stored responses exceed
+    `max_bytes`; pinned entries are never evicted.
+    """
+    schema = _GLOBAL_SCHEMA
+    # evict down to this fraction of the budget so eviction doesn't run on every put
+    EVICT_TO = 0.9
+
+    def __init__(self, folder, max_bytes):
+        super().__init__(os.path.join(folder, GLOBAL_CACHE_DB_NAME))
+        self.max_bytes = max_bytes
+        self._stats_lock = threading.Lock()
+        self._stats = {"hits": 0, "misses": 0, "writes": 0, "evictions": 0}
+        self._bytes = None
+
+    def _count(self, name, n=1):
+        with self._stats_lock:
+            self._stats[name] += n
+
+    def get(self, model, prompt, resp_type):
+        key = cache_key(model, prompt, resp_type)
+        conn = self._conn()
+        row = conn.execute("SELECT resp FROM entries WHERE key = ?", (key,)).fetchone()
+        if row is None:
+            self._count("misses")
+            return None
+        self._count("hits")
+        with self._write_lock:
+            conn.execute("UPDATE entries SET last_access = ?, hits = hits + 1 WHERE key = ?", (time.time(), key))
+        return json.loads(row[0])
+
+    def put(self, model, prompt, resp_type, resp, log_title="default"):
+        data = json.dumps(resp, ensure_ascii=False)
+        size = len(data.encode('utf-8'))
+        now = time.time()
+        conn = self._conn()
+        with self._write_lock:
+            if self._bytes is None:
+                self._bytes = conn.execute("SELECT COALESCE(SUM(size), 0) FROM entries").fetchone()[0]
+            # keep the pin flag of an existing entry
+            conn.execute(
+                "INSERT INTO entries (key, log_title, model, resp_type, resp, size, created, last_access) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?) "
+                "ON CONFLICT(key) DO UPDATE SET resp = excluded.resp, size = excluded.size, last_access = excluded.last_access",
+                (cache_key(model, prompt, resp_type), log_title, model, resp_type, data, size, now, now)
+            )
+            self._bytes += size
+            if self._bytes > self.max_bytes:
+                self._evict(conn)
+        self._count("writes")
+
+    def _evict(self, conn):
+        """Drop least-recently-used unpinned entries until under EVICT_TO * max_bytes (write lock held)"""
+        # other processes share the db, start from the real total
+        self._bytes = conn.execute("SELECT COALESCE(SUM(size), 0) FROM entries").fetchone()[0]
+        target = self.max_bytes * self.EVICT_TO
+        if self._bytes <= target:
+            return
+        doomed = []
+        cursor = conn.execute("SELECT key, size FROM entries WHERE pinned = 0 ORDER BY last_access")
+        for key, size in cursor:
+            if self._bytes <= target:
+                break
+            doomed.append((key,))
+            self._bytes -= size
+        cursor.close()
+        conn.executemany("DELETE FROM entries WHERE key = ?", doomed)
+        self._count("evictions", len(doomed))
+
+    def pin(self, model=None, prompt=None, resp_type=None, log_title=None, pinned=True):
+        """Pin (or unpin) one entry by its prompt, or every entry of a log_title. Returns the number of rows changed"""
+        conn = self._conn()
+        with self._write_lock:
+            if log_title is not None:
+                cur = conn.execute("UPDATE entries SET pinned = ? WHERE log_title = ?", (int(pinned), log_title))
+            else:
+                cur = conn.execute("UPDATE entries SET pinned = ? WHERE key = ?", (int(pinned), cache_key(model, prompt, resp_type)))
+        return cur.rowcount
+
+    def stats(self):
+        with self._stats_lock:
+            stats = dict(self._stats)
+        entries, total, pinned = self._conn().execute(
+            "SELECT COUNT(*), COALESCE(SUM(size), 0), COALESCE(SUM(pinned), 0) FROM entries"
+        ).fetchone()
+        lookups = stats["hits"] + stats["misses"]
+        stats.update({
+            "entries": entries, "bytes": total, "pinned": pinned, "max_bytes": self.max_bytes,
+            "hit_rate": stats["hits"] / lookups if lookups else 0.0
+        })
+        return stats
+
+_GLOBAL_CACHES = {}
+_GLOBAL_CACHES_LOCK = threading.Lock()
+
+def get_global_cache():
+    """The shared cross-run cache, or None when `llm_cache.global_dir` is empty"""
+    from core.utils.config_utils import load_key
+    folder = load_key("llm_cache.global_dir", default='')
+    if not folder:
+        return None
+    max_bytes = int(load_key("llm_cache.max_bytes", default=1024 ** 3))
+    folder = os.path.abspath(os.path.expanduser(folder))
+    with _GLOBAL_CACHES_LOCK:
+        cache = _GLOBAL_CACHES.get(folder)
+        if cache is None:
+            cache = _GLOBAL_CACHES[folder] = GlobalGPTCache(folder, max_bytes)
+        cache.max_bytes = max_bytes
+        return cache
+
+if __name__ == "__main__":
+    titles = GPT_CACHE.export_json_logs()
+    print(f"Exported {len(titles)} logs to {GPT_CACHE.folder}: {titles}")
+    global_cache = get_global_cache()
+    if global_cache:
+        print(f"Global cache {global_cache.db_path}: {global_cache.stats()}")
@@ -0,0 +1,100 @@
+# ==============================================================================
+# Incremental JSON probe for streamed LLM responses
+# ==============================================================================
+
+class StreamingArrayProbe:
+    """Scans a streamed `{"<key>": [ ... ]}` response chunk by chunk.
+
+    Only tracks what the guards need: how many elements of the array under `key`
+    are finished, whether that array is closed, and whether the top-level object
+    closed without ever containing `key`. Text before the first '{' (e.g. a
+    ```json fence) is ignored.
+    """
+    def __init__(self, key):
+        self.key = key
+        self.depth = 0
+        self.in_string = False
+        self.escape = False
+        self.string_buf = []
+        self.last_string = None
+        self.current_key = None
+        self.array_depth = None      # depth inside the target array, None when outside
+        self.item_open = False       # current element has content
+        self.count = 0               # finished elements
+        self.found = False
+        self.array_closed = False
+        self.object_closed = False
+
+    def feed(self, text):
+        for ch in text:
+            if self.object_closed:
+                return
+            if self.in_string:
+                if self.escape:
+                    self.escape = False
+                elif ch == '\\':
+                    self.escape = True
+                elif ch == '"':
+                    self.in_string = False
+                    if self.depth == 1:
+                        self.last_string = ''.join(self.string_buf)
+                else:
+                    if self.depth == 1:
+                        self.string_buf.append(ch)
+                continue
+
+            if self.depth == 0:
+                if ch == '{':
+                    self.depth = 1
+                continue
+
+            if ch == '"':
+                self.in_string = True
+                self.string_buf = []
+                self._mark_item()
+            elif ch == ':' and self.depth == 1:
+                self.current_key = self.last_string
+            elif ch in '[{':
+                if self.depth == 1 and ch == '[' and self.current_key == self.key and not self.found:
+                    self.found = True
+                    self.array_depth = 2
+                else:
+                    self._mark_item()
+                self.depth += 1
+            elif ch in ']}':
+                if self.array_depth is not None and self.depth == self.array_depth:
+                    if self.item_open:
+                        self.count += 1
+                    self.item_open = False
+                    self.array_depth = None
+                    self.array_closed = True
+                self.depth -= 1
+                if self.depth == 0:
+                    self.object_closed = True
+            elif ch == ',':
+                if self.array_depth is not None and self.depth == self.array_depth:
+                    if self.item_open:
+                        self.count += 1
+                    self.item_open = False
+            elif not ch.isspace():
+                self._mark_item()
+
+    def _mark_item(self):
+        if self.array_depth is not None and self.depth == self.array_depth:
+            self.item_open = True
+
+def array_length_guard(key, max_items):
+    """stream_guard factory for ask_gpt: abort once `key` holds more than `max_items`
+    elements, or the object closes without `key`. Returns a new checker per attempt."""
+    def make_checker():
+        probe = StreamingArrayProbe(key)
+        def check(delta):
+            probe.feed(delta)
+            # an opened element beyond max_items is already a violation
+            if probe.count + probe.item_open > max_items:
+                return f"Length mismatch: more than {max_items} items in `{key}`"
+            if probe.object_closed and not probe.found:
+                return f"Missing '{key}' key"
+            return None
+        return check
+    return make_checker
@@ -0,0 +1,153 @@
+import re
+import unicodedata
+
+# ==============================================================================
+# Pre-translation classifier: lines that need no LLM call
+# ==============================================================================
+
+# one SAN move, optionally preceded by a move number ("12." / "12...")
+_MOVE_NUMBER = r'\d+\.(?:\.\.)?'
+_SAN = r'(?:O-O(?:-O)?|0-0(?:-0)?|[KQRBN]?[a-h]?[1-8]?x?[a-h][1-8](?:=[QRBN])?)[+#]?[!?]{0,2}'
+_MOVE_TOKEN_RE = re.compile(rf'^(?:{_MOVE_NUMBER})?(?:{_SAN})?$')
+_HAS_MOVE_RE = re.compile(_SAN)
+_URL_RE = re.compile(r'^(?:https?://|www\.)\S+$|^[\w.+-]+@[\w-]+\.[\w.]+$', re.IGNORECASE)
+_NUMERIC_RE = re.compile(r'^[\d\s.,:;/%+\-–—()#]+$')
+
+# piece letters and captures as in SUBTITLE_CONSTRAINTS ("Nf3" -> "马f3", "Bxc5" -> "象吃c5")
+_ZH_PIECES = {'K': '王', 'Q': '后', 'R': '车', 'B': '象', 'N': '马'}
+_ZH_CASTLING = {'O-O-O': '长易位', '0-0-0': '长易位', 'O-O': '短易位', '0-0': '短易位'}
+
+def _target_script(target_language):
+    lang = str(target_language).lower()
+    if any(k in lang for k in ('中文', 'chinese', '简体', '繁體', '繁体', 'zh')):
+        return 'han'
+    if any(k in lang for k in ('日本', 'japanese')):
+        return 'kana'
+    if any(k in lang for k in ('한국', 'korean')):
+        return 'hangul'
+    if any(k in lang for k in ('рус', 'russian')):
+        return 'cyrillic'
+    return None
+
+# Latin-script targets share one alphabet, so a line counts as target language when that language's
+# function words clearly outnumber those of the others (a few-word line is left to the LLM)
+_LATIN_LANGUAGES = {
+    'en': ('english', '英语', '英文'),
+    'fr': ('french', 'français', 'francais', '法语'),
+    'es': ('spanish', 'español', 'espanol', '西班牙'),
+    'de': ('german', 'deutsch', '德语'),
+    'it': ('italian', 'italiano', '意大利'),
+    'pt': ('portuguese', 'português', 'portugues', '葡萄牙'),
+}
+_STOPWORDS = {
+    'en': {'the', 'and', 'is', 'are', 'was', 'were', 'of', 'to', 'in', 'that', 'it', 'you', 'this', 'with',
+           'for', 'not', 'have', 'what', 'be', 'on'},
+    'fr': {'le', 'la', 'les', 'des', 'est', 'et', 'une', 'un', 'que', 'qui', 'dans', 'pour', 'pas', 'ce',
+           'sur', 'avec', 'vous', 'je', 'nous', 'il'},
+    'es': {'el', 'la', 'los', 'las', 'es', 'y', 'una', 'un', 'que', 'en', 'por', 'para', 'no', 'con', 'lo',
+           'del', 'se', 'está', 'muy', 'pero'},
+    'de': {'der', 'die', 'das', 'und', 'ist', 'nicht', 'ein', 'eine', 'ich', 'sie', 'es', 'zu', 'mit', 'den',
+           'von', 'auf', 'auch', 'wir', 'sich', 'dem'},
+    'it': {'il', 'lo', 'la', 'gli', 'che', 'è', 'e', 'di', 'non', 'un', 'una', 'per', 'con', 'sono',
+           'questo', 'della', 'anche', 'ma', 'mi', 'ci'},
+    'pt': {'o', 'os', 'a', 'as', 'é', 'e', 'que', 'não', 'um', 'uma', 'do', 'da', 'em', 'para', 'com', 'se',
+           'mas', 'você', 'isso', 'no'},
+}
+_WORD_RE = re.compile(r'[^\W\d_]+')
+
+def _latin_language(target_language):
+    lang = str(target_language).strip().lower()
+    for code, names in _LATIN_LANGUAGES.items():
+        if lang == code or any(name in lang for name in names):
+            return code
+    return None
+
+def _in_latin_language(line, language, source_language=None, min_words=4, min_share=0.25):
+    # a line of a same-language source is source text, as for Han sources below
+    if str(source_language or '').lower().startswith(language) or not _in_script(line, 'latin'):
+        return False
+    words = _WORD_RE.findall(line.lower())
+    if len(words) < min_words:
+        return False
+    hits = {code: sum(1 for w in words if w in stopwords) for code, stopwords in _STOPWORDS.items()}
+    best_other = max(n for code, n in hits.items() if code != language)
+    return hits[language] >= 2 and hits[language] / len(words) >= min_share and hits[language] > best_other
+
+def _char_script(ch):
+    name = unicodedata.name(ch, '')
+    if name.startswith('CJK'):
+        return 'han'
+    if name.startswith(('HIRAGANA', 'KATAKANA')):
+        return 'kana'
+    if name.startswith('HANGUL'):
+        return 'hangul'
+    if name.startswith('CYRILLIC'):
+        return 'cyrillic'
+    if name.startswith('LATIN'):
+        return 'latin'
+    return 'other'
+
+# source languages written with Han characters: a Han line there is source text, never "already translated"
+# (zh -> 繁體中文 still needs conversion, zh -> 日本語 still needs translation)
+_HAN_SOURCES = ('zh', 'ja')
+
+def _in_script(line, script, threshold=0.8):
+    letters = [c for c in line if c.isalpha()]
+    if not letters:
+        return False
+    scripts = [_char_script(c) for c in letters]
+    # Japanese text mixes kanji with kana, but a line without any kana is Chinese
+    if script == 'kana':
+        if 'kana' not in scripts:
+            return False
+        accepted = {'kana', 'han'}
+    else:
+        accepted = {script}
+    hits = sum(1 for s in scripts if s in accepted)
+    return hits / len(letters) >= threshold
+
+def _is_move_list(line):
+    tokens = line.replace(',', ' ').split()
+    return bool(tokens) and all(_MOVE_TOKEN_RE.match(t) for t in tokens) and bool(_HAS_MOVE_RE.search(line))
+
+def _move_to_zh(token):
+    prefix = re.match(rf'^{_MOVE_NUMBER}', token)
+    number = prefix.group(0) if prefix else ''
+    move = token[len(number):]
+    core = move.rstrip('+#!?')
+    suffix = move[len(core):]
+    if core in _ZH_CASTLING:
+        return f"{number}{_ZH_CASTLING[core]}{suffix}"
+    if core and core[0] in _ZH_PIECES:
+        core = _ZH_PIECES[core[0]] + core[1:]
+    return f"{number}{core.replace('x', '吃')}{suffix}"
+
+def classify_line(line, target_language, source_language=None):
+    """Return (kind, output) when `line` can skip the LLM, else None.
+
+    kind is one of 'empty', 'numeric', 'url', 'moves', 'target_language'.
+    `source_language` (ISO code, e.g. whisper.detected_language) keeps Han lines of a Chinese or
+    Japanese source from being taken as already in the target language.
+    'target_language' covers Han, kana, Hangul and Cyrillic targets by script, and English, French,
+    Spanish, German, Italian and Portuguese by function words; other targets never match it.
+    """
+    text = str(line).strip()
+    if not text or all(unicodedata.category(c)[0] in 'PSZ' for c in text):
+        return 'empty', text
+    if _NUMERIC_RE.match(text):
+        return 'numeric', text
+    if _URL_RE.match(text):
+        return 'url', text
+    script = _target_script(target_language)
+    if _is_move_list(text):
+        if script == 'han':
+            return 'moves', ' '.join(_move_to_zh(t) for t in text.replace(',', ' ').split())
+        return 'moves', text
+    if script and _in_script(text, script):
+        han_source = str(source_language or '').lower().startswith(_HAN_SOURCES)
+        if not (han_source and any(_char_script(c) == 'han' for c in text)):
+            return 'target_language', text
+    language = _latin_language(target_language)
+    if language and _in_latin_language(text, language, source_language):
+        return 'target_language', text
+    return None
@@ -0,0 +1,243 @@
+import time
+import random
+import threading
+from openai import OpenAI, AsyncOpenAI
+from core.utils.config_utils import load_key
+
+# ==============================================================================
+# Routing over several OpenAI-compatible endpoints with health-based failover
+# ==============================================================================
+
+PRIMARY_ROUTE = 'default'
+
+def _normalize_base_url(base_url):
+    # 智能处理 Base URL
+    if 'ark.cn-beijing.volces.com' in base_url:
+        return base_url
+    if 'v1' not in base_url and 'volces' not in base_url:
+        return base_url.strip('/') + '/v1'
+    return base_url
+
+class Route:
+    """One endpoint + model, with its health.
+
+    Health is an EWMA of the success rate and of the latency of successful calls.
+    `failure_threshold` consecutive errors open the circuit: the route is skipped for a
+    cooldown that doubles on each re-opening (capped at `max_cooldown`), then it gets
+    a trial request again.
+    """
+    ALPHA = 0.2
+
+    def __init__(self, name, base_url, key, model, weight=1.0, json_mode=True):
+        self.name = name
+        self.base_url = _normalize_base_url(base_url)
+        self.key = key
+        self.model = model
+        self.weight = max(0.0, float(weight))
+        self.json_mode = json_mode
+        # the main endpoint keeps plain model keys, so existing caches stay valid
+        self.cache_model = model if name == PRIMARY_ROUTE else f"{model}@{name}"
+        self.success_rate = 1.0
+        self.latency = None
+        self.consecutive_failures = 0
+        self.open_until = 0.0
+        self.openings = 0
+        self.requests = 0
+        self.failures = 0
+        self._client = None
+        self._async_client = None
+
+    @property
+    def signature(self):
+        return (self.name, self.base_url, self.key, self.model, self.weight, self.json_mode)
+
+    def client_kwargs(self):
+        return dict(api_key=self.key, base_url=self.base_url, timeout=300)
+
+    def client(self):
+        if self._client is None:
+            self._client = OpenAI(**self.client_kwargs())
+        return self._client
+
+    def async_client(self):
+        if self._async_client is None:
+            self._async_client = AsyncOpenAI(**self.client_kwargs())
+        return self._async_client
+
+    def is_open(self, now):
+        return now < self.open_until
+
+    def score(self, best_latency):
+        # an endpoint without latency samples yet is assumed as fast as the best one
+        latency = self.latency if self.latency is not None else best_latency
+        return self.weight * self.success_rate ** 2 / max(latency, 0.5)
+
+    def stats(self):
+        return {
+            "model": self.model, "base_url": self.base_url, "weight": self.weight,
+            "requests": self.requests, "failures": self.failures,
+            "success_rate": round(self.success_rate, 3),
+            "latency_ewma": round(self.latency, 3) if self.latency is not None else None,
+            "circuit_open": self.is_open(time.monotonic()), "openings": self.openings,
+        }
+
+class LLMRouter:
+    """Routes are `api.*` (the main endpoint) plus the entries of `api.routes`.
+
+    `candidates()` gives the order in which one request tries the routes: a weighted
+    draw by health score first, then the other closed routes by score, then routes with
+    an open circuit as a last resort.
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._routes = {}
+        self._order = []
+        self._signature = None
+
+    def _configured(self):
+        primary_key = load_key("api.key")
+        primary_json = load_key("api.llm_support_json")
+        routes = [Route(PRIMARY_ROUTE, load_key("api.base_url"), primary_key, load_key("api.model"),
+                        load_key("llm_router.primary_weight", default=1), primary_json)]
+        for i, conf in enumerate(load_key("api.routes", default=[]) or []):
+            routes.append(Route(str(conf.get('name') or f"route_{i + 1}"),
+                                conf.get('base_url') or load_key("api.base_url"),
+                                conf.get('key') or primary_key,
+                                conf.get('model') or load_key("api.model"),
+                                conf.get('weight', 1), conf.get('llm_support_json', primary_json)))
+        return routes
+
+    def routes(self):
+        """Current routes; health is kept for routes whose settings did not change"""
+        configured = self._configured()
+        signature = tuple(r.signature for r in configured)
+        with self._lock:
+            if signature != self._signature:
+                kept = {}
+                for route in configured:
+                    old = self._routes.get(route.name)
+                    kept[route.name] = old if old is not None and old.signature == route.signature else route
+                self._routes, self._order, self._signature = kept, [r.name for r in configured], signature
+            return [self._routes[name] for name in self._order]
+
+    def candidates(self):
+        routes = self.routes()
+        now = time.monotonic()
+        with self._lock:
+            closed = [r for r in routes if not r.is_open(now) and r.weight > 0]
+            opened = sorted((r for r in routes if r not in closed), key=lambda r: r.open_until)
+            if not closed:
+                return opened
+            known = [r.latency for r in closed if r.latency is not None]
+            best = min(known) if known else 1.0
+            scores = {r.name: r.score(best) for r in closed}
+        first = random.choices(closed, weights=[scores[r.name] for r in closed])[0] if sum(scores.values()) > 0 else closed[0]
+        rest = sorted((r for r in closed if r is not first), key=lambda r: scores[r.name], reverse=True)
+        return [first] + rest + opened
+
+    def report_success(self, route, latency):
+        with self._lock:
+            route.requests += 1
+            route.success_rate += Route.ALPHA * (1.0 - route.success_rate)
+            route.latency = latency if route.latency is None else route.latency + Route.ALPHA * (latency - route.latency)
+            route.consecutive_failures = 0
+            route.openings = 0
+            route.open_until = 0.0
+
+    def report_failure(self, route):
+        threshold = int(load_key("llm_router.failure_threshold", default=3))
+        cooldown = float(load_key("llm_router.cooldown", default=30))
+        max_cooldown = float(load_key("llm_router.max_cooldown", default=300))
+        with self._lock:
+            now = time.monotonic()
+            route.requests += 1
+            route.failures += 1
+            route.success_rate -= Route.ALPHA * route.success_rate
+            route.consecutive_failures += 1
+            # requests still in flight when the circuit opened don't extend the cooldown
+            if route.consecutive_failures >= threshold and not route.is_open(now):
+                route.open_until = now + min(max_cooldown, cooldown * 2 ** route.openings)
+                route.openings += 1
+                # half-open: a failed trial after the cooldown re-opens at once
+                route.consecutive_failures = threshold - 1
+                return True
+        return False
+
+    def stats(self):
+        routes = self.routes()
+        with self._lock:
+            return {r.name: r.stats() for r in routes}
+
+LLM_ROUTER = LLMRouter()
+
+if __name__ == "__main__":
+    # Failover / circuit-breaker check against two local stand-in endpoints (run from the project root):
+    #   python -m core.utils.llm_router
+    import os
+    import json
+    import tempfile
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+    from core.utils import config_utils
+    from core.utils.config_utils import job_config
+
+    hits = {'primary': 0, 'backup': 0}
+    primary_down = [True]
+
+    def stand_in(name):
+        class Handler(BaseHTTPRequestHandler):
+            def do_POST(self):
+                self.rfile.read(int(self.headers.get('Content-Length', 0)))
+                hits[name] += 1
+                if name == 'primary' and primary_down[0]:
+                    # a 404 is not retried by the client itself, so each call is one failure
+                    self.send_response(404)
+                    self.end_headers()
+                    return
+                message = {"role": "assistant", "content": json.dumps({"answer": name})}
+                body = json.dumps({
+                    "id": "stand-in", "object": "chat.completion", "created": 0, "model": name,
+                    "choices": [{"index": 0, "finish_reason": "stop", "message": message}],
+                    "usage": {"prompt_tokens": 1, "completion_tokens": 1, "total_tokens": 2},
+                }).encode('utf-8')
+                self.send_response(200)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        return f"http://127.0.0.1:{server.server_port}/v1"
+
+    # cache and logs of the check stay out of output/
+    config_utils.CONFIG_PATH = os.path.abspath(config_utils.CONFIG_PATH)
+    os.chdir(tempfile.mkdtemp())
+    from core.utils.ask_gpt import ask_gpt
+    from core.utils.llm_router import LLM_ROUTER as router  # the instance ask_gpt uses
+
+    overrides = {
+        'api.key': 'stand-in', 'api.model': 'stand-in', 'api.base_url': stand_in('primary'),
+        'api.llm_support_json': False, 'api.stream': False,
+        # weight 0: the backup only takes calls the primary can't serve
+        'api.routes': [{'name': 'backup', 'base_url': stand_in('backup'), 'weight': 0}],
+        'llm_router.failure_threshold': 2, 'llm_router.share_cache': False,
+        'llm_async.enabled': False, 'llm_hedge.enabled': False, 'llm_cache.global_dir': '',
+    }
+    with job_config(overrides):
+        for i in range(3):
+            resp = ask_gpt(f"router check {i}", resp_type='json', log_title='router_check')
+            assert resp == {"answer": "backup"}, resp
+        # two failures in a row open the circuit, the third call goes straight to the backup
+        assert hits == {'primary': 2, 'backup': 3}, hits
+        assert router.stats()[PRIMARY_ROUTE]['circuit_open']
+
+        # the primary is back after its cooldown: its own answer is used, not the backup's cached one
+        primary_down[0] = False
+        router.routes()[0].open_until = 0.0
+        resp = ask_gpt("router check 0", resp_type='json', log_title='router_check')
+        assert resp == {"answer": "primary"}, resp
+        assert hits == {'primary': 3, 'backup': 3}, hits
+    print(f"✅ Failover, circuit breaker and per-route cache ok: {hits}")
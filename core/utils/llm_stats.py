@@ -0,0 +1,200 @@
+import os
+import re
+import json
+import time
+import functools
+import threading
+import contextlib
+import contextvars
+from core.utils.config_utils import load_key, job_path
+from core.utils.models import _LLM_RUN_SUMMARY
+
+# ==============================================================================
+# Token / latency / cost accounting per log_title and pipeline stage
+# ==============================================================================
+
+_STAGE = contextvars.ContextVar("llm_stage", default="other")
+
+def current_stage():
+    return _STAGE.get()
+
+def llm_stage(name):
+    """Tag every ask_gpt call made inside with `name` and write the run summary afterwards.
+
+    Works as a decorator on stage entry points; worker threads / async tasks inherit the tag
+    through ContextThreadPoolExecutor and run_async.
+    """
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            # per-language stages of a fan-out run are reported separately, e.g. '4_2_translate@日本語'
+            namespace = load_key("output_namespace", default='')
+            token = _STAGE.set(f"{name}@{namespace}" if namespace else name)
+            try:
+                return func(*args, **kwargs)
+            finally:
+                _STAGE.reset(token)
+                write_run_summary()
+        return wrapper
+    return decorator
+
+def log_title_family(log_title):
+    """'batch_trans_12' -> 'batch_trans', 'serial_3_7' -> 'serial'"""
+    return re.sub(r'(_\d+)+$', '', log_title)
+
+def _percentile(values, q):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    idx = min(len(values) - 1, int(round(q * (len(values) - 1))))
+    return values[idx]
+
+class _Bucket:
+    FIELDS = ("calls", "api_calls", "cache_hits", "coalesced", "validation_failures", "errors",
+              "streams_aborted",
+              "prompt_tokens", "completion_tokens", "cached_tokens", "cost", "queue_wait")
+
+    def __init__(self):
+        for f in self.FIELDS:
+            setattr(self, f, 0)
+        self.latencies = []
+        self.ttfts = []
+
+    def summary(self):
+        out = {f: getattr(self, f) for f in self.FIELDS}
+        out["cost"] = round(self.cost, 6)
+        out["queue_wait"] = round(self.queue_wait, 3)
+        # every failed attempt is followed by a retry (except_handler), or by the caller's fallback
+        out["retries"] = self.validation_failures + self.errors
+        out["prefix_cache_rate"] = round(self.cached_tokens / self.prompt_tokens, 3) if self.prompt_tokens else 0.0
+        out["latency_p50"] = round(_percentile(self.latencies, 0.5), 3)
+        out["latency_p95"] = round(_percentile(self.latencies, 0.95), 3)
+        out["latency_max"] = round(max(self.latencies), 3) if self.latencies else 0.0
+        # time-to-first-token, streamed requests only
+        out["ttft_p50"] = round(_percentile(self.ttfts, 0.5), 3)
+        out["ttft_p95"] = round(_percentile(self.ttfts, 0.95), 3)
+        return out
+
+class LLMStats:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.by_title = {}
+            self.by_stage = {}
+            self.sections = {}
+            self.started = time.time()
+
+    def _buckets(self, log_title):
+        family = log_title_family(log_title)
+        stage = current_stage()
+        if family not in self.by_title:
+            self.by_title[family] = _Bucket()
+        if stage not in self.by_stage:
+            self.by_stage[stage] = _Bucket()
+        return self.by_title[family], self.by_stage[stage]
+
+    def record_cache_hit(self, log_title):
+        with self._lock:
+            for b in self._buckets(log_title):
+                b.calls += 1
+                b.cache_hits += 1
+
+    def record_coalesced(self, log_title):
+        with self._lock:
+            for b in self._buckets(log_title):
+                b.calls += 1
+                b.coalesced += 1
+
+    def record_request(self, log_title, usage, latency, queue_wait, ttft=None, aborted=False):
+        prompt_tokens = getattr(usage, 'prompt_tokens', 0) or 0
+        completion_tokens = getattr(usage, 'completion_tokens', 0) or 0
+        details = getattr(usage, 'prompt_tokens_details', None)
+        cached_tokens = getattr(details, 'cached_tokens', 0) or 0
+        cost = (prompt_tokens * float(load_key("api.price.input_per_1m", default=0) or 0)
+                + completion_tokens * float(load_key("api.price.output_per_1m", default=0) or 0)) / 1e6
+        with self._lock:
+            for b in self._buckets(log_title):
+                b.calls += 1
+                b.api_calls += 1
+                b.prompt_tokens += prompt_tokens
+                b.completion_tokens += completion_tokens
+                b.cached_tokens += cached_tokens
+                b.cost += cost
+                b.queue_wait += queue_wait
+                b.latencies.append(latency)
+                if ttft is not None:
+                    b.ttfts.append(ttft)
+                if aborted:
+                    b.streams_aborted += 1
+
+    def record_validation_failure(self, log_title):
+        with self._lock:
+            for b in self._buckets(log_title):
+                b.validation_failures += 1
+
+    def record_error(self, log_title):
+        with self._lock:
+            for b in self._buckets(log_title):
+                b.errors += 1
+
+    def set_section(self, name, data):
+        """Attach extra stage-specific stats (e.g. chunk planning) to the run summary"""
+        with self._lock:
+            self.sections[name] = data
+
+    def summary(self):
+        with self._lock:
+            sections = dict(self.sections)
+            by_title = {k: v.summary() for k, v in self.by_title.items()}
+            by_stage = {k: v.summary() for k, v in self.by_stage.items()}
+        totals = {}
+        for s in by_stage.values():
+            for k in ("calls", "api_calls", "cache_hits", "coalesced", "retries",
+                      "prompt_tokens", "completion_tokens", "cached_tokens", "cost"):
+                totals[k] = totals.get(k, 0) + s[k]
+        if "cost" in totals:
+            totals["cost"] = round(totals["cost"], 6)
+        if totals.get("prompt_tokens"):
+            totals["prefix_cache_rate"] = round(totals["cached_tokens"] / totals["prompt_tokens"], 3)
+        return {"started": self.started, "updated": time.time(), "totals": totals,
+                "by_stage": by_stage, "by_log_title": by_title, **sections}
+
+LLM_STATS = LLMStats()
+
+def write_run_summary(path=_LLM_RUN_SUMMARY):
+    """Dump LLM accounting plus limiter / coalescing / config stats as JSON.
+
+    Written into the job's output namespace, so concurrent languages of a fan-out run don't overwrite each other.
+    """
+    from core.utils.ask_gpt import get_coalesce_stats
+    from core.utils.rate_limiter import LLM_LIMITER
+    from core.utils.config_utils import get_config_stats
+    from core.utils.gpt_cache import get_global_cache
+    from core.utils.scheduling import HEDGER
+    from core.utils.llm_router import LLM_ROUTER
+
+    summary = LLM_STATS.summary()
+    summary["coalescing"] = get_coalesce_stats()
+    summary["rate_limiter"] = LLM_LIMITER.stats()
+    summary["hedging"] = HEDGER.stats()
+    summary["routes"] = LLM_ROUTER.stats()
+    summary["config"] = get_config_stats()
+    global_cache = get_global_cache()
+    if global_cache is not None:
+        summary["global_cache"] = global_cache.stats()
+    path = job_path(path)
+    with contextlib.suppress(OSError):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump(summary, f, ensure_ascii=False, indent=2)
+    return summary
+
+def load_run_summary(path=_LLM_RUN_SUMMARY):
+    path = job_path(path)
+    if not os.path.exists(path):
+        return None
+    with open(path, 'r', encoding='utf-8') as f:
+        return json.load(f)
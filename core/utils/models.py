@@ -7,9 +7,18 @@ _3_1_SPLIT_BY_NLP = "output/log/split_by_nlp.txt"
 _3_2_SPLIT_BY_MEANING = "output/log/split_by_meaning.txt"
 _4_1_TERMINOLOGY = "output/log/terminology.json"
 _4_2_TRANSLATION = "output/log/translation_results.xlsx"
+_4_2_JOURNAL = "output/log/translation_journal.jsonl"
 _5_SPLIT_SUB = "output/log/translation_results_for_subtitles.xlsx"
 _5_REMERGED = "output/log/translation_results_remerged.xlsx"
 
+_LLM_RUN_SUMMARY = "output/log/llm_run_summary.json"
+
+# 每行对应的 ASR 词区间 [first, last] (见 core.utils.word_spans)
+_3_1_SPANS = "output/log/split_by_nlp_spans.json"
+_3_2_SPANS = "output/log/split_by_meaning_spans.json"
+_5_SPLIT_SUB_SPANS = "output/log/translation_results_for_subtitles_spans.json"
+_5_REMERGED_SPANS = "output/log/translation_results_remerged_spans.json"
+
 _8_1_AUDIO_TASK = "output/audio/tts_tasks.xlsx"
 
 
@@ -35,8 +44,14 @@ __all__ = [
     "_3_2_SPLIT_BY_MEANING",
     "_4_1_TERMINOLOGY",
     "_4_2_TRANSLATION",
+    "_4_2_JOURNAL",
     "_5_SPLIT_SUB",
     "_5_REMERGED",
+    "_LLM_RUN_SUMMARY",
+    "_3_1_SPANS",
+    "_3_2_SPANS",
+    "_5_SPLIT_SUB_SPANS",
+    "_5_REMERGED_SPANS",
     "_8_1_AUDIO_TASK",
     "_OUTPUT_DIR",
     "_AUDIO_DIR",
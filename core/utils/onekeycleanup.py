@@ -1,6 +1,7 @@
 import os
 import glob
 from core._1_ytdlp import find_video_files
+from core.utils.gpt_cache import GPT_CACHE
 import shutil
 
 def cleanup(history_dir="history"):
@@ -27,7 +28,8 @@ def cleanup(history_dir="history"):
     for file in glob.glob("output/log/*"):
         move_file(file, log_dir)
 
-    # Move gpt_log files
+    # Move gpt_log files (close the cache db first so its WAL is checkpointed)
+    GPT_CACHE.close_all()
     for file in glob.glob("output/gpt_log/*"):
         move_file(file, gpt_log_dir)
 
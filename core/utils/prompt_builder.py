@@ -0,0 +1,35 @@
+# ==============================================================================
+# Stable-prefix prompts: static system prefix -> per-video prefix -> per-call payload
+# ==============================================================================
+
+class StagedPrompt(str):
+    """A prompt string that also remembers its stages.
+
+    The string value is the full text (used for cache keys, logs and token estimates, so
+    everything that treats prompts as plain strings keeps working). ask_gpt sends `system`
+    as the system message and `video_prefix + payload` as the user message, so consecutive
+    calls share the longest possible prefix for provider-side prompt caching.
+    """
+    def __new__(cls, system, payload, video_prefix=None):
+        parts = [p for p in (system, video_prefix, payload) if p]
+        self = super().__new__(cls, "\n\n".join(parts))
+        self.system = system
+        self.video_prefix = video_prefix
+        self.payload = payload
+        return self
+
+    def __add__(self, other):
+        # e.g. `split_prompt + " " * retry_attempt` still yields a staged prompt
+        return StagedPrompt(self.system, self.payload + other, self.video_prefix)
+
+    def messages(self):
+        user = "\n\n".join(p for p in (self.video_prefix, self.payload) if p)
+        return [{"role": "system", "content": self.system}, {"role": "user", "content": user}]
+
+def build_prompt(system, payload, video_prefix=None):
+    return StagedPrompt(system.strip(), payload.strip(), video_prefix.strip() if video_prefix else None)
+
+def prompt_messages(prompt):
+    if isinstance(prompt, StagedPrompt):
+        return prompt.messages()
+    return [{"role": "user", "content": prompt}]
@@ -0,0 +1,235 @@
+import time
+import random
+import asyncio
+import threading
+import contextlib
+from core.utils.config_utils import load_key
+
+# ==============================================================================
+# Process-wide LLM rate limiter: RPM/TPM token buckets + AIMD concurrency
+# ==============================================================================
+
+def estimate_tokens(text):
+    """Rough token count: ~4 ASCII chars per token, 1 token per CJK/other char"""
+    text = str(text)
+    ascii_chars = sum(1 for c in text if ord(c) < 128)
+    return ascii_chars // 4 + (len(text) - ascii_chars) + 1
+
+def is_throttle_error(e):
+    """429s, timeouts and dropped connections mean the provider is saturated"""
+    if getattr(e, 'status_code', None) == 429:
+        return True
+    name = type(e).__name__
+    return name in ('RateLimitError', 'APITimeoutError', 'APIConnectionError') or isinstance(e, TimeoutError)
+
+def retry_after_seconds(e):
+    response = getattr(e, 'response', None)
+    headers = getattr(response, 'headers', None) or {}
+    try:
+        return float(headers.get('retry-after'))
+    except (TypeError, ValueError):
+        return None
+
+class TokenBucket:
+    """Refills `per_minute` units per minute; may go into debt when actual usage exceeds the estimate"""
+    def __init__(self, per_minute):
+        self.per_minute = per_minute
+        self.tokens = float(per_minute)
+        self.updated = time.monotonic()
+
+    def _refill(self, now):
+        self.tokens = min(self.per_minute, self.tokens + (now - self.updated) * self.per_minute / 60)
+        self.updated = now
+
+    def wait_time(self, amount, now):
+        """Seconds until `amount` is available (0 if it is now)"""
+        if self.per_minute <= 0:
+            return 0.0
+        self._refill(now)
+        # a single request larger than the bucket only has to wait for a full bucket
+        amount = min(amount, self.per_minute)
+        if self.tokens >= amount:
+            return 0.0
+        return (amount - self.tokens) * 60 / self.per_minute
+
+    def take(self, amount):
+        if self.per_minute > 0:
+            self.tokens -= amount
+
+class LLMLimiter:
+    """Gate in front of every API call.
+
+    The concurrency window grows by 1/window on each success and halves on a
+    throttle signal (AIMD), never exceeding `max_workers`.
+    """
+    def __init__(self):
+        self._cond = threading.Condition()
+        self.in_flight = 0
+        self.window = None
+        self.cooldown_until = 0.0
+        self.rpm = TokenBucket(0)
+        self.tpm = TokenBucket(0)
+        self._stats = {
+            "requests": 0, "successes": 0, "throttled": 0, "errors": 0,
+            "queue_wait_total": 0.0, "queue_wait_max": 0.0
+        }
+
+    def _sync_config(self):
+        # async mode has no thread per request, so it gets its own (much higher) ceiling
+        if load_key("llm_async.enabled", default=False):
+            ceiling = max(1, int(load_key("llm_async.max_in_flight", default=100)))
+        else:
+            ceiling = max(1, int(load_key("max_workers")))
+        rpm = int(load_key("llm_rate_limit.rpm", default=0) or 0)
+        tpm = int(load_key("llm_rate_limit.tpm", default=0) or 0)
+        if self.window is None:
+            self.window = float(ceiling)
+        self.window = min(self.window, float(ceiling))
+        self.ceiling = ceiling
+        if rpm != self.rpm.per_minute:
+            self.rpm = TokenBucket(rpm)
+        if tpm != self.tpm.per_minute:
+            self.tpm = TokenBucket(tpm)
+
+    def _try_acquire(self, est_tokens):
+        """Take a slot if possible (lock held). Returns (acquired, seconds to wait or None for 'until a release')"""
+        now = time.monotonic()
+        wait = max(
+            self.cooldown_until - now,
+            self.rpm.wait_time(1, now),
+            self.tpm.wait_time(est_tokens, now),
+        )
+        if self.in_flight >= int(self.window):
+            return False, wait if wait > 0 else None
+        if wait > 0:
+            return False, wait
+        self.in_flight += 1
+        self.rpm.take(1)
+        self.tpm.take(est_tokens)
+        return True, 0.0
+
+    def _record_wait(self, waited):
+        self._stats["requests"] += 1
+        self._stats["queue_wait_total"] += waited
+        self._stats["queue_wait_max"] = max(self._stats["queue_wait_max"], waited)
+
+    def acquire(self, est_tokens):
+        """Block until a slot and rate budget are available, return the queue wait in seconds"""
+        start = time.monotonic()
+        with self._cond:
+            self._sync_config()
+            while True:
+                acquired, wait = self._try_acquire(est_tokens)
+                if acquired:
+                    break
+                self._cond.wait(timeout=wait)
+            waited = time.monotonic() - start
+            self._record_wait(waited)
+        return waited
+
+    async def acquire_async(self, est_tokens):
+        """Same as acquire() but yields to the event loop instead of blocking a thread"""
+        start = time.monotonic()
+        while True:
+            with self._cond:
+                self._sync_config()
+                acquired, wait = self._try_acquire(est_tokens)
+                if acquired:
+                    waited = time.monotonic() - start
+                    self._record_wait(waited)
+                    return waited
+            # releases don't wake coroutines, poll briefly while the window is full
+            await asyncio.sleep(min(wait, 1.0) if wait else 0.05)
+
+    def try_acquire_now(self, est_tokens):
+        """Take a slot only if one is free right now (used for hedged duplicates, which must not queue)"""
+        with self._cond:
+            self._sync_config()
+            acquired, _ = self._try_acquire(est_tokens)
+            if acquired:
+                self._record_wait(0.0)
+            return acquired
+
+    def release(self, outcome, retry_after=None):
+        """outcome: 'success' | 'throttled' | 'error' | 'cancelled'"""
+        with self._cond:
+            self.in_flight -= 1
+            if outcome == 'cancelled':
+                # a hedged request that lost the race: says nothing about provider health
+                pass
+            elif outcome == 'success':
+                self._stats["successes"] += 1
+                self.window = min(float(self.ceiling), self.window + 1 / self.window)
+            elif outcome == 'throttled':
+                self._stats["throttled"] += 1
+                self.window = max(1.0, self.window / 2)
+                # jittered pause so waiting threads don't retry in lockstep
+                pause = retry_after if retry_after is not None else random.uniform(0.5, 2.0)
+                self.cooldown_until = max(self.cooldown_until, time.monotonic() + pause)
+            else:
+                self._stats["errors"] += 1
+            self._cond.notify_all()
+
+    def _release_failed(self, e):
+        # a cancelled task (hedge loser, shutdown) must still give its slot back
+        if isinstance(e, (asyncio.CancelledError, KeyboardInterrupt)):
+            self.release('cancelled')
+        elif is_throttle_error(e):
+            self.release('throttled', retry_after_seconds(e))
+        else:
+            self.release('error')
+
+    def hold(self):
+        """Count one more request in flight without queueing; the caller must release() it later"""
+        with self._cond:
+            self.in_flight += 1
+
+    def charge(self, extra_tokens):
+        """Settle the TPM bucket once real usage is known"""
+        with self._cond:
+            self.tpm.take(extra_tokens)
+
+    @contextlib.contextmanager
+    def slot(self, prompt):
+        est_tokens = estimate_tokens(prompt)
+        waited = self.acquire(est_tokens)
+        slot = _Slot(self, est_tokens, waited)
+        try:
+            yield slot
+        except BaseException as e:
+            self._release_failed(e)
+            raise
+        self.release('success')
+
+    @contextlib.asynccontextmanager
+    async def slot_async(self, prompt):
+        est_tokens = estimate_tokens(prompt)
+        waited = await self.acquire_async(est_tokens)
+        slot = _Slot(self, est_tokens, waited)
+        try:
+            yield slot
+        except BaseException as e:
+            self._release_failed(e)
+            raise
+        self.release('success')
+
+    def stats(self):
+        with self._cond:
+            stats = dict(self._stats)
+            stats["window"] = round(self.window, 2) if self.window else None
+            stats["in_flight"] = self.in_flight
+        stats["queue_wait_avg"] = stats["queue_wait_total"] / stats["requests"] if stats["requests"] else 0.0
+        return stats
+
+class _Slot:
+    def __init__(self, limiter, est_tokens, queue_wait=0.0):
+        self.limiter = limiter
+        self.est_tokens = est_tokens
+        self.queue_wait = queue_wait
+
+    def record_usage(self, usage):
+        total = getattr(usage, 'total_tokens', None)
+        if total:
+            self.limiter.charge(total - self.est_tokens)
+
+LLM_LIMITER = LLMLimiter()
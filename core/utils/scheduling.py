@@ -0,0 +1,144 @@
+import asyncio
+import threading
+import collections
+import concurrent.futures
+from core.utils.config_utils import load_key
+from core.utils.rate_limiter import LLM_LIMITER, is_throttle_error
+
+# ==============================================================================
+# Longest-processing-time-first ordering
+# ==============================================================================
+
+def longest_first(items, cost):
+    """Submit the most expensive work first so the last job to start is a short one (LPT)"""
+    return sorted(items, key=cost, reverse=True)
+
+# ==============================================================================
+# Hedged LLM requests: duplicate a call that is slower than the usual tail
+# ==============================================================================
+
+class LatencyHedger:
+    """Keeps recent successful latencies per log_title family and decides when to hedge.
+
+    A call still running after the `llm_hedge.percentile` latency of its family (at least
+    `llm_hedge.min_delay` seconds, once `llm_hedge.min_samples` calls were observed) gets a
+    duplicate request; whichever answers first wins.
+    """
+    WINDOW = 200
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._samples = collections.defaultdict(lambda: collections.deque(maxlen=self.WINDOW))
+        self._stats = {"hedged": 0, "hedge_wins": 0, "primary_wins": 0, "no_capacity": 0}
+
+    def observe(self, family, latency):
+        with self._lock:
+            self._samples[family].append(latency)
+
+    def delay(self, family):
+        """Seconds to wait before hedging a call of `family`, or None when hedging is off / not warmed up"""
+        if not load_key("llm_hedge.enabled", default=False):
+            return None
+        min_samples = int(load_key("llm_hedge.min_samples", default=20))
+        with self._lock:
+            samples = sorted(self._samples.get(family, ()))
+        if len(samples) < min_samples:
+            return None
+        q = float(load_key("llm_hedge.percentile", default=0.95))
+        idx = min(len(samples) - 1, int(q * (len(samples) - 1)))
+        return max(samples[idx], float(load_key("llm_hedge.min_delay", default=5)))
+
+    def count(self, name):
+        with self._lock:
+            self._stats[name] += 1
+
+    def stats(self):
+        with self._lock:
+            return dict(self._stats)
+
+HEDGER = LatencyHedger()
+
+def _outcome(error):
+    if error is None:
+        return 'success'
+    return 'throttled' if is_throttle_error(error) else 'error'
+
+def _in_thread(call):
+    """Run `call` on a daemon thread, so the race can return as soon as either request answers"""
+    future = concurrent.futures.Future()
+    def run():
+        try:
+            future.set_result(call())
+        except BaseException as e:
+            future.set_exception(e)
+    threading.Thread(target=run, name="llm-hedge", daemon=True).start()
+    return future
+
+def call_hedged(call, family, est_tokens):
+    """Run the blocking API `call`, racing a duplicate once it exceeds the family's hedge delay.
+
+    A blocking request can't be interrupted, so the loser runs to completion; it keeps a
+    limiter slot until then, so the limiter never undercounts what is really in flight.
+    """
+    delay = HEDGER.delay(family)
+    if delay is None:
+        return call()
+    primary = _in_thread(call)
+    try:
+        return primary.result(timeout=delay)
+    except concurrent.futures.TimeoutError:
+        pass
+    # the duplicate needs its own limiter slot, never queue for one
+    if not LLM_LIMITER.try_acquire_now(est_tokens):
+        HEDGER.count("no_capacity")
+        return primary.result()
+    HEDGER.count("hedged")
+    backup = _in_thread(call)
+    backup.add_done_callback(lambda f: LLM_LIMITER.release(_outcome(f.exception())))
+
+    pending = {primary, backup}
+    first_error = None
+    while pending:
+        done, pending = concurrent.futures.wait(pending, return_when=concurrent.futures.FIRST_COMPLETED)
+        for future in done:
+            if future.exception() is None:
+                HEDGER.count("hedge_wins" if future is backup else "primary_wins")
+                if future is backup:
+                    # the caller releases the primary's slot on return, hold one for it until it ends
+                    LLM_LIMITER.hold()
+                    primary.add_done_callback(lambda f: LLM_LIMITER.release('cancelled'))
+                return future.result()
+            first_error = first_error or future.exception()
+    raise first_error
+
+async def call_hedged_async(make_coro, family, est_tokens):
+    """Async counterpart of call_hedged; the losing task is cancelled"""
+    delay = HEDGER.delay(family)
+    if delay is None:
+        return await make_coro()
+    primary = asyncio.ensure_future(make_coro())
+    done, _ = await asyncio.wait({primary}, timeout=delay)
+    if done:
+        return primary.result()
+    if not LLM_LIMITER.try_acquire_now(est_tokens):
+        HEDGER.count("no_capacity")
+        return await primary
+    HEDGER.count("hedged")
+    backup = asyncio.ensure_future(make_coro())
+    backup.add_done_callback(
+        lambda t: LLM_LIMITER.release('cancelled' if t.cancelled() else _outcome(t.exception())))
+
+    pending = {primary, backup}
+    first_error = None
+    try:
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                if task.exception() is None:
+                    HEDGER.count("hedge_wins" if task is backup else "primary_wins")
+                    return task.result()
+                first_error = first_error or task.exception()
+        raise first_error
+    finally:
+        for task in pending:
+            task.cancel()
@@ -0,0 +1,135 @@
+import re
+
+# ==============================================================================
+# Local subtitle splitter: cut an over-long line and its translation in two without the LLM
+# ==============================================================================
+# The source cut must sit on a clear boundary (punctuation, or a clause boundary from the spaCy
+# parse); the translation is cut at the punctuation (or space) closest to the same proportion of
+# its weighted length. Lines without such cuts, or whose halves are still too long, return None
+# and are left to the LLM split + align.
+
+_SENTENCE_END = set('.!?。！？…')
+_CLAUSE_END = set(';:；：')
+_PAUSE = set(',，、—')
+_OPENING = {'(': ')', '[': ']', '（': '）', '【': '】', '《': '》', '「': '」', '『': '』', '“': '”', '‘': '’'}
+# clausal dependents start a new subtitle line well; cc/mark (and, because, ...) open one
+_CLAUSE_DEPS = {'advcl', 'relcl', 'ccomp', 'conj', 'parataxis', 'acl'}
+_OPENER_DEPS = {'cc', 'mark'}
+_ABBREVIATION_RE = re.compile(r'(?:\b(?:Mr|Mrs|Ms|Dr|Prof|St|vs|etc|No|e\.g|i\.e)|\b[A-Z])\.$')
+
+def _punct_strength(ch):
+    if ch in _SENTENCE_END:
+        return 3
+    if ch in _CLAUSE_END:
+        return 2.5
+    if ch in _PAUSE:
+        return 2
+    return 0
+
+def _bracket_depths(text):
+    """depth[i]: number of brackets / quotes open just before text[i] (cuts inside them are skipped)"""
+    depths, stack = [], []
+    for ch in text:
+        depths.append(len(stack))
+        if stack and ch == stack[-1]:
+            stack.pop()
+        elif ch in _OPENING:
+            stack.append(_OPENING[ch])
+        elif ch == '"':
+            stack.append('"')
+    return depths
+
+def _punct_cuts(text):
+    """{cut position: strength} after punctuation followed by more text"""
+    cuts, depths = {}, _bracket_depths(text)
+    for i, ch in enumerate(text[:-1]):
+        strength = _punct_strength(ch)
+        # "3.5" / "1,000" / "i.e." / "Mr." are not boundaries; latin punctuation is followed by a space
+        if not strength or depths[i + 1] or (ch.isascii() and not text[i + 1].isspace()):
+            continue
+        if ch == '.' and _ABBREVIATION_RE.search(text, 0, i + 1):
+            continue
+        cuts[i + 1] = max(cuts.get(i + 1, 0), strength)
+    return cuts
+
+def _dependency_cuts(doc):
+    """{cut position: strength} at clause boundaries of a spaCy doc"""
+    cuts = {}
+    for token in doc:
+        if token.dep_ in _CLAUSE_DEPS:
+            start = token.left_edge
+        elif token.dep_ in _OPENER_DEPS:
+            start = token
+        else:
+            continue
+        if start.i > 0:
+            cuts[start.idx] = max(cuts.get(start.idx, 0), 1)
+    return cuts
+
+def _halves(text, pos):
+    return text[:pos].strip(), text[pos:].strip()
+
+def source_cut(src, max_length, doc=None, min_share=0.2):
+    """Best cut position in the source line, or None when no clear boundary leaves both halves within `max_length`"""
+    cuts = _punct_cuts(src)
+    if doc is not None and doc.text == src:
+        for pos, strength in _dependency_cuts(doc).items():
+            cuts[pos] = max(cuts.get(pos, 0), strength)
+    total = len(src.strip()) or 1
+    best, best_cost = None, None
+    for pos, strength in cuts.items():
+        left, right = _halves(src, pos)
+        if not left or not right or len(left) > max_length or len(right) > max_length:
+            continue
+        if min(len(left), len(right)) < min_share * total:
+            continue
+        # balanced halves first, stronger boundaries break near-ties
+        cost = abs(len(left) - len(right)) / total - 0.1 * strength
+        if best_cost is None or cost < best_cost:
+            best, best_cost = pos, cost
+    return best
+
+def target_cut(tr, ratio, measure, punct_window=0.2, space_window=0.1):
+    """Cut position in the translation near `ratio` of its `measure`d length; None if nothing is close.
+
+    Punctuation within `punct_window` (share of the length) wins over spaces, which must be within `space_window`.
+    """
+    # spaces don't count, as for the source ratio
+    weights = [0 if ch.isspace() else measure(ch) for ch in tr]
+    total = sum(weights) or 1
+    target = ratio * total
+    depths = _bracket_depths(tr)
+    punct = _punct_cuts(tr)
+    best = {True: (None, None), False: (None, None)}
+    acc = 0.0
+    for i, w in enumerate(weights[:-1]):
+        acc += w
+        pos = i + 1
+        is_punct = pos in punct
+        if depths[pos] or not (is_punct or tr[pos] == ' '):
+            continue
+        dist = abs(acc - target) / total
+        if dist > (punct_window if is_punct else space_window):
+            continue
+        # stronger punctuation breaks near-ties
+        cost = dist - 0.02 * punct.get(pos, 0)
+        if best[is_punct][1] is None or cost < best[is_punct][1]:
+            best[is_punct] = (pos, cost)
+    return best[True][0] if best[True][0] is not None else best[False][0]
+
+def split_locally(src, tr, max_length, target_multiplier, measure, doc=None):
+    """([src_left, src_right], [tr_left, tr_right]) when both halves of both lines fit, else None"""
+    src, tr = str(src).replace('\n', ' '), str(tr).replace('\n', ' ')
+    pos = source_cut(src, max_length, doc)
+    if pos is None:
+        return None
+    src_parts = list(_halves(src, pos))
+    src_weight = measure(re.sub(r'\s+', '', src)) or 1
+    ratio = measure(re.sub(r'\s+', '', src_parts[0])) / src_weight
+    tr_pos = target_cut(tr, ratio, measure)
+    if tr_pos is None:
+        return None
+    tr_parts = list(_halves(tr, tr_pos))
+    if not all(tr_parts) or any(measure(t) * target_multiplier > max_length for t in tr_parts):
+        return None
+    return src_parts, tr_parts
@@ -0,0 +1,265 @@
+import os
+import re
+import numpy as np
+
+# ==============================================================================
+# Columnar subtitle timeline: float start/end arrays + text columns, SRT / WebVTT / ASS I/O
+# ==============================================================================
+# Times are kept as float seconds from alignment to dubbing; strings only appear when a
+# file or an Excel column is written. All times of a file are parsed or formatted in one
+# pass over integer milliseconds instead of one datetime object per cue.
+
+_MS_WEIGHTS = np.array([3_600_000, 60_000, 1_000, 1], dtype=np.int64)
+
+# H:MM:SS,mmm (SRT), [H:]MM:SS.mmm (WebVTT), H:MM:SS.cc (ASS); the fraction is read as decimals
+_TIME = r'(?:(\d+):)?(\d{1,2}):(\d{1,2})[,.](\d{1,3})'
+_TIME_RE = re.compile(rf'^\s*{_TIME}\s*$')
+_ARROW_RE = re.compile(rf'^\s*{_TIME}\s*-->\s*{_TIME}')
+_BLOCK_SPLIT_RE = re.compile(r'\n[ \t]*\n')
+_ASS_TAG_RE = re.compile(r'\{[^}]*\}')
+
+def _to_ms(fields):
+    """[(h, m, s, frac), ...] string groups -> int64 milliseconds"""
+    if not fields:
+        return np.zeros(0, dtype=np.int64)
+    rows = np.array([(h or 0, m, s, frac.ljust(3, '0')) for h, m, s, frac in fields], dtype=np.int64)
+    return rows @ _MS_WEIGHTS
+
+def _split_ms(seconds):
+    ms = np.rint(np.maximum(np.asarray(seconds, dtype=float), 0) * 1000).astype(np.int64)
+    return (ms // 3_600_000).tolist(), (ms // 60_000 % 60).tolist(), (ms // 1000 % 60).tolist(), (ms % 1000).tolist()
+
+def format_times(seconds, sep=','):
+    """Seconds -> 'HH:MM:SS,mmm' strings (sep='.' gives the WebVTT / Excel column form)"""
+    return [f"{h:02d}:{m:02d}:{s:02d}{sep}{f:03d}" for h, m, s, f in zip(*_split_ms(seconds))]
+
+def format_ass_times(seconds):
+    """Seconds -> 'H:MM:SS.cc' strings"""
+    cs = np.rint(np.maximum(np.asarray(seconds, dtype=float), 0) * 100).astype(np.int64)
+    return [f"{h}:{m:02d}:{s:02d}.{c:02d}" for h, m, s, c in
+            zip((cs // 360_000).tolist(), (cs // 6000 % 60).tolist(), (cs // 100 % 60).tolist(), (cs % 100).tolist())]
+
+def parse_times(strings):
+    """Time strings in any of the formats above -> float seconds array"""
+    fields = []
+    for text in strings:
+        m = _TIME_RE.match(str(text))
+        if m is None:
+            raise ValueError(f"Invalid subtitle time: {text!r}")
+        fields.append(m.groups())
+    return _to_ms(fields) / 1000.0
+
+def parse_time(text):
+    return float(parse_times([text])[0])
+
+class Timeline:
+    """Cues as columns: `start` / `end` in float seconds, `numbers`, and named text columns.
+
+    A file parsed from disk has one text column, 'text'. Writers take the names of the
+    columns to show, one line each per cue (e.g. 'Source', 'Translation' for bilingual files).
+    """
+    def __init__(self, start, end, numbers=None, **columns):
+        self.start = np.asarray(start, dtype=float).reshape(-1)
+        self.end = np.asarray(end, dtype=float).reshape(-1)
+        if len(self.start) != len(self.end):
+            raise ValueError(f"start/end length mismatch: {len(self.start)} != {len(self.end)}")
+        self.numbers = np.arange(1, len(self.start) + 1) if numbers is None else np.asarray(numbers, dtype=np.int64)
+        self.columns = {}
+        for name, values in columns.items():
+            values = ['' if v is None else str(v) for v in values]
+            if len(values) != len(self.start):
+                raise ValueError(f"column '{name}' has {len(values)} rows, expected {len(self.start)}")
+            self.columns[name] = values
+
+    def __len__(self):
+        return len(self.start)
+
+    @property
+    def duration(self):
+        return self.end - self.start
+
+    @classmethod
+    def from_pairs(cls, pairs, **columns):
+        """From [(start, end), ...] in seconds"""
+        times = np.asarray(list(pairs), dtype=float).reshape(-1, 2)
+        return cls(times[:, 0], times[:, 1], **columns)
+
+    @classmethod
+    def from_strings(cls, starts, ends, **columns):
+        """From time string columns, e.g. start_time / end_time of the audio task table"""
+        return cls(parse_times(starts), parse_times(ends), **columns)
+
+    def text(self, *names):
+        """Per-cue text of the given columns (all columns by default), one line per non-empty column"""
+        cols = [self.columns[n] for n in (names or self.columns)]
+        return ['\n'.join(t.strip() for t in cue if t.strip()) for cue in zip(*cols)] if cols else [''] * len(self)
+
+    def timestamps(self, sep=','):
+        """'start --> end' strings, as in an SRT timing line"""
+        return [f"{a} --> {b}" for a, b in zip(format_times(self.start, sep), format_times(self.end, sep))]
+
+    # -----------------------
+    # timeline rules, as whole-array passes
+    # -----------------------
+
+    def _with(self, start, end, numbers=None, columns=None):
+        return Timeline(start, end, self.numbers if numbers is None else numbers, **(self.columns if columns is None else columns))
+
+    def close_gaps(self, max_gap):
+        """Extend each cue to the next cue's start when the silence between them is shorter than `max_gap`"""
+        end = self.end.copy()
+        gap = self.start[1:] - end[:-1]
+        close = (gap > 0) & (gap < max_gap)
+        end[:-1][close] = self.start[1:][close]
+        return self._with(self.start, end)
+
+    def merge_short(self, min_duration, joiner=' '):
+        """Merge or extend cues shorter than `min_duration` (compared in whole milliseconds).
+
+        A short cue absorbs the following cues while it is still short and they start less than
+        `min_duration` after it; a cue still short after that is extended to `min_duration`,
+        unless it is the last one. Text columns of a merged group are joined with `joiner`.
+
+        Returns (timeline, groups, extended): `groups` lists the (first, last) positions of each
+        merged group in this timeline, `extended` flags the extended cues of the new one.
+        """
+        n = len(self)
+        if n == 0:
+            return self, [], np.zeros(0, dtype=bool)
+        s = np.rint(self.start * 1000).astype(np.int64)
+        e = np.rint(self.end * 1000).astype(np.int64)
+        limit = s + int(round(min_duration * 1000))
+        # stop[i]: end (exclusive) of the group cue i would head; one pass per absorbed neighbour
+        stop = np.arange(1, n + 1)
+        active = np.flatnonzero(e < limit)
+        while active.size:
+            nxt = stop[active]
+            ok = nxt < n
+            nxt = np.minimum(nxt, n - 1)
+            ok &= (e[nxt - 1] < limit[active]) & (s[nxt] < limit[active])
+            active = active[ok]
+            stop[active] += 1
+        # the first cue heads a group, and each group's end heads the next one
+        heads, h = [], 0
+        while h < n:
+            heads.append(h)
+            h = int(stop[h])
+        heads = np.array(heads)
+        stops = stop[heads]
+        extended = (e[stops - 1] < limit[heads]) & (stops < n)
+        start = self.start[heads]
+        end = np.where(extended, start + min_duration, self.end[stops - 1])
+        bounds = list(zip(heads.tolist(), stops.tolist()))
+        columns = {name: [joiner.join(col[a:b]) for a, b in bounds] for name, col in self.columns.items()}
+        groups = [(a, b - 1) for a, b in bounds if b - a > 1]
+        return self._with(start, end, self.numbers[heads], columns), groups, extended
+
+    # -----------------------
+    # writers
+    # -----------------------
+
+    def to_srt(self, *names):
+        return ''.join(f"{n}\n{ts}\n{text}\n\n" for n, ts, text in
+                       zip(self.numbers.tolist(), self.timestamps(), self.text(*names))).strip()
+
+    def to_vtt(self, *names):
+        body = ''.join(f"{n}\n{ts}\n{text}\n\n" for n, ts, text in
+                       zip(self.numbers.tolist(), self.timestamps('.'), self.text(*names)))
+        return f"WEBVTT\n\n{body}".strip()
+
+    def to_ass(self, *names, font='Arial', font_size=16):
+        header = (
+            "[Script Info]\nScriptType: v4.00+\nWrapStyle: 0\nScaledBorderAndShadow: yes\n\n"
+            "[V4+ Styles]\n"
+            "Format: Name, Fontname, Fontsize, PrimaryColour, SecondaryColour, OutlineColour, BackColour, Bold, Italic, "
+            "Underline, StrikeOut, ScaleX, ScaleY, Spacing, Angle, BorderStyle, Outline, Shadow, Alignment, MarginL, MarginR, MarginV, Encoding\n"
+            f"Style: Default,{font},{font_size},&H00FFFFFF,&H000000FF,&H00000000,&H80000000,0,0,0,0,100,100,0,0,1,1,0,2,10,10,10,1\n\n"
+            "[Events]\nFormat: Layer, Start, End, Style, Name, MarginL, MarginR, MarginV, Effect, Text\n"
+        )
+        texts = [text.replace('\n', r'\N') for text in self.text(*names)]
+        events = ''.join(f"Dialogue: 0,{a},{b},Default,,0,0,0,,{text}\n" for a, b, text in
+                         zip(format_ass_times(self.start), format_ass_times(self.end), texts))
+        return header + events
+
+    def write(self, path, *names):
+        """Write as SRT / WebVTT / ASS depending on the extension of `path`"""
+        ext = os.path.splitext(path)[1].lower()
+        writer = {'.vtt': self.to_vtt, '.ass': self.to_ass}.get(ext, self.to_srt)
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        with open(path, 'w', encoding='utf-8') as f:
+            f.write(writer(*names))
+
+    # -----------------------
+    # parsers
+    # -----------------------
+    # Lines of a cue are stripped and joined with `joiner`; cues without text are skipped, and
+    # blocks that are not cues are passed to `on_invalid` (if given) and skipped too.
+
+    @classmethod
+    def _from_blocks(cls, content, joiner, on_invalid, vtt):
+        numbers, fields, texts = [], [], []
+        for block in _BLOCK_SPLIT_RE.split(content.replace('\r\n', '\n').strip()):
+            lines = [line.strip() for line in block.split('\n') if line.strip()]
+            if not lines:
+                continue
+            if vtt and lines[0].startswith(('WEBVTT', 'NOTE', 'STYLE', 'REGION')):
+                continue
+            # the timing line comes first, or after a cue number / identifier
+            timing = 0 if _ARROW_RE.match(lines[0]) else 1
+            m = _ARROW_RE.match(lines[timing]) if len(lines) > timing else None
+            if m is None or (timing and not vtt and not lines[0].isdigit()):
+                if on_invalid is not None:
+                    on_invalid(block)
+                continue
+            if len(lines) <= timing + 1:
+                continue
+            numbers.append(int(lines[0]) if timing and lines[0].isdigit() else len(numbers) + 1)
+            fields.append(m.groups())
+            texts.append(joiner.join(lines[timing + 1:]))
+        ms = _to_ms([f[:4] for f in fields] + [f[4:] for f in fields])
+        n = len(fields)
+        return cls(ms[:n] / 1000.0, ms[n:] / 1000.0, numbers=numbers, text=texts)
+
+    @classmethod
+    def from_srt(cls, content, joiner=' ', on_invalid=None):
+        return cls._from_blocks(content, joiner, on_invalid, vtt=False)
+
+    @classmethod
+    def from_vtt(cls, content, joiner=' ', on_invalid=None):
+        return cls._from_blocks(content, joiner, on_invalid, vtt=True)
+
+    @classmethod
+    def from_ass(cls, content, joiner=' ', on_invalid=None):
+        fmt = ['Layer', 'Start', 'End', 'Style', 'Name', 'MarginL', 'MarginR', 'MarginV', 'Effect', 'Text']
+        starts, ends, texts = [], [], []
+        section = None
+        for line in content.replace('\r\n', '\n').split('\n'):
+            line = line.strip()
+            if line.startswith('[') and line.endswith(']'):
+                section = line.lower()
+            elif section == '[events]' and line.startswith('Format:'):
+                fmt = [f.strip() for f in line[len('Format:'):].split(',')]
+            elif section == '[events]' and line.startswith('Dialogue:'):
+                values = [v.strip() for v in line[len('Dialogue:'):].split(',', len(fmt) - 1)]
+                row = dict(zip(fmt, values))
+                if len(values) != len(fmt) or not _TIME_RE.match(row['Start']) or not _TIME_RE.match(row['End']):
+                    if on_invalid is not None:
+                        on_invalid(line)
+                    continue
+                text = _ASS_TAG_RE.sub('', row['Text']).replace(r'\N', '\n').replace(r'\n', '\n').replace(r'\h', ' ')
+                lines = [t.strip() for t in text.split('\n') if t.strip()]
+                if not lines:
+                    continue
+                starts.append(row['Start'])
+                ends.append(row['End'])
+                texts.append(joiner.join(lines))
+        return cls.from_strings(starts, ends, text=texts)
+
+    @classmethod
+    def read(cls, path, joiner=' ', on_invalid=None):
+        """Parse an SRT / WebVTT / ASS file, by extension"""
+        with open(path, 'r', encoding='utf-8-sig') as f:
+            content = f.read()
+        ext = os.path.splitext(path)[1].lower()
+        parser = {'.vtt': cls.from_vtt, '.ass': cls.from_ass, '.ssa': cls.from_ass}.get(ext, cls.from_srt)
+        return parser(content, joiner=joiner, on_invalid=on_invalid)
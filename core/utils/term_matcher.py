@@ -0,0 +1,132 @@
+import os
+import json
+import threading
+from collections import deque
+
+# ==============================================================================
+# Aho–Corasick multi-term matcher for terminology lookup
+# ==============================================================================
+
+def _needs_boundary(ch):
+    # only latin-like word characters need a boundary; CJK text has no spaces between words
+    return ch.isascii() and (ch.isalnum() or ch == '_')
+
+def _is_word_char(ch):
+    return ch.isalnum() or ch == '_'
+
+class TermMatcher:
+    """Finds every term of a glossary in a line in one pass over the line.
+
+    `terms` is a list of {'src', 'tgt', 'note'} dicts (terminology.json format).
+    With `word_boundary`, a latin term only matches as a whole word ("Pin" does not
+    match "spinning"); with `case_fold`, matching ignores case.
+    """
+    def __init__(self, terms, word_boundary=True, case_fold=True):
+        self.terms = [t for t in terms if str(t.get('src', '')).strip()]
+        self.word_boundary = word_boundary
+        self.case_fold = case_fold
+        # goto[state] = {char: state}, fail[state] = state, out[state] = [term index, ...]
+        self.goto = [{}]
+        self.fail = [0]
+        self.out = [[]]
+        self.patterns = [self._fold(str(t['src']).strip()) for t in self.terms]
+        for idx, pattern in enumerate(self.patterns):
+            self._add(pattern, idx)
+        self._build_links()
+
+    def _fold(self, text):
+        return text.casefold() if self.case_fold else text
+
+    def _add(self, pattern, idx):
+        state = 0
+        for ch in pattern:
+            nxt = self.goto[state].get(ch)
+            if nxt is None:
+                nxt = len(self.goto)
+                self.goto[state][ch] = nxt
+                self.goto.append({})
+                self.fail.append(0)
+                self.out.append([])
+            state = nxt
+        self.out[state].append(idx)
+
+    def _build_links(self):
+        queue = deque(self.goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for ch, nxt in self.goto[state].items():
+                queue.append(nxt)
+                f = self.fail[state]
+                while f and ch not in self.goto[f]:
+                    f = self.fail[f]
+                link = self.goto[f].get(ch, 0)
+                # children of the root fail back to the root
+                self.fail[nxt] = link if link != nxt else 0
+                # inherit the matches of the longest proper suffix
+                self.out[nxt] = self.out[nxt] + self.out[self.fail[nxt]]
+
+    def _boundary_ok(self, text, start, end, pattern):
+        if not self.word_boundary:
+            return True
+        if _needs_boundary(pattern[0]) and start > 0 and _is_word_char(text[start - 1]):
+            return False
+        if _needs_boundary(pattern[-1]) and end < len(text) and _is_word_char(text[end]):
+            return False
+        return True
+
+    def iter_matches(self, text):
+        """Yield (start, end, term) for every occurrence, overlapping ones included"""
+        folded = self._fold(str(text))
+        state = 0
+        for i, ch in enumerate(folded):
+            while state and ch not in self.goto[state]:
+                state = self.fail[state]
+            state = self.goto[state].get(ch, 0)
+            for idx in self.out[state]:
+                pattern = self.patterns[idx]
+                start = i + 1 - len(pattern)
+                if self._boundary_ok(folded, start, i + 1, pattern):
+                    yield start, i + 1, self.terms[idx]
+
+    def find(self, text):
+        """Distinct terms found in `text`, in glossary order"""
+        found = {id(term): term for _, _, term in self.iter_matches(text)}
+        return [t for t in self.terms if id(t) in found]
+
+    def find_many(self, lines):
+        """Distinct terms found in any of `lines`, in glossary order"""
+        found = {}
+        for line in lines:
+            for _, _, term in self.iter_matches(line):
+                found[id(term)] = term
+        return [t for t in self.terms if id(t) in found]
+
+    def check_usage(self, src_line, tgt_line):
+        """Terms present in the source line whose agreed translation is missing from the output"""
+        target = self._fold(str(tgt_line))
+        return [t for t in self.find(src_line)
+                if str(t.get('tgt', '')).strip() and self._fold(str(t['tgt']).strip()) not in target]
+
+# -----------------------
+# one compiled matcher per terminology file version
+# -----------------------
+
+_MATCHERS = {}
+_MATCHERS_LOCK = threading.Lock()
+
+def get_term_matcher(path, word_boundary=True, case_fold=True):
+    """Matcher for the terms in `path` (terminology.json), rebuilt only when the file changes; None if missing"""
+    if not os.path.exists(path):
+        return None
+    st = os.stat(path)
+    key = (os.path.abspath(path), word_boundary, case_fold)
+    signature = (st.st_mtime_ns, st.st_size)
+    with _MATCHERS_LOCK:
+        cached = _MATCHERS.get(key)
+        if cached is not None and cached[0] == signature:
+            return cached[1]
+        with open(path, 'r', encoding='utf-8') as f:
+            terms = json.load(f).get('terms', [])
+        matcher = TermMatcher(terms, word_boundary=word_boundary, case_fold=case_fold)
+        _MATCHERS[key] = (signature, matcher)
+        return matcher
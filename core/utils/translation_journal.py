@@ -0,0 +1,69 @@
+import os
+import json
+import hashlib
+import threading
+
+# ==============================================================================
+# Append-only journal of finished translation chunks (resume after a crash)
+# ==============================================================================
+
+def terms_fingerprint(terms):
+    """Stable hash of the (src, tgt) pairs a chunk was translated with"""
+    pairs = sorted((str(t.get('src', '')), str(t.get('tgt', ''))) for t in terms)
+    return hashlib.sha256(json.dumps(pairs, ensure_ascii=False).encode('utf-8')).hexdigest()[:16]
+
+class TranslationJournal:
+    """One JSON line per finished chunk: positions, source lines, translations, terms fingerprint, setup.
+
+    Chunks are keyed by line positions rather than chunk index, since chunk boundaries
+    depend on runtime feedback (see ChunkPlanner) and differ between runs.
+    Each line is flushed and fsynced, so a crash loses at most the chunk being written.
+    `setup` (e.g. target language and model) is recorded in every entry; entries written
+    under a different setup are stale, so switching language or model never reuses them.
+    """
+    def __init__(self, path, setup=None):
+        self.path = path
+        self.setup = setup
+        self._lock = threading.Lock()
+
+    def load(self, sentences, fingerprint_fn=None):
+        """{position: translation} from chunks whose setup, source lines (and terms, if `fingerprint_fn`) are unchanged.
+
+        Returns (translations, stats) with the number of reused and stale chunks.
+        """
+        reused, stats = {}, {"chunks_reused": 0, "chunks_stale": 0}
+        if not os.path.exists(self.path):
+            return reused, stats
+        with open(self.path, 'r', encoding='utf-8') as f:
+            for raw in f:
+                try:
+                    entry = json.loads(raw)
+                except json.JSONDecodeError:
+                    # torn last line from a crash mid-write
+                    continue
+                positions, src, trans = entry["positions"], entry["src"], entry["trans"]
+                valid = (
+                    entry.get("setup") == self.setup
+                    and len(positions) == len(src) == len(trans)
+                    and all(0 <= p < len(sentences) and sentences[p] == s for p, s in zip(positions, src))
+                    and (fingerprint_fn is None or fingerprint_fn(src) == entry.get("terms"))
+                )
+                if valid:
+                    reused.update(zip(positions, trans))
+                    stats["chunks_reused"] += 1
+                else:
+                    # later entries for the same lines override, stale ones are just skipped
+                    for p in positions:
+                        reused.pop(p, None)
+                    stats["chunks_stale"] += 1
+        return reused, stats
+
+    def append(self, positions, src, trans, terms=None):
+        entry = {"positions": list(positions), "src": list(src), "trans": list(trans), "terms": terms, "setup": self.setup}
+        line = json.dumps(entry, ensure_ascii=False) + '\n'
+        with self._lock:
+            os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+            with open(self.path, 'a', encoding='utf-8') as f:
+                f.write(line)
+                f.flush()
+                os.fsync(f.fileno())
@@ -0,0 +1,169 @@
+import os
+import re
+import time
+import sqlite3
+import difflib
+import threading
+from core.utils.gpt_cache import _SQLiteStore
+
+# ==============================================================================
+# Cross-video translation memory (exact reuse + fuzzy hints)
+# ==============================================================================
+
+TM_DB_NAME = 'translation_memory.db'
+
+_TM_SCHEMA = """
+CREATE TABLE IF NOT EXISTS tm (
+    id INTEGER PRIMARY KEY,
+    src_lang TEXT,
+    tgt_lang TEXT,
+    norm TEXT,
+    source TEXT,
+    target TEXT,
+    hits INTEGER DEFAULT 0,
+    created REAL,
+    last_used REAL
+);
+CREATE UNIQUE INDEX IF NOT EXISTS tm_key ON tm (src_lang, tgt_lang, norm);
+"""
+
+# full-text index over the normalized source, used to pull fuzzy candidates
+_TM_FTS_SCHEMA = """
+CREATE VIRTUAL TABLE IF NOT EXISTS tm_fts USING fts5(norm, content='tm', content_rowid='id');
+CREATE TRIGGER IF NOT EXISTS tm_ai AFTER INSERT ON tm BEGIN
+    INSERT INTO tm_fts (rowid, norm) VALUES (new.id, new.norm);
+END;
+CREATE TRIGGER IF NOT EXISTS tm_ad AFTER DELETE ON tm BEGIN
+    INSERT INTO tm_fts (tm_fts, rowid, norm) VALUES ('delete', old.id, old.norm);
+END;
+"""
+
+_WORD_RE = re.compile(r"\w+", re.UNICODE)
+
+def normalize_line(line):
+    """Case-fold, collapse whitespace and drop surrounding punctuation"""
+    line = ' '.join(str(line).casefold().split())
+    return line.strip(' .,!?;:…。，！？；：、"\'“”‘’-')
+
+class TranslationMemory(_SQLiteStore):
+    """(source language, target language, normalized line) -> translation, shared by all videos"""
+    schema = _TM_SCHEMA
+    CANDIDATES = 20
+
+    def __init__(self, folder, min_chars=10, fuzzy_threshold=0.75):
+        super().__init__(os.path.join(folder, TM_DB_NAME))
+        self.min_chars = min_chars
+        self.fuzzy_threshold = fuzzy_threshold
+        self.fuzzy_enabled = True
+        self._stats_lock = threading.Lock()
+        self._stats = {"lookups": 0, "exact_hits": 0, "fuzzy_hits": 0, "writes": 0}
+
+    def _connect(self):
+        conn = super()._connect()
+        try:
+            conn.executescript(_TM_FTS_SCHEMA)
+        except sqlite3.OperationalError:
+            # sqlite built without FTS5: exact reuse only
+            self.fuzzy_enabled = False
+        return conn
+
+    def _count(self, name, n=1):
+        with self._stats_lock:
+            self._stats[name] += n
+
+    def reusable(self, line):
+        return len(normalize_line(line)) >= self.min_chars
+
+    def lookup(self, src_lang, tgt_lang, lines):
+        """{index: translation} for lines with an exact (normalized) match"""
+        conn = self._conn()
+        found, now = {}, time.time()
+        for i, line in enumerate(lines):
+            if not self.reusable(line):
+                continue
+            row = conn.execute(
+                "SELECT id, target FROM tm WHERE src_lang = ? AND tgt_lang = ? AND norm = ?",
+                (src_lang, tgt_lang, normalize_line(line))
+            ).fetchone()
+            if row is not None:
+                found[i] = row
+        with self._write_lock:
+            conn.executemany("UPDATE tm SET hits = hits + 1, last_used = ? WHERE id = ?",
+                             [(now, row_id) for row_id, _ in found.values()])
+        self._count("lookups", len(lines))
+        self._count("exact_hits", len(found))
+        return {i: target for i, (_, target) in found.items()}
+
+    def similar(self, src_lang, tgt_lang, line):
+        """Best stored (source, target) whose normalized text is at least `fuzzy_threshold` similar, or None"""
+        if not self.fuzzy_enabled or not self.reusable(line):
+            return None
+        norm = normalize_line(line)
+        words = set(_WORD_RE.findall(norm))
+        if not words:
+            return None
+        query = ' OR '.join(f'"{w}"' for w in words)
+        try:
+            rows = self._conn().execute(
+                "SELECT tm.norm, tm.source, tm.target FROM tm_fts JOIN tm ON tm.id = tm_fts.rowid "
+                "WHERE tm_fts MATCH ? AND tm.src_lang = ? AND tm.tgt_lang = ? ORDER BY bm25(tm_fts) LIMIT ?",
+                (query, src_lang, tgt_lang, self.CANDIDATES)
+            ).fetchall()
+        except sqlite3.OperationalError:
+            return None
+        best, best_score = None, self.fuzzy_threshold
+        for cand_norm, source, target in rows:
+            score = difflib.SequenceMatcher(None, norm, cand_norm).ratio()
+            if score >= best_score and cand_norm != norm:
+                best, best_score = (source, target), score
+        if best is not None:
+            self._count("fuzzy_hits")
+        return best
+
+    def put_many(self, src_lang, tgt_lang, pairs):
+        """Store validated (source, translation) pairs, newer translations replace older ones"""
+        now = time.time()
+        rows = [(src_lang, tgt_lang, normalize_line(src), src, tgt, now, now)
+                for src, tgt in pairs if self.reusable(src) and tgt and tgt != src]
+        if not rows:
+            return 0
+        conn = self._conn()
+        with self._write_lock:
+            conn.execute("BEGIN")
+            try:
+                # delete + insert keeps the FTS index in sync through the triggers
+                conn.executemany("DELETE FROM tm WHERE src_lang = ? AND tgt_lang = ? AND norm = ?",
+                                 [r[:3] for r in rows])
+                conn.executemany(
+                    "INSERT INTO tm (src_lang, tgt_lang, norm, source, target, created, last_used) "
+                    "VALUES (?, ?, ?, ?, ?, ?, ?)", rows)
+                conn.execute("COMMIT")
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+        self._count("writes", len(rows))
+        return len(rows)
+
+    def stats(self):
+        with self._stats_lock:
+            stats = dict(self._stats)
+        stats["entries"] = self._conn().execute("SELECT COUNT(*) FROM tm").fetchone()[0]
+        return stats
+
+_MEMORIES = {}
+_MEMORIES_LOCK = threading.Lock()
+
+def get_translation_memory():
+    """The shared translation memory, or None when `translation_memory.dir` is empty"""
+    from core.utils.config_utils import load_key
+    folder = load_key("translation_memory.dir", default='')
+    if not folder:
+        return None
+    folder = os.path.abspath(os.path.expanduser(folder))
+    with _MEMORIES_LOCK:
+        memory = _MEMORIES.get(folder)
+        if memory is None:
+            memory = _MEMORIES[folder] = TranslationMemory(folder)
+        memory.min_chars = int(load_key("translation_memory.min_chars", default=10))
+        memory.fuzzy_threshold = float(load_key("translation_memory.fuzzy_threshold", default=0.75))
+        return memory
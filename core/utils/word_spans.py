@@ -0,0 +1,145 @@
+import os
+import re
+import json
+from array import array
+from bisect import bisect_left, bisect_right
+from itertools import accumulate
+
+# ==============================================================================
+# Word-span provenance: which ASR words (rows of cleaned_chunks.xlsx) each line came from
+# ==============================================================================
+# Lines are compared in a "cleaned" form (lower case, no punctuation, no spaces). In that form
+# every line of every splitting stage is a piece of the concatenated transcript, so a line's
+# provenance is a word span [first, last] and its timing is a direct lookup.
+
+def remove_punctuation(text):
+    # 强化清洗逻辑，统一处理为字符串，移除标点
+    text = re.sub(r'\s+', ' ', str(text))
+    text = re.sub(r'[^\w\s]', '', text)
+    return text.strip()
+
+def clean_text(text):
+    return remove_punctuation(str(text).lower()).replace(" ", "")
+
+class WordIndex:
+    """All cleaned words concatenated into one string, plus a prefix-offset array for char -> word lookups.
+
+    Built once per transcript and shared by every alignment against it.
+    """
+    def __init__(self, df_words):
+        words = [remove_punctuation(str(word).lower()) for word in df_words['text']]
+        self.text = ''.join(words)
+        # ends[i] = offset just past word i in `text`
+        self.ends = array('q', accumulate(len(w) for w in words))
+        self.starts = df_words['start'].astype(float).tolist()
+        self.end_times = df_words['end'].astype(float).tolist()
+
+    def word_at(self, pos):
+        """Index of the word covering char `pos`, None outside the text"""
+        if not 0 <= pos < len(self.text):
+            return None
+        return bisect_right(self.ends, pos)
+
+    def char_start(self, word):
+        return self.ends[word - 1] if word > 0 else 0
+
+    def word_span(self, start, end):
+        """[first, last] words covering text[start:end], None if empty"""
+        if end <= start:
+            return None
+        first, last = self.word_at(start), self.word_at(end - 1)
+        if first is None or last is None:
+            return None
+        return [first, last]
+
+    def snap(self, pos, lo, hi):
+        """Nearest word boundary to char `pos` within [lo, hi]"""
+        w = bisect_left(self.ends, pos)
+        candidates = [self.ends[i] for i in (w - 1, w) if 0 <= i < len(self.ends)] + [lo, hi]
+        candidates = [c for c in candidates if lo <= c <= hi]
+        return min(candidates, key=lambda c: abs(c - pos))
+
+def load_word_index(path=None):
+    import pandas as pd
+    from core.utils.models import _2_CLEANED_CHUNKS
+    df_words = pd.read_excel(path or _2_CLEANED_CHUNKS)
+    df_words['text'] = df_words['text'].str.strip('"').str.strip()
+    return WordIndex(df_words)
+
+# -----------------------
+# span bookkeeping for splitting stages
+# -----------------------
+
+RESYNC_WINDOW = 200
+
+def track_spans(lines, index):
+    """Spans for lines that partition the transcript in order without changing its text (spaCy splits).
+
+    Each line consumes the cleaned transcript where the previous one stopped; a line that does not
+    continue it exactly is searched a little further ahead, or left without a span.
+    """
+    spans, pos = [], 0
+    text = index.text
+    for line in lines:
+        cleaned = clean_text(line)
+        if not cleaned:
+            spans.append(None)
+            continue
+        hit = pos if text.startswith(cleaned, pos) else text.find(cleaned, pos, pos + len(cleaned) + RESYNC_WINDOW)
+        if hit == -1:
+            spans.append(None)
+            continue
+        spans.append(index.word_span(hit, hit + len(cleaned)))
+        pos = hit + len(cleaned)
+    return spans
+
+def split_span(index, span, parts):
+    """Spans of `parts`, the pieces a line with word span `span` was split into (LLM splits included).
+
+    Boundaries are placed by the parts' cleaned lengths inside the parent span, moved to where the next
+    part's first characters actually are when found nearby (the LLM may change a few characters), and
+    snapped to word boundaries.
+    """
+    if span is None or len(parts) < 2:
+        return [span if len(parts) == 1 else None for _ in parts]
+    c0, c1 = index.char_start(span[0]), index.ends[span[1]]
+    cleaned = [clean_text(p) for p in parts]
+    total = sum(len(c) for c in cleaned) or 1
+    bounds, consumed = [c0], 0
+    for k in range(len(parts) - 1):
+        consumed += len(cleaned[k])
+        guess = c0 + round(consumed * (c1 - c0) / total)
+        head = cleaned[k + 1][:8]
+        if head:
+            hit = index.text.find(head, max(bounds[-1], guess - 2 * len(head)), min(c1, guess + 3 * len(head)))
+            if hit != -1:
+                guess = hit
+        bounds.append(index.snap(min(max(guess, bounds[-1]), c1), bounds[-1], c1))
+    bounds.append(c1)
+    return [index.word_span(a, b) if cleaned[k] else None for k, (a, b) in enumerate(zip(bounds, bounds[1:]))]
+
+def regroup_spans(index, groups, spans):
+    """Spans after each line i was replaced by the lines in groups[i]"""
+    new_spans = []
+    for group, span in zip(groups, spans):
+        new_spans.extend(split_span(index, span, group))
+    return new_spans
+
+# -----------------------
+# sidecar files next to each stage's text output
+# -----------------------
+
+def save_spans(path, lines, spans):
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump({"lines": [str(line) for line in lines], "spans": spans}, f, ensure_ascii=False)
+
+def load_spans(path, lines):
+    """Spans aligned with `lines`; rows whose text no longer matches the saved one (or no file) get None"""
+    if not os.path.exists(path):
+        return [None] * len(lines)
+    with open(path, 'r', encoding='utf-8') as f:
+        saved = json.load(f)
+    if len(saved["lines"]) != len(lines):
+        return [None] * len(lines)
+    return [span if old == str(line) else None for old, line, span in zip(saved["lines"], lines, saved["spans"])]
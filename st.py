@@ -62,6 +62,7 @@ else:
 import streamlit as st
 from core.st_utils.imports_and_utils import *
 from core import *
+from core.utils.llm_stats import LLM_STATS
 
 # SET PATH
 current_dir = os.path.dirname(os.path.abspath(__file__))
@@ -96,6 +97,7 @@ def text_processing_section():
             if load_key("burn_subtitles"):
                 st.video(SUB_VIDEO)
             download_subtitle_zip_button(text=t("Download All Srt Files"))
+            llm_usage_expander(text=t("LLM usage (tokens, latency, cost)"))
             
             if st.button(t("Archive to 'history'"), key="cleanup_in_text_processing"):
                 cleanup()
@@ -103,6 +105,7 @@ def text_processing_section():
             return True
 
 def process_text():
+    LLM_STATS.reset()
     with st.spinner(t("Using Whisper for transcription...")):
         _2_asr.transcribe()
     with st.spinner(t("Splitting long sentences...")):  